@@ -0,0 +1,32 @@
+"""
+Checks for code that invalidates cached data from outside the web processes.
+
+Catalog, price table and per-user versions live in the default cache. A
+management command or job worker that bumps one only reaches the web workers
+when that cache is shared between processes; with a process-local backend
+the workers keep serving what they cached, with no expiry, until restarted.
+"""
+from django.conf import settings
+
+PROCESS_LOCAL_BACKENDS = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+def cache_is_process_local(alias='default'):
+    """Whether writes to the cache ``alias`` stay inside the current process"""
+    return settings.CACHES[alias]['BACKEND'] in PROCESS_LOCAL_BACKENDS
+
+
+def process_local_cache_warning(effect):
+    """
+    Return a warning that ``effect`` (e.g. "the new prices") won't reach the
+    web processes, or None when the default cache is shared.
+    """
+    if not cache_is_process_local():
+        return None
+    return (
+        f"CACHES['default'] is local to this process, so running web workers won't see "
+        f"{effect} until they are restarted. Point CACHES at a shared backend such as Redis."
+    )
@@ -0,0 +1,164 @@
+"""
+Read-replica routing with read-your-writes stickiness.
+
+``ReplicaRoutingMiddleware`` decides per request whether reads may go to one
+of the aliases in ``DATABASE_REPLICAS``: only safe (GET/HEAD/OPTIONS)
+requests may, and only when the user has not written anything in the last
+``REPLICA_STICKY_SECONDS``; register and login carry no token yet, so they
+mark their user sticky themselves. A request that may is given one replica
+for all of its reads, so they see one consistent snapshot. Any other request,
+and all code running outside a request (management commands, timers, jobs),
+reads from the primary. ``ReplicaRouter`` applies that decision and sends
+every write to the primary.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.tokens import AccessToken
+
+STICKY_KEY = 'db:sticky:{user_id}'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# The replica the current request reads from, None for the primary
+_replica = ContextVar('replica', default=None)
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside this block, e.g. to build a shared cache entry"""
+    token = _replica.set(None)
+    try:
+        yield
+    finally:
+        _replica.reset(token)
+
+
+def _replica_reads(chunks, replica):
+    """Keep reading from ``replica`` while a streaming response is consumed after the view returns"""
+    chunks = iter(chunks)
+    while True:
+        token = _replica.set(replica)
+        try:
+            chunk = next(chunks)
+        except StopIteration:
+            return
+        finally:
+            _replica.reset(token)
+        yield chunk
+
+
+def _choose_replica(request_method, sticky):
+    """The replica a request reads from, or None if it must read from the primary"""
+    if request_method not in SAFE_METHODS or sticky:
+        return None
+    return random.choice(settings.DATABASE_REPLICAS)
+
+
+class ReplicaRouter:
+    """Send reads to a replica when the current request allows it, everything else to the primary"""
+
+    def db_for_read(self, model, **hints):
+        replica = _replica.get()
+        if replica is None:
+            return DEFAULT_DB_ALIAS
+        # Reads inside a transaction on the primary must see its writes
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        # Related objects come from the database their instance was read from
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        return replica
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db not in settings.DATABASE_REPLICAS
+
+
+def mark_sticky(user_id):
+    """Keep ``user_id``'s reads on the primary for REPLICA_STICKY_SECONDS, e.g. after a write"""
+    if settings.DATABASE_REPLICAS:
+        cache.set(STICKY_KEY.format(user_id=user_id), True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+async def amark_sticky(user_id):
+    """Async ``mark_sticky``"""
+    if settings.DATABASE_REPLICAS:
+        await cache.aset(STICKY_KEY.format(user_id=user_id), True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+def _request_user_id(request):
+    """The user id claimed by the request's access token, without touching the database"""
+    parts = request.META.get('HTTP_AUTHORIZATION', '').split()
+    if len(parts) != 2 or parts[0] not in settings.SIMPLE_JWT['AUTH_HEADER_TYPES']:
+        return None
+    try:
+        return AccessToken(parts[1]).get(settings.SIMPLE_JWT['USER_ID_CLAIM'])
+    except TokenError:
+        return None
+
+
+class ReplicaRoutingMiddleware:
+    """Allow replica reads for safe requests of users outside their read-your-writes window"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.DATABASE_REPLICAS:
+            return self.get_response(request)
+
+        user_id = _request_user_id(request)
+        replica = _choose_replica(
+            request.method, user_id is not None and cache.get(STICKY_KEY.format(user_id=user_id))
+        )
+        token = _replica.set(replica)
+        try:
+            response = self.get_response(request)
+        finally:
+            _replica.reset(token)
+
+        if request.method not in SAFE_METHODS and user_id is not None:
+            mark_sticky(user_id)
+        elif replica and response.streaming and not response.is_async:
+            response.streaming_content = _replica_reads(response.streaming_content, replica)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.DATABASE_REPLICAS:
+            return await self.get_response(request)
+
+        user_id = _request_user_id(request)
+        replica = _choose_replica(
+            request.method, user_id is not None and await cache.aget(STICKY_KEY.format(user_id=user_id))
+        )
+        token = _replica.set(replica)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _replica.reset(token)
+
+        if request.method not in SAFE_METHODS and user_id is not None:
+            await amark_sticky(user_id)
+        elif replica and response.streaming and not response.is_async:
+            response.streaming_content = _replica_reads(response.streaming_content, replica)
+        return response
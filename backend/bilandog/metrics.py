@@ -0,0 +1,229 @@
+"""
+Per-request SQL and latency instrumentation.
+
+``RequestMetricsMiddleware`` counts the queries and database time spent by every
+request, adds a ``Server-Timing`` header and folds the numbers into in-process
+histograms keyed by the resolved URL name. ``metrics_view`` exposes them in the
+Prometheus text format.
+
+Queries are attributed through a context variable rather than per-connection
+wrappers, so async requests whose ORM calls run in ``sync_to_async`` threads
+are counted too.
+"""
+import logging
+import threading
+import time
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.http import Http404, HttpResponse
+
+logger = logging.getLogger('bilandog.metrics')
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+
+class Histogram:
+    """Cumulative Prometheus-style histogram with fixed buckets"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    """Thread-safe store of the histograms and counters for every view"""
+
+    HISTOGRAMS = {
+        'request_duration_seconds': ('Total time spent handling the request', DURATION_BUCKETS),
+        'request_db_seconds': ('Time spent waiting on the database', DURATION_BUCKETS),
+        'request_queries': ('Number of SQL queries issued', QUERY_BUCKETS),
+        'response_bytes': ('Size of the response body', SIZE_BUCKETS),
+        'password_hash_queue_seconds': ('Time password hashing waited for a pool worker', DURATION_BUCKETS),
+        'password_hash_seconds': ('Time spent hashing or checking a password', DURATION_BUCKETS),
+        'job_queue_seconds': ('Time a background job waited for a pool worker', DURATION_BUCKETS),
+        'job_seconds': ('Time spent running a background job', DURATION_BUCKETS),
+    }
+
+    def __init__(self, prefix='bilandog'):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._requests = {}
+
+    def observe(self, metric, labels, value):
+        key = (metric, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.HISTOGRAMS[metric][1])
+            histogram.observe(value)
+
+    def count_request(self, labels):
+        with self._lock:
+            self._requests[labels] = self._requests.get(labels, 0) + 1
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._requests.clear()
+
+    def render(self):
+        """Render every metric in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            name = f'{self.prefix}_requests_total'
+            lines.append(f'# HELP {name} Requests handled, by view, method and status')
+            lines.append(f'# TYPE {name} counter')
+            for labels, value in sorted(self._requests.items()):
+                lines.append(f'{name}{{{_format_labels(labels)}}} {value}')
+
+            for metric, (help_text, _) in self.HISTOGRAMS.items():
+                name = f'{self.prefix}_{metric}'
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} histogram')
+                for (key, labels), histogram in sorted(self._histograms.items()):
+                    if key != metric:
+                        continue
+                    label_text = _format_labels(labels)
+                    for bound, count in zip(histogram.buckets, histogram.counts):
+                        lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {count}')
+                    lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {histogram.count}')
+                    lines.append(f'{name}_sum{{{label_text}}} {histogram.sum}')
+                    lines.append(f'{name}_count{{{label_text}}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+def _format_labels(labels):
+    return ','.join('%s="%s"' % (key, str(value).replace('"', '\\"')) for key, value in labels)
+
+
+registry = MetricsRegistry()
+
+
+class QueryTracker:
+    """Database execute wrapper that counts queries and the time spent in them"""
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.queries += 1
+
+
+_current_tracker = ContextVar('query_tracker', default=None)
+
+
+def _track_queries(execute, sql, params, many, context):
+    tracker = _current_tracker.get()
+    if tracker is None:
+        return execute(sql, params, many, context)
+    return tracker(execute, sql, params, many, context)
+
+
+def install_query_tracking(connection, **kwargs):
+    """Permanently wrap ``connection`` so queries count against the current request"""
+    if _track_queries not in connection.execute_wrappers:
+        # First in the list, so temporary execute_wrapper() blocks still pop their own wrapper
+        connection.execute_wrappers.insert(0, _track_queries)
+
+
+connection_created.connect(install_query_tracking)
+
+
+class RequestMetricsMiddleware:
+    """Record query count, DB time, total time and response size per URL name"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        # Connections opened before this module was imported have no wrapper yet
+        for alias in connections:
+            install_query_tracking(connections[alias])
+
+        tracker = QueryTracker()
+        token = _current_tracker.set(tracker)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current_tracker.reset(token)
+        duration = time.perf_counter() - start
+
+        self.record(request, response, tracker, duration)
+        return response
+
+    async def __acall__(self, request):
+        tracker = QueryTracker()
+        token = _current_tracker.set(tracker)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_tracker.reset(token)
+        duration = time.perf_counter() - start
+
+        self.record(request, response, tracker, duration)
+        return response
+
+    def record(self, request, response, tracker, duration):
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match else 'unresolved'
+        labels = (('view', view),)
+
+        registry.count_request(labels + (('method', request.method), ('status', response.status_code)))
+        registry.observe('request_duration_seconds', labels, duration)
+        registry.observe('request_db_seconds', labels, tracker.duration)
+        registry.observe('request_queries', labels, tracker.queries)
+        if not response.streaming:
+            registry.observe('response_bytes', labels, len(response.content))
+
+        response['Server-Timing'] = (
+            f'db;dur={tracker.duration * 1000:.1f};desc="{tracker.queries} queries", '
+            f'total;dur={duration * 1000:.1f}'
+        )
+
+        threshold = getattr(settings, 'SLOW_REQUEST_THRESHOLD_MS', None)
+        if threshold is not None and duration * 1000 >= threshold:
+            logger.warning(
+                "Slow request: %s %s (%s) took %.1fms, %d queries, %.1fms in the database",
+                request.method, request.path, view, duration * 1000,
+                tracker.queries, tracker.duration * 1000
+            )
+
+
+def metrics_view(request):
+    """Expose the collected metrics to a Prometheus scraper"""
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', None)
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        raise Http404
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,81 @@
+"""
+Fast JSON rendering and parsing for DRF.
+
+``FastJSONRenderer`` and ``FastJSONParser`` use orjson when it is installed and
+fall back to DRF's stdlib-based classes otherwise, so the project runs either
+way. Views pass ``Decimal`` money values straight through: with orjson they are
+written as JSON numbers from their exact decimal text (``orjson.Fragment``).
+Without it they go through ``float``, which is still exact for our
+``DecimalField(max_digits=10)`` columns because any decimal of at most 15
+significant digits survives the float round trip.
+"""
+from decimal import Decimal
+from django.http import HttpResponse
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional speed-up
+    orjson = None
+
+HAS_ORJSON = orjson is not None
+EXACT_DECIMALS = HAS_ORJSON and hasattr(orjson, 'Fragment')
+
+_fallback_encoder = JSONEncoder()
+
+
+def _default(obj):
+    """Serialize the types orjson doesn't know natively"""
+    if isinstance(obj, Decimal):
+        if EXACT_DECIMALS and obj.is_finite():
+            return orjson.Fragment(format(obj, 'f'))
+        return float(obj)
+    return _fallback_encoder.default(obj)
+
+
+def dumps(data):
+    """Serialize ``data`` to compact JSON bytes with the fastest available encoder"""
+    if HAS_ORJSON:
+        ret = orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_UTC_Z)
+    else:
+        ret = JSONRenderer().render(data)
+    # Keep the output a strict JavaScript subset, like DRF does
+    if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+        ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return ret
+
+
+def json_response(data, status=200):
+    """JSON response for plain Django views (the async ones), encoded like the DRF views"""
+    return HttpResponse(dumps(data), content_type='application/json', status=status)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """orjson-backed drop-in for DRF's JSONRenderer"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        # Pretty printing (browsable API, ``; indent=N``) keeps the stdlib path
+        indent = self.get_indent(accepted_media_type, renderer_context or {})
+        if not HAS_ORJSON or indent is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data)
+
+
+class FastJSONParser(JSONParser):
+    """orjson-backed drop-in for DRF's JSONParser"""
+
+    renderer_class = FastJSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if not HAS_ORJSON:
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -48,6 +50,7 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'idempotency-key',
 ]
 
 CORS_ALLOW_METHODS = [
@@ -73,12 +76,23 @@ INSTALLED_APPS = [
     'rest_framework_simplejwt',
     'users',
     'orders',
+    'jobs',
     'corsheaders'
 ]
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'users.authentication.CachedJWTAuthentication',
+    ),
+    # orjson-backed when installed, DRF's stdlib JSON otherwise
+    'DEFAULT_RENDERER_CLASSES': (
+        'bilandog.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'bilandog.renderers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
     ),
 }
 
@@ -87,7 +101,9 @@ from datetime import timedelta
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(minutes=60),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
-    'ROTATE_REFRESH_TOKENS': False,
+    # Every refresh returns a new refresh token and revokes the old one (users.revocation)
+    'ROTATE_REFRESH_TOKENS': True,
+    'TOKEN_REFRESH_SERIALIZER': 'users.serializers.RevocableTokenRefreshSerializer',
     'ALGORITHM': 'HS256',
     'SIGNING_KEY': SECRET_KEY,
     'VERIFYING_KEY': None,
@@ -96,7 +112,87 @@ SIMPLE_JWT = {
     'USER_ID_CLAIM': 'user_id',
 }
 
+# Authenticated users are cached per process so requests skip the user query;
+# profile changes evict the entry locally and reach other workers within the timeout
+AUTH_USER_CACHE_TIMEOUT = 60
+AUTH_USER_CACHE_SIZE = 10000
+
+# Caching
+# The local-memory cache is per process; point these at a shared backend (e.g. Redis)
+# when running several workers so catalog invalidations and token revocations reach all of them.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bilandog',
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+    # Revoked tokens (users.revocation). An evicted entry would let its token in again,
+    # so this cache must never cull: no entry limit here, and a store that doesn't
+    # evict (e.g. Redis with maxmemory-policy noeviction) in production. Entries
+    # expire with their tokens, which keeps it small
+    'revocations': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'bilandog-revocations',
+        'OPTIONS': {'MAX_ENTRIES': sys.maxsize},
+    },
+}
+
+# Rendered catalog payloads are keyed on the catalog version, this only bounds stale entries
+CATALOG_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Lifetime of the per-user cart and history versions behind their ETags
+# (orders.versions); an expired version only costs the next poll a full response
+USER_VERSION_TIMEOUT = 60 * 60 * 24 * 7
+
+# Pages of the catalog search endpoint
+CATALOG_PAGE_SIZE = 24
+CATALOG_MAX_PAGE_SIZE = 100
+
+# Cart storage: 'db' keeps carts in Order/OrderItem, 'cache' keeps them in the cache
+# above and writes them back in batches every CART_WRITE_BEHIND_INTERVAL seconds
+# (and always before checkout). The cache backend needs a shared cache when more
+# than one worker process serves requests.
+CART_BACKEND = 'db'
+CART_CACHE_TIMEOUT = 60 * 60 * 24 * 3  # Abandoned cached carts expire after three days
+CART_WRITE_BEHIND_INTERVAL = 30
+CART_WRITE_BEHIND_BATCH_SIZE = 500
+CART_LOCK_TIMEOUT = 5
+
+# Open carts untouched this long are deleted by the reaper (orders.reaper), in batches
+# of CART_REAPER_BATCH_SIZE with CART_REAPER_PAUSE seconds between them; each
+# scheduled run stops after CART_REAPER_MAX_BATCHES
+CART_ABANDONED_AFTER_DAYS = 30
+CART_REAPER_BATCH_SIZE = 500
+CART_REAPER_PAUSE = 0.1
+CART_REAPER_MAX_BATCHES = 100
+
+# Checkout results are replayed for retries carrying the same Idempotency-Key
+CHECKOUT_IDEMPOTENCY_TIMEOUT = 60 * 60 * 24
+CHECKOUT_IDEMPOTENCY_LOCK_TIMEOUT = 30
+
+# Order history pagination
+ORDER_HISTORY_PAGE_SIZE = 20
+ORDER_HISTORY_MAX_PAGE_SIZE = 100
+
+# Rows fetched per round trip when streaming an order history export
+ORDER_EXPORT_CHUNK_SIZE = 2000
+
+# Completed orders older than this move to the archive tables (orders.archive), in
+# batches of ORDER_ARCHIVE_BATCH_SIZE with ORDER_ARCHIVE_PAUSE seconds between them;
+# each scheduled run stops after ORDER_ARCHIVE_MAX_BATCHES. Only ever lower the age:
+# history reads assume nothing younger than it is archived
+ORDER_ARCHIVE_AFTER_DAYS = 365
+ORDER_ARCHIVE_BATCH_SIZE = 500
+ORDER_ARCHIVE_PAUSE = 0.5
+ORDER_ARCHIVE_MAX_BATCHES = 100
+
+# Products listed by the sales report (?top=)
+SALES_REPORT_TOP = 10
+SALES_REPORT_MAX_TOP = 100
+
 MIDDLEWARE = [
+    'bilandog.metrics.RequestMetricsMiddleware',
+    'bilandog.db_routing.ReplicaRoutingMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -107,6 +203,38 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Password hashing runs on a bounded pool (users.hashing): this many hashes at once,
+# and this many more queued before sign-ins are turned away with a 503
+PASSWORD_HASHING_WORKERS = min(4, os.cpu_count() or 1)
+PASSWORD_HASHING_MAX_PENDING = 64
+
+# Background jobs (jobs.runner) are always stored in the database first. 'thread' then
+# runs them on an in-process pool of JOBS_WORKERS threads, leaving overflow, retries and
+# jobs of crashed processes to `manage.py run_jobs`; 'db' leaves every job to run_jobs
+JOBS_BACKEND = 'thread'
+JOBS_WORKERS = 4
+JOBS_MAX_PENDING = 1000
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_DELAY = 10  # Seconds before the first retry, doubling after each failed attempt
+JOBS_LEASE_SECONDS = 300  # A claimed job whose worker vanished is retried after this long
+JOBS_POLL_INTERVAL = 1
+# Jobs the run_jobs workers queue every so many seconds (one of them per interval)
+JOBS_SCHEDULE = {
+    'orders.reap_abandoned_carts': 60 * 60,
+    'orders.archive_orders': 60 * 60,
+}
+
+# Order receipts are mailed by a background job; point this at SMTP in production
+EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
+DEFAULT_FROM_EMAIL = 'orders@bilandog.example'
+
+# Request metrics
+# Requests slower than this are logged by bilandog.metrics (None disables the log)
+SLOW_REQUEST_THRESHOLD_MS = 500
+
+# Clients allowed to scrape /metrics/ (None allows everyone)
+METRICS_ALLOWED_IPS = ['127.0.0.1']
+
 ROOT_URLCONF = 'bilandog.urls'
 
 TEMPLATES = [
@@ -142,6 +270,31 @@ DATABASES = {
     }
 }
 
+# Set BILANDOG_SQLITE=1 to use a local SQLite file instead, e.g. for benchmarks
+# on machines without PostgreSQL
+if os.environ.get('BILANDOG_SQLITE'):
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+    # BILANDOG_SQLITE_REPLICA=1 adds a second file as a read replica to try the
+    # routing locally; "replicate" by copying db.sqlite3 over db.replica.sqlite3
+    if os.environ.get('BILANDOG_SQLITE_REPLICA'):
+        DATABASES['replica'] = {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.replica.sqlite3',
+            'TEST': {'MIRROR': 'default'},
+        }
+
+# Read replicas: aliases in DATABASES that safe requests may read from. A user's
+# reads stay on the primary for REPLICA_STICKY_SECONDS after each of their writes
+# (see bilandog.db_routing), which must exceed the replication lag.
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+REPLICA_STICKY_SECONDS = 10
+DATABASE_ROUTERS = ['bilandog.db_routing.ReplicaRouter']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -179,6 +332,16 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Responsive product images (orders/images.py): originals are read from the
+# frontend's public/images and resized WebP variants written to PRODUCT_IMAGE_ROOT.
+# Variant names carry a content hash, so PRODUCT_IMAGE_URL can point at a CDN
+# in front of PRODUCT_IMAGE_ROOT and everything under it is cached forever.
+PRODUCT_IMAGE_SOURCE_DIR = BASE_DIR.parent / 'public' / 'images'
+PRODUCT_IMAGE_ROOT = BASE_DIR / 'media' / 'products'
+PRODUCT_IMAGE_URL = 'http://localhost:8000/orders/images/'
+PRODUCT_IMAGE_WIDTHS = [320, 640, 960, 1280]
+PRODUCT_IMAGE_QUALITY = 80
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
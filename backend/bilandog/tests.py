@@ -0,0 +1,112 @@
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.http import HttpResponse, StreamingHttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from rest_framework_simplejwt.tokens import AccessToken
+from orders.models import Product
+from .db_routing import STICKY_KEY, ReplicaRouter, ReplicaRoutingMiddleware, primary
+
+REPLICAS = ['replica-1', 'replica-2', 'replica-3']
+
+
+# Not a TestCase: the router keeps every read inside a transaction on the primary
+@override_settings(DATABASE_REPLICAS=REPLICAS)
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def reads(self, request, count=5):
+        """The databases ``count`` reads of a view serving ``request`` are routed to"""
+        seen = []
+
+        def view(request):
+            seen.extend(self.router.db_for_read(Product) for _ in range(count))
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(request)
+        return seen
+
+    def auth(self, user_id):
+        token = AccessToken()
+        token['user_id'] = user_id
+        return {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def test_a_request_reads_from_one_replica(self):
+        for _ in range(10):
+            reads = self.reads(self.factory.get('/orders/cart/'))
+            self.assertEqual(len(set(reads)), 1)
+            self.assertIn(reads[0], REPLICAS)
+
+    def test_the_replica_is_chosen_once_per_request(self):
+        with mock.patch('bilandog.db_routing.random.choice', return_value='replica-2') as choice:
+            self.assertEqual(self.reads(self.factory.get('/orders/cart/')), ['replica-2'] * 5)
+        choice.assert_called_once_with(REPLICAS)
+
+    def test_writes_and_sticky_users_read_from_the_primary(self):
+        self.assertEqual(set(self.reads(self.factory.post('/orders/cart/items/'))), {DEFAULT_DB_ALIAS})
+        self.assertEqual(self.router.db_for_write(Product), DEFAULT_DB_ALIAS)
+
+        caches['default'].set(STICKY_KEY.format(user_id=7), True)
+        self.assertEqual(set(self.reads(self.factory.get('/orders/cart/', **self.auth(7)))), {DEFAULT_DB_ALIAS})
+        self.assertIn(self.reads(self.factory.get('/orders/cart/', **self.auth(8)))[0], REPLICAS)
+
+    def test_a_write_makes_its_user_sticky(self):
+        self.reads(self.factory.post('/orders/cart/items/', **self.auth(7)))
+        self.assertTrue(caches['default'].get(STICKY_KEY.format(user_id=7)))
+
+    def test_reads_outside_a_request_or_inside_primary_use_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Product), DEFAULT_DB_ALIAS)
+
+        def view(request):
+            with primary():
+                self.assertEqual(self.router.db_for_read(Product), DEFAULT_DB_ALIAS)
+            self.assertIn(self.router.db_for_read(Product), REPLICAS)
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(self.factory.get('/orders/cart/'))
+
+    def test_reads_inside_a_transaction_use_the_primary(self):
+        def view(request):
+            with mock.patch.object(connections[DEFAULT_DB_ALIAS], 'in_atomic_block', True):
+                self.assertEqual(self.router.db_for_read(Product), DEFAULT_DB_ALIAS)
+            return HttpResponse()
+
+        ReplicaRoutingMiddleware(view)(self.factory.get('/orders/cart/'))
+
+    def test_related_reads_follow_their_instance(self):
+        product = Product(name="Loaded elsewhere")
+        product._state.db = 'replica-3'
+
+        def view(request):
+            self.assertEqual(self.router.db_for_read(Product, instance=product), 'replica-3')
+            return HttpResponse()
+
+        with mock.patch('bilandog.db_routing.random.choice', return_value='replica-1'):
+            ReplicaRoutingMiddleware(view)(self.factory.get('/orders/cart/'))
+
+    def test_streamed_content_reads_from_the_requests_replica(self):
+        def rows():
+            for _ in range(3):
+                yield self.router.db_for_read(Product)
+
+        def view(request):
+            return StreamingHttpResponse(rows())
+
+        with mock.patch('bilandog.db_routing.random.choice', return_value='replica-2'):
+            response = ReplicaRoutingMiddleware(view)(self.factory.get('/orders/export/'))
+        self.assertEqual(b''.join(response.streaming_content), b'replica-2' * 3)
+
+    def test_async_requests_read_from_one_replica(self):
+        seen = []
+
+        async def view(request):
+            seen.extend(self.router.db_for_read(Product) for _ in range(5))
+            return HttpResponse()
+
+        async_to_sync(ReplicaRoutingMiddleware(view))(self.factory.get('/orders/history/'))
+        self.assertEqual(len(set(seen)), 1)
+        self.assertIn(seen[0], REPLICAS)
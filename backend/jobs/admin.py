@@ -0,0 +1,14 @@
+from django.contrib import admin
+from .models import Job, ScheduledJob
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'status', 'attempts', 'run_at', 'created_at']
+    list_filter = ['status', 'name']
+    readonly_fields = ['created_at']
+
+
+@admin.register(ScheduledJob)
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'next_run_at']
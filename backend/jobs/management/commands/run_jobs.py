@@ -0,0 +1,45 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from bilandog.caching import process_local_cache_warning
+from jobs.runner import claim_due_jobs, enqueue_scheduled, run_job
+
+
+class Command(BaseCommand):
+    help = (
+        "Run the background jobs queued in the database: overflow from the in-process "
+        "pool, retries of failed attempts, every job when JOBS_BACKEND is 'db', and the "
+        "periodic jobs in JOBS_SCHEDULE."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=settings.JOBS_WORKERS,
+                            help="Jobs run at the same time")
+        parser.add_argument('--once', action='store_true',
+                            help="Run the jobs that are due now, then exit")
+
+    def handle(self, *args, **options):
+        workers = max(1, options['workers'])
+        # Jobs such as the cart reaper invalidate cached data the web workers must see
+        warning = process_local_cache_warning("what jobs such as the cart reaper change")
+        if warning:
+            self.stderr.write(self.style.WARNING(warning))
+        succeeded = failed = 0
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='jobs') as executor:
+            while True:
+                enqueue_scheduled()
+                jobs = claim_due_jobs(workers)
+                if not jobs:
+                    if options['once']:
+                        break
+                    time.sleep(settings.JOBS_POLL_INTERVAL)
+                    continue
+                for ok in executor.map(run_job, jobs):
+                    if ok:
+                        succeeded += 1
+                    else:
+                        failed += 1
+                if options['verbosity'] > 1:
+                    self.stdout.write(f"{succeeded} succeeded, {failed} failed")
+        self.stdout.write(f"{succeeded} succeeded, {failed} failed")
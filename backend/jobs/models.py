@@ -0,0 +1,45 @@
+from django.db import models
+
+
+class Job(models.Model):
+    """
+    A queued background job (see jobs.runner).
+
+    Every job is stored here before it runs, whether the in-process pool or
+    the ``run_jobs`` worker picks it up. Rows are deleted once the job
+    succeeds, so the table only holds queued, running and failed jobs.
+    """
+    PENDING = 'pending'
+    RUNNING = 'running'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),  # claimed by a worker until run_at, then up for grabs again
+        (FAILED, 'Failed'),  # out of attempts, kept for inspection
+    ]
+
+    name = models.CharField(max_length=100)
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(default=0)
+    run_at = models.DateTimeField()
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # The worker polls for (status, run_at <= now)
+            models.Index(fields=['status', 'run_at'], name='job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.status})"
+
+
+class ScheduledJob(models.Model):
+    """When a JOBS_SCHEDULE job is next due; workers claim each run with a conditional update"""
+    name = models.CharField(max_length=100, unique=True)
+    next_run_at = models.DateTimeField()
+
+    def __str__(self):
+        return self.name
@@ -0,0 +1,233 @@
+"""
+Background jobs: durable rows in the ``Job`` table, run on an in-process
+thread pool when possible.
+
+Functions registered with ``@job('name')`` are queued with ``enqueue`` (or
+``enqueue_on_commit`` from inside a transaction) and called with the keyword
+arguments they were queued with, which must be JSON serializable.
+
+Every job is written to the table first; ``enqueue_on_commit`` writes it in
+the caller's transaction, so it exists exactly when the work it follows up
+does. With JOBS_BACKEND 'thread' the row is then reserved for
+JOBS_LEASE_SECONDS and handed to a bounded pool of JOBS_WORKERS threads in
+the same process, so the request returns at once. If the pool is full (more
+than JOBS_MAX_PENDING waiting) the reservation is dropped, and if the
+process dies first it runs out; either way the ``run_jobs`` worker picks the
+job up, and it retries failed attempts with exponential backoff up to the
+job's attempt limit. With JOBS_BACKEND 'db' only the worker runs jobs. Jobs
+may run more than once, so they must be idempotent.
+
+The worker also queues the jobs in JOBS_SCHEDULE every so many seconds.
+"""
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+from bilandog.metrics import registry
+from .models import Job, ScheduledJob
+
+logger = logging.getLogger(__name__)
+
+# name -> (function, max attempts or None for JOBS_MAX_ATTEMPTS)
+_registry = {}
+
+_executor = None
+_slots = None
+_setup_lock = threading.Lock()
+
+# JOBS_SCHEDULE names this process has made sure have a ScheduledJob row
+_scheduled = set()
+
+
+def job(name, max_attempts=None):
+    """Register the decorated function as the background job ``name``"""
+    def register(fn):
+        if name in _registry:
+            raise ValueError(f"Job {name!r} is already registered")
+        _registry[name] = (fn, max_attempts)
+        fn.job_name = name
+        return fn
+    return register
+
+
+def max_attempts(name):
+    return _registry[name][1] or settings.JOBS_MAX_ATTEMPTS
+
+
+def retry_delay(attempts):
+    """Seconds to wait before the next attempt after ``attempts`` failed ones"""
+    return settings.JOBS_RETRY_DELAY * 2 ** (attempts - 1)
+
+
+def _get_pool():
+    global _executor, _slots
+    with _setup_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.JOBS_WORKERS, thread_name_prefix='jobs')
+            _slots = threading.BoundedSemaphore(settings.JOBS_WORKERS + settings.JOBS_MAX_PENDING)
+    return _executor, _slots
+
+
+def _store(jobs):
+    """Write ``(name, payload)`` pairs to the Job table and return the rows"""
+    now = timezone.now()
+    in_process = settings.JOBS_BACKEND == 'thread'
+    rows = []
+    for name, payload in jobs:
+        if name not in _registry:
+            raise LookupError(f"Unknown job {name!r}")
+        # Round-trip now so a bad payload fails here, not in the worker
+        payload = json.loads(json.dumps(payload))
+        # Reserved for this process's pool; the worker only sees it once the lease runs out
+        run_at = now + timedelta(seconds=settings.JOBS_LEASE_SECONDS) if in_process else now
+        rows.append(Job(name=name, payload=payload, run_at=run_at))
+
+    if connection.features.can_return_rows_from_bulk_insert:
+        return Job.objects.bulk_create(rows)
+    # The pool needs the ids
+    for row in rows:
+        row.save()
+    return rows
+
+
+def _hand_off(jobs):
+    """Give stored jobs to the in-process pool, or to the worker when the pool is full"""
+    if settings.JOBS_BACKEND != 'thread':
+        return
+    executor, slots = _get_pool()
+    overflow = []
+    for job in jobs:
+        if slots.acquire(blocking=False):
+            future = executor.submit(_run_in_process, job, time.perf_counter())
+            future.add_done_callback(lambda _: slots.release())
+        else:
+            overflow.append(job.id)
+    if overflow:
+        logger.warning("Job pool full, leaving %s job(s) to the worker", len(overflow))
+        Job.objects.filter(id__in=overflow, attempts=0).update(run_at=timezone.now())
+
+
+def enqueue(name, **payload):
+    """Run job ``name`` in the background with ``payload`` as its keyword arguments"""
+    _hand_off(_store([(name, payload)]))
+
+
+def enqueue_on_commit(name, **payload):
+    """Queue the job in the current transaction and start it once that commits, so it sees its writes"""
+    enqueue_all_on_commit([(name, payload)])
+
+
+def enqueue_all_on_commit(jobs):
+    """``enqueue_on_commit`` for several ``(name, payload)`` pairs, written in one insert"""
+    stored = _store(jobs)
+    transaction.on_commit(lambda: _hand_off(stored))
+
+
+def enqueue_scheduled():
+    """Queue every JOBS_SCHEDULE job whose interval has passed and return their names"""
+    schedule = settings.JOBS_SCHEDULE
+    now = timezone.now()
+    if not _scheduled.issuperset(schedule):
+        ScheduledJob.objects.bulk_create(
+            [ScheduledJob(name=name, next_run_at=now) for name in schedule], ignore_conflicts=True
+        )
+        _scheduled.update(schedule)
+
+    queued = []
+    due = ScheduledJob.objects.filter(name__in=list(schedule), next_run_at__lte=now)
+    for name in due.values_list('name', flat=True):
+        with transaction.atomic():
+            # A conditional update, so one worker queues each run however many are polling
+            if due.filter(name=name).update(next_run_at=now + timedelta(seconds=schedule[name])):
+                Job.objects.create(name=name, payload={}, run_at=now)
+                queued.append(name)
+    return queued
+
+
+def _call(name, payload):
+    fn = _registry[name][0]
+    labels = (('job', name),)
+    started_at = time.perf_counter()
+    close_old_connections()
+    try:
+        fn(**payload)
+    finally:
+        close_old_connections()
+        registry.observe('job_seconds', labels, time.perf_counter() - started_at)
+
+
+def _run_in_process(job, queued_at):
+    """Pool task: claim the stored job and make its first attempt"""
+    registry.observe('job_queue_seconds', (('job', job.name),), time.perf_counter() - queued_at)
+    try:
+        # Claimed like the worker does, in case the reservation ran out while waiting
+        if not Job.objects.filter(id=job.id, status=Job.PENDING, attempts=0).update(
+            status=Job.RUNNING,
+            attempts=1,
+            run_at=timezone.now() + timedelta(seconds=settings.JOBS_LEASE_SECONDS)
+        ):
+            return
+        job.status, job.attempts = Job.RUNNING, 1
+        run_job(job)
+    except Exception:
+        # The row is still there, the worker retries it once the lease runs out
+        logger.exception("Could not run job %s in process", job.name)
+    finally:
+        close_old_connections()
+
+
+def _record_failure(job, error):
+    """Schedule the next attempt of ``job``, or mark it failed when it has none left"""
+    job.last_error = f"{type(error).__name__}: {error}"
+    if job.attempts >= max_attempts(job.name):
+        job.status = Job.FAILED
+        job.run_at = timezone.now()
+    else:
+        job.status = Job.PENDING
+        job.run_at = timezone.now() + timedelta(seconds=retry_delay(job.attempts))
+    job.save(update_fields=['status', 'run_at', 'last_error'])
+
+
+def claim_due_jobs(limit):
+    """
+    Claim up to ``limit`` due jobs for this worker and return them.
+
+    Claiming bumps ``attempts`` and leases the row until JOBS_LEASE_SECONDS
+    from now; a job whose worker died is claimed again once its lease runs
+    out. Each claim is a conditional update, so two workers never both win
+    the same row, whatever the database's locking support.
+    """
+    now = timezone.now()
+    due = Job.objects.filter(status__in=[Job.PENDING, Job.RUNNING], run_at__lte=now)
+    claimed = []
+    for job_id in due.order_by('run_at').values_list('id', flat=True)[:limit]:
+        if due.filter(id=job_id).update(
+            status=Job.RUNNING,
+            attempts=F('attempts') + 1,
+            run_at=now + timedelta(seconds=settings.JOBS_LEASE_SECONDS)
+        ):
+            claimed.append(job_id)
+    return list(Job.objects.filter(id__in=claimed).order_by('run_at'))
+
+
+def run_job(job):
+    """Run one claimed job: delete it on success, otherwise reschedule or fail it"""
+    if job.name not in _registry:
+        job.status = Job.FAILED
+        job.last_error = f"Unknown job {job.name!r}"
+        job.save(update_fields=['status', 'last_error'])
+        return False
+    try:
+        _call(job.name, job.payload)
+    except Exception as e:
+        logger.exception("Job %s failed, attempt %s", job.name, job.attempts)
+        _record_failure(job, e)
+        return False
+    job.delete()
+    return True
@@ -0,0 +1,134 @@
+import time
+from datetime import timedelta
+from django.db import transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from . import runner
+from .models import Job, ScheduledJob
+
+calls = []
+
+
+@runner.job('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@runner.job('tests.fail', max_attempts=2)
+def fail():
+    raise RuntimeError("boom")
+
+
+@override_settings(JOBS_BACKEND='db', JOBS_RETRY_DELAY=10, JOBS_LEASE_SECONDS=300)
+class JobQueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+
+    def claim(self):
+        # Make everything queued due now, then claim it like a worker would
+        Job.objects.update(run_at=timezone.now())
+        return runner.claim_due_jobs(10)
+
+    def test_enqueue_on_commit_writes_the_job_with_the_transaction(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                runner.enqueue_on_commit('tests.record', value=1)
+        self.assertEqual(len(callbacks), 1)
+        self.assertEqual(list(Job.objects.values_list('name', 'payload')), [('tests.record', {'value': 1})])
+
+    def test_a_rolled_back_transaction_leaves_no_job(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                runner.enqueue_on_commit('tests.record', value=1)
+                transaction.set_rollback(True)
+        self.assertEqual(callbacks, [])
+        self.assertFalse(Job.objects.exists())
+
+    def test_bad_jobs_fail_when_queued(self):
+        with self.assertRaises(LookupError):
+            runner.enqueue('tests.unknown')
+        with self.assertRaises(TypeError):
+            runner.enqueue('tests.record', value=object())
+        self.assertFalse(Job.objects.exists())
+
+    @override_settings(JOBS_BACKEND='thread')
+    def test_in_process_jobs_are_reserved_for_their_lease(self):
+        with self.captureOnCommitCallbacks():
+            runner.enqueue_on_commit('tests.record', value=1)
+        job = Job.objects.get()
+        self.assertGreater(job.run_at, timezone.now() + timedelta(seconds=250))
+        self.assertEqual(runner.claim_due_jobs(10), [])
+
+        # The pool task claims the reservation itself, and a second claim is a no-op
+        runner._run_in_process(job, time.perf_counter())
+        runner._run_in_process(job, time.perf_counter())
+        self.assertEqual(calls, [1])
+        self.assertFalse(Job.objects.exists())
+
+    def test_success_deletes_the_job(self):
+        runner.enqueue('tests.record', value=2)
+        job, = self.claim()
+        self.assertEqual((job.status, job.attempts), (Job.RUNNING, 1))
+        self.assertTrue(runner.run_job(job))
+        self.assertEqual(calls, [2])
+        self.assertFalse(Job.objects.exists())
+
+    def test_a_running_job_is_only_claimed_again_once_its_lease_expires(self):
+        runner.enqueue('tests.record', value=3)
+        job, = self.claim()
+        self.assertEqual(runner.claim_due_jobs(10), [])
+
+        # Its worker vanished
+        Job.objects.filter(pk=job.pk).update(run_at=timezone.now() - timedelta(seconds=1))
+        again, = runner.claim_due_jobs(10)
+        self.assertEqual((again.pk, again.status, again.attempts), (job.pk, Job.RUNNING, 2))
+        self.assertGreater(again.run_at, timezone.now() + timedelta(seconds=250))
+
+    def test_failures_are_retried_with_backoff_then_failed(self):
+        runner.enqueue('tests.fail')
+        job, = self.claim()
+        before = timezone.now()
+        with self.assertLogs('jobs.runner', level='ERROR'):
+            self.assertFalse(runner.run_job(job))
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, job.last_error), (Job.PENDING, 1, "RuntimeError: boom"))
+        self.assertGreaterEqual(job.run_at, before + timedelta(seconds=10))
+        self.assertEqual(runner.claim_due_jobs(10), [])
+
+        job, = self.claim()
+        with self.assertLogs('jobs.runner', level='ERROR'):
+            self.assertFalse(runner.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts), (Job.FAILED, 2))
+        self.assertEqual(self.claim(), [])
+
+    def test_backoff_doubles(self):
+        self.assertEqual([runner.retry_delay(attempts) for attempts in (1, 2, 3)], [10, 20, 40])
+
+    def test_unknown_jobs_fail(self):
+        Job.objects.create(name='tests.removed', payload={}, run_at=timezone.now())
+        job, = runner.claim_due_jobs(10)
+        self.assertFalse(runner.run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.FAILED)
+
+
+@override_settings(JOBS_SCHEDULE={'tests.record': 60})
+class ScheduleTests(TestCase):
+    def setUp(self):
+        runner._scheduled.clear()
+
+    def test_each_interval_is_queued_once(self):
+        self.assertEqual(runner.enqueue_scheduled(), ['tests.record'])
+        self.assertEqual(runner.enqueue_scheduled(), [])
+        # Another worker process, which hasn't seen the schedule rows yet
+        runner._scheduled.clear()
+        self.assertEqual(runner.enqueue_scheduled(), [])
+        self.assertEqual(Job.objects.filter(name='tests.record').count(), 1)
+
+        schedule = ScheduledJob.objects.get(name='tests.record')
+        self.assertGreater(schedule.next_run_at, timezone.now() + timedelta(seconds=50))
+        ScheduledJob.objects.update(next_run_at=timezone.now())
+        self.assertEqual(runner.enqueue_scheduled(), ['tests.record'])
+        self.assertEqual(Job.objects.filter(name='tests.record').count(), 2)
@@ -1,3 +1,31 @@
+from django import forms
 from django.contrib import admin
+from .models import DailyProductSales, Promotion
 
-# Register your models here.
+
+class PromotionForm(forms.ModelForm):
+    class Meta:
+        model = Promotion
+        fields = '__all__'
+
+    def clean(self):
+        cleaned_data = super().clean()
+        # A bundle without products never applies
+        if cleaned_data.get('kind') == Promotion.BUNDLE and not cleaned_data.get('products'):
+            self.add_error('products', "Pick the products that make up the bundle.")
+        return cleaned_data
+
+
+@admin.register(Promotion)
+class PromotionAdmin(admin.ModelAdmin):
+    form = PromotionForm
+    list_display = ['name', 'kind', 'percent_off', 'min_quantity', 'is_active']
+    list_filter = ['kind', 'is_active']
+    filter_horizontal = ['products']
+
+
+@admin.register(DailyProductSales)
+class DailyProductSalesAdmin(admin.ModelAdmin):
+    list_display = ['day', 'product', 'quantity', 'revenue']
+    list_filter = ['day']
+    list_select_related = ['product']
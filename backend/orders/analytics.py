@@ -0,0 +1,97 @@
+"""
+Sales rollups and the reports read from them.
+
+Each completed order is added once to ``DailyProductSales`` (units and revenue
+per product per completion day), by a job queued at checkout or by the
+``backfill_sales_rollups`` command; ``Order.rolled_up`` records that it was
+counted. Orders are only archived once counted, so a rebuild recounts the
+archive as well. Reports only aggregate the rollups, so they cost days x products
+rather than a scan of every order line.
+"""
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import TruncDate
+from .models import ArchivedOrderItem, DailyProductSales, Order, OrderItem
+from .pricing import CENT
+
+
+def _revenue(expression):
+    """Sum of money, typed like ``DailyProductSales.revenue``"""
+    return Sum(expression, output_field=DecimalField(max_digits=14, decimal_places=2))
+
+
+def _cents(value):
+    """Round a summed revenue to cents"""
+    # SQLite returns computed decimals unrounded (26.40000000000000), so round them to the column's cents
+    return value.quantize(CENT)
+
+
+def _add_sales(day, product_id, quantity, revenue):
+    """Increment one rollup row, creating it on the first sale of the day"""
+    sales = DailyProductSales.objects.filter(day=day, product_id=product_id)
+    if sales.update(quantity=F('quantity') + quantity, revenue=F('revenue') + revenue):
+        return
+    try:
+        with transaction.atomic():
+            DailyProductSales.objects.create(day=day, product_id=product_id, quantity=quantity, revenue=revenue)
+    except IntegrityError:
+        # Another transaction created it first
+        sales.update(quantity=F('quantity') + quantity, revenue=F('revenue') + revenue)
+
+
+def _add_lines(items):
+    """Add order lines, OrderItem or ArchivedOrderItem, to the rollups of their day and product"""
+    totals = (
+        items.values('product_id', day=TruncDate('order__completed_at'))
+        .annotate(
+            units=Sum('quantity'),
+            revenue=_revenue(F('quantity') * F('price_at_purchase')),
+        )
+    )
+    for row in totals:
+        _add_sales(row['day'], row['product_id'], row['units'], _cents(row['revenue']))
+
+
+def roll_up_orders(order_ids):
+    """Add the completed orders among ``order_ids`` that aren't counted yet to the rollups; return how many"""
+    with transaction.atomic():
+        # Row locks make a concurrent job and backfill agree on who counts each order
+        ids = list(
+            Order.objects.select_for_update()
+            .filter(id__in=order_ids, is_completed=True, rolled_up=False)
+            .values_list('id', flat=True)
+        )
+        if not ids:
+            return 0
+        Order.objects.filter(id__in=ids).update(rolled_up=True)
+        _add_lines(OrderItem.objects.filter(order_id__in=ids))
+    return len(ids)
+
+
+def roll_up_archived_orders(order_ids):
+    """Add archived orders to the rollups; only for rebuilds, archived orders were counted before moving"""
+    with transaction.atomic():
+        _add_lines(ArchivedOrderItem.objects.filter(order_id__in=order_ids))
+    return len(order_ids)
+
+
+def sales_report(start, end, top):
+    """Revenue and units per day, and the ``top`` products by revenue, for days ``start``..``end``"""
+    sales = DailyProductSales.objects.filter(day__range=(start, end))
+    days = list(sales.values('day').annotate(units=Sum('quantity'), revenue=_revenue('revenue')).order_by('day'))
+    products = list(
+        sales.values('product_id', name=F('product__name'))
+        .annotate(units=Sum('quantity'), revenue=_revenue('revenue'))
+        .order_by('-revenue', 'product_id')[:top]
+    )
+    for row in days + products:
+        row['revenue'] = _cents(row['revenue'])
+    return {
+        "start": start,
+        "end": end,
+        "revenue": sum((day['revenue'] for day in days), start=Decimal('0.00')),
+        "units": sum(day['units'] for day in days),
+        "days": days,
+        "top_products": products,
+    }
@@ -0,0 +1,86 @@
+"""
+Archiving of old completed orders.
+
+Completed orders older than ORDER_ARCHIVE_AFTER_DAYS are moved with their
+lines into ArchivedOrder/ArchivedOrderItem, keeping their ids, so Order and
+OrderItem and their indexes only hold carts and recent history however much
+history accumulates. Each batch is copied and deleted in one short
+transaction, oldest first along order_archive_idx, with a pause between
+batches. Only orders already counted in the sales rollups are moved.
+
+The archive only ever holds orders completed more than
+ORDER_ARCHIVE_AFTER_DAYS ago; history reads rely on that to skip it while
+they are still on recent orders.
+"""
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+
+def archive_horizon():
+    """Orders completed before this may be in the archive"""
+    return timezone.now() - timedelta(days=settings.ORDER_ARCHIVE_AFTER_DAYS)
+
+
+def archivable_orders():
+    return Order.objects.filter(is_completed=True, rolled_up=True, completed_at__lt=archive_horizon())
+
+
+def archive_orders(batch_size=None, pause=None, max_batches=None, progress=None):
+    """
+    Move archivable orders to the archive in batches and return how many moved.
+
+    Sleeps ``pause`` seconds between batches, stops after ``max_batches``
+    when given, and calls ``progress(archived)`` after every batch.
+    """
+    batch_size = batch_size or settings.ORDER_ARCHIVE_BATCH_SIZE
+    pause = settings.ORDER_ARCHIVE_PAUSE if pause is None else pause
+    candidates = archivable_orders()
+
+    archived = batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            orders = list(
+                candidates.select_for_update(skip_locked=True)
+                .order_by('completed_at', 'id')[:batch_size]
+            )
+            if not orders:
+                break
+            ids = [order.id for order in orders]
+            items = list(OrderItem.objects.filter(order_id__in=ids))
+
+            ArchivedOrder.objects.bulk_create(
+                ArchivedOrder(
+                    id=order.id,
+                    user_id=order.user_id,
+                    created_at=order.created_at,
+                    completed_at=order.completed_at,
+                    total_price=order.total_price,
+                )
+                for order in orders
+            )
+            ArchivedOrderItem.objects.bulk_create(
+                ArchivedOrderItem(
+                    id=item.id,
+                    order_id=item.order_id,
+                    product_id=item.product_id,
+                    quantity=item.quantity,
+                    price_at_purchase=item.price_at_purchase,
+                )
+                for item in items
+            )
+            OrderItem.objects.filter(order_id__in=ids).delete()
+            Order.objects.filter(id__in=ids).delete()
+
+        archived += len(ids)
+        batches += 1
+        if progress:
+            progress(archived)
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return archived
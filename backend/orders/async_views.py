@@ -0,0 +1,94 @@
+"""
+Native async versions of the read-heavy order endpoints.
+
+DRF views are synchronous, so under ASGI every request to them occupies a
+thread. These are plain Django async views that return the same payloads
+using the async ORM and cache APIs; a warm product list or cart read never
+leaves the event loop except for its queries.
+"""
+from django.conf import settings
+from django.utils.cache import get_conditional_response
+from django.views import View
+from rest_framework import status
+from rest_framework.exceptions import AuthenticationFailed
+from bilandog.renderers import json_response
+from users.authentication import CachedJWTAuthentication
+from .catalog import aget_product_list_payload
+from .cart_store import get_cart_store
+from .history import ahistory_page
+from .pagination import InvalidCursor, get_page_size
+from .versions import CART_VERSION_KEY, HISTORY_VERSION_KEY, auser_etag
+from .views import catalog_response, private_etag
+
+
+class AsyncJWTView(View):
+    """Async view authenticated with the same JWTs as the DRF views"""
+
+    authentication = CachedJWTAuthentication()
+
+    async def authenticate(self, request):
+        """Return ``(user, None)``, or ``(None, response)`` to send back instead"""
+        try:
+            result = await self.authentication.aauthenticate(request)
+            if result is None:
+                raise AuthenticationFailed("Authentication credentials were not provided.")
+        except AuthenticationFailed as e:
+            response = json_response(
+                e.detail if isinstance(e.detail, dict) else {"detail": e.detail},
+                status.HTTP_401_UNAUTHORIZED
+            )
+            response['WWW-Authenticate'] = self.authentication.authenticate_header(request)
+            return None, response
+        return result[0], None
+
+
+class AsyncProductListView(View):
+
+    async def get(self, request):
+        """Get all available products, served from the versioned catalog cache"""
+        try:
+            return catalog_response(request, await aget_product_list_payload())
+        except Exception as e:
+            return json_response({"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncCartView(AsyncJWTView):
+
+    async def get(self, request):
+        """Get the current cart items for the user, or 304 if the client's copy is current"""
+        user, error = await self.authenticate(request)
+        if error:
+            return error
+        try:
+            etag = await auser_etag(CART_VERSION_KEY, user.id)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified:
+                return private_etag(not_modified, etag)
+            cart_items = await get_cart_store().aget_items(user.id)
+            return private_etag(json_response({"cart_items": cart_items}, status.HTTP_200_OK), etag)
+        except Exception as e:
+            return json_response({"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+
+class AsyncOrderHistoryView(AsyncJWTView):
+
+    async def get(self, request):
+        """Get one page of the user's order history, newest first, or 304 if the client's copy is current"""
+        user, error = await self.authenticate(request)
+        if error:
+            return error
+        try:
+            etag = await auser_etag(HISTORY_VERSION_KEY, user.id)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified:
+                return private_etag(not_modified, etag)
+            page_size = get_page_size(
+                request, settings.ORDER_HISTORY_PAGE_SIZE, settings.ORDER_HISTORY_MAX_PAGE_SIZE
+            )
+            try:
+                page = await ahistory_page(user.id, request.GET.get('cursor'), page_size)
+            except InvalidCursor as e:
+                return json_response({"cursor": str(e)}, status.HTTP_400_BAD_REQUEST)
+            return private_etag(json_response(page, status.HTTP_200_OK), etag)
+        except Exception as e:
+            return json_response({"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR)
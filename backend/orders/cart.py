@@ -0,0 +1,270 @@
+import logging
+from decimal import Decimal
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from .jobs import order_completed
+from .models import Order, OrderItem
+from .pricing import get_price_table
+from .versions import bump_user_versions
+
+logger = logging.getLogger(__name__)
+
+
+def get_open_cart(user_id, create=False, lock=False):
+    """Return the user's open cart, optionally creating and row-locking it"""
+    open_orders = Order.objects.filter(user_id=user_id, is_completed=False)
+    if lock:
+        open_orders = open_orders.select_for_update()
+
+    # The one_open_cart_per_user constraint guarantees at most one match
+    cart = open_orders.first()
+    if cart or not create:
+        return cart
+
+    # Create new order if none exists
+    try:
+        with transaction.atomic():
+            return Order.objects.create(
+                user_id=user_id,
+                is_completed=False,
+                total_price=Decimal('0.00')
+            )
+    except IntegrityError:
+        # A concurrent request created the cart first
+        return open_orders.first()
+
+
+def parse_cart_items(cart_items):
+    """Normalise the posted cart payload into {product_id: quantity}; posted prices are ignored"""
+    lines = {}
+    for item in cart_items:
+        try:
+            product_id = int(item.get('id'))
+            quantity = int(item.get('quantity', 1))
+        except (AttributeError, TypeError, ValueError) as item_error:
+            # Log item-specific error but continue processing other items
+            logger.warning("Error processing cart item %r: %s", item, item_error)
+            continue
+
+        if quantity < 1:
+            continue
+
+        # Repeated products collapse into a single line
+        lines[product_id] = lines.get(product_id, 0) + quantity
+    return lines
+
+
+def _sync_lines(cart, items, quantities, table):
+    """
+    Price ``quantities`` and write them over the cart's current ``items``.
+
+    Unchanged lines are left alone and the remaining changes go out as one
+    bulk delete, update and insert each. Returns the new total and the unit
+    prices by product.
+    """
+    prices = table.price_cart(quantities)
+
+    to_delete = []
+    to_update = []
+    existing = set()
+    for item in items:
+        if item.product_id not in prices or item.product_id in existing:
+            to_delete.append(item.id)
+            continue
+        existing.add(item.product_id)
+
+        quantity, price = quantities[item.product_id], prices[item.product_id]
+        if item.quantity != quantity or item.price_at_purchase != price:
+            item.quantity = quantity
+            item.price_at_purchase = price
+            to_update.append(item)
+
+    to_create = [
+        OrderItem(order=cart, product_id=product_id, quantity=quantities[product_id], price_at_purchase=price)
+        for product_id, price in prices.items()
+        if product_id not in existing
+    ]
+
+    if to_delete:
+        OrderItem.objects.filter(id__in=to_delete).delete()
+    if to_update:
+        OrderItem.objects.bulk_update(to_update, ['quantity', 'price_at_purchase'])
+    if to_create:
+        OrderItem.objects.bulk_create(to_create)
+
+    # Update order total, and the last edit time the reaper goes by
+    total_price = sum((price * quantities[product_id] for product_id, price in prices.items()), Decimal('0.00'))
+    if cart.total_price != total_price or to_delete or to_update or to_create:
+        cart.updated_at = timezone.now()
+        Order.objects.filter(pk=cart.pk).update(total_price=total_price, updated_at=cart.updated_at)
+        cart.total_price = total_price
+    return total_price, prices
+
+
+def replace_cart_items(cart, cart_items):
+    """
+    Make the cart contain exactly ``cart_items`` and return the new total.
+
+    Prices come from the price table, never from the payload, and products
+    missing from the catalog are skipped. Call inside a transaction holding
+    the cart row lock.
+    """
+    table = get_price_table()
+    quantities = {
+        product_id: quantity
+        for product_id, quantity in parse_cart_items(cart_items).items()
+        if product_id in table
+    }
+    total_price, _ = _sync_lines(cart, OrderItem.objects.filter(order=cart), quantities, table)
+    return total_price
+
+
+def reprice_cart(cart, product_id=None, quantity=0):
+    """
+    Reprice every line of the cart, optionally setting one line's quantity first.
+
+    A ``quantity`` of zero drops the line. Returns the new total and the unit
+    prices by product. Call inside a transaction holding the cart row lock.
+    """
+    table = get_price_table()
+    items = list(OrderItem.objects.filter(order=cart))
+    quantities = {item.product_id: item.quantity for item in items if item.product_id in table}
+    if product_id is not None:
+        quantities.pop(product_id, None)
+        if quantity > 0 and product_id in table:
+            quantities[product_id] = quantity
+    return _sync_lines(cart, items, quantities, table)
+
+
+def _change_line(cart, product_id, quantity):
+    """Set one line through a full reprice, for products whose price depends on the cart"""
+    total_price, prices = reprice_cart(cart, product_id, quantity)
+    if product_id not in prices:
+        return None, total_price
+    return (quantity, prices[product_id]), total_price
+
+
+def _adjust_total(cart, delta):
+    """Shift the cart total by ``delta`` in place, mark the cart edited and return the new total"""
+    cart.updated_at = timezone.now()
+    Order.objects.filter(pk=cart.pk).update(total_price=F('total_price') + delta, updated_at=cart.updated_at)
+    cart.total_price += delta
+    return cart.total_price
+
+
+def add_cart_item(cart, product_id, quantity):
+    """
+    Add ``quantity`` of a product to the cart, incrementing an existing line.
+
+    Returns the changed line as ``(quantity, unit_price)`` and the new cart
+    total. Only the touched line is repriced unless the product is part of a
+    bundle. Call inside a transaction holding the cart row lock.
+
+    The line is read before it is written rather than upserted on
+    unique_product_per_order: quantity breaks price the line by its new
+    quantity, and the total moves by the old line's value, neither of which
+    a single INSERT ... ON CONFLICT can return portably. Under the cart lock
+    the read costs one indexed lookup and nothing can change in between.
+    """
+    table = get_price_table()
+    item = OrderItem.objects.filter(order=cart, product_id=product_id).first()
+    new_quantity = quantity + (item.quantity if item else 0)
+    if table.in_bundle(product_id):
+        return _change_line(cart, product_id, new_quantity)
+
+    price = table.unit_price(product_id, new_quantity)
+    if item is None:
+        OrderItem.objects.create(
+            order=cart,
+            product_id=product_id,
+            quantity=new_quantity,
+            price_at_purchase=price
+        )
+        delta = price * new_quantity
+    else:
+        OrderItem.objects.filter(pk=item.pk).update(quantity=F('quantity') + quantity, price_at_purchase=price)
+        delta = price * new_quantity - item.price_at_purchase * item.quantity
+    return (new_quantity, price), _adjust_total(cart, delta)
+
+
+def set_cart_item_quantity(cart, product_id, quantity):
+    """
+    Set the quantity of one cart line, removing it when ``quantity`` is zero.
+
+    Returns the changed line as ``(quantity, unit_price)`` (``None`` if
+    removed) and the new cart total, or ``(None, None)`` when the product is
+    not in the cart. Setting the quantity a line already has at its current
+    price writes nothing, so the cart's ``updated_at`` stays as it was.
+    """
+    item = OrderItem.objects.filter(order=cart, product_id=product_id).first()
+    if item is None:
+        return None, None
+    if quantity < 1:
+        return remove_cart_item(cart, product_id, item=item)
+
+    table = get_price_table()
+    if table.in_bundle(product_id):
+        return _change_line(cart, product_id, quantity)
+
+    price = table.unit_price(product_id, quantity)
+    if item.quantity == quantity and item.price_at_purchase == price:
+        return (quantity, price), cart.total_price
+    OrderItem.objects.filter(pk=item.pk).update(quantity=quantity, price_at_purchase=price)
+    delta = price * quantity - item.price_at_purchase * item.quantity
+    return (quantity, price), _adjust_total(cart, delta)
+
+
+def remove_cart_item(cart, product_id, item=None):
+    """
+    Drop one product from the cart.
+
+    Returns ``(None, new_total)``, or ``(None, None)`` when the product is not
+    in the cart.
+    """
+    if item is None:
+        item = OrderItem.objects.filter(order=cart, product_id=product_id).first()
+        if item is None:
+            return None, None
+    if get_price_table().in_bundle(product_id):
+        # Removing it can break a bundle discount on the other lines
+        return _change_line(cart, product_id, 0)
+    OrderItem.objects.filter(pk=item.pk).delete()
+    return None, _adjust_total(cart, -item.price_at_purchase * item.quantity)
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def checkout_cart(user_id):
+    """
+    Complete the user's cart as one atomic operation and return the order.
+
+    The cart row stays locked while every line is repriced against the current
+    price table and the total recomputed, so a concurrent cart edit either
+    lands before checkout or waits and then finds a fresh cart. Raises
+    CheckoutError when there is nothing to check out.
+    """
+    with transaction.atomic():
+        cart = get_open_cart(user_id, lock=True)
+        if not cart:
+            raise CheckoutError("No items in cart")
+
+        total_price, prices = reprice_cart(cart)
+        if not prices:
+            raise CheckoutError("Cart is empty")
+
+        # Mark the order as completed
+        cart.is_completed = True
+        cart.completed_at = timezone.now()
+        cart.total_price = total_price
+        Order.objects.filter(pk=cart.pk).update(
+            is_completed=True,
+            completed_at=cart.completed_at,
+            total_price=cart.total_price
+        )
+        # Receipts and the like run in the background after the commit
+        order_completed(cart.id)
+        bump_user_versions(user_id, history=True)
+    return cart
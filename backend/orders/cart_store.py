@@ -0,0 +1,308 @@
+import atexit
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from bilandog.db_routing import primary
+from .models import OrderItem, Product
+from .pricing import aget_price_table, get_price_table
+from .versions import bump_user_versions
+from .cart import (
+    get_open_cart, parse_cart_items, replace_cart_items, add_cart_item, set_cart_item_quantity,
+    remove_cart_item, checkout_cart
+)
+
+logger = logging.getLogger(__name__)
+
+
+def format_cart_line(product_id, name, price, quantity):
+    """Format a cart line the way the frontend cart expects it"""
+    return {
+        "id": product_id,
+        "name": name,
+        "price": price,
+        "quantity": quantity,
+        "emoji": "🌭"  # Default emoji
+    }
+
+
+def format_priced_lines(quantities, table=None):
+    """Price {product_id: quantity} against the price table and format every line"""
+    table = table or get_price_table()
+    prices = table.price_cart(quantities)
+    return [
+        format_cart_line(product_id, table.names[product_id], price, quantities[product_id])
+        for product_id, price in prices.items()
+    ]
+
+
+class DatabaseCartStore:
+    """Carts live directly in the Order/OrderItem tables"""
+
+    def get_items(self, user_id):
+        cart = get_open_cart(user_id)
+        if not cart:
+            return []
+        # Show current prices; the stored lines are repriced on the next edit or at checkout
+        return format_priced_lines(dict(
+            OrderItem.objects.filter(order=cart).values_list('product_id', 'quantity')
+        ))
+
+    async def aget_items(self, user_id):
+        # One join instead of looking the cart up first
+        quantities = {
+            product_id: quantity
+            async for product_id, quantity in OrderItem.objects.filter(
+                order__user_id=user_id, order__is_completed=False
+            ).values_list('product_id', 'quantity')
+        }
+        return format_priced_lines(quantities, await aget_price_table())
+
+    def replace(self, user_id, cart_items):
+        # Lock the cart and apply the whole change set in one transaction
+        with transaction.atomic():
+            cart = get_open_cart(user_id, create=True, lock=True)
+            replace_cart_items(cart, cart_items)
+            bump_user_versions(user_id)
+
+    def add(self, user_id, product_id, quantity):
+        with transaction.atomic():
+            cart = get_open_cart(user_id, create=True, lock=True)
+            line, total_price = add_cart_item(cart, product_id, quantity)
+            bump_user_versions(user_id)
+        return self._format(product_id, line), total_price
+
+    def set_quantity(self, user_id, product_id, quantity):
+        return self._change_line(user_id, set_cart_item_quantity, product_id, quantity)
+
+    def remove(self, user_id, product_id):
+        return self._change_line(user_id, remove_cart_item, product_id)
+
+    def _change_line(self, user_id, change, product_id, *args):
+        with transaction.atomic():
+            cart = get_open_cart(user_id, lock=True)
+            if not cart:
+                return None, None
+            edited_at = cart.updated_at
+            line, total_price = change(cart, product_id, *args)
+            # Edits that change nothing leave updated_at alone, and the cart's ETag with it
+            if cart.updated_at != edited_at:
+                bump_user_versions(user_id)
+        return (self._format(product_id, line) if line else None), total_price
+
+    def _format(self, product_id, line):
+        quantity, price = line
+        name = get_price_table().names.get(product_id)
+        if name is None:
+            # The catalog changed after the edit priced the line
+            name = Product.objects.filter(pk=product_id).values_list('name', flat=True).first()
+        return format_cart_line(product_id, name, price, quantity)
+
+    def checkout(self, user_id):
+        return checkout_cart(user_id)
+
+
+class CacheCartStore:
+    """
+    Carts live in the cache and are written back to the database lazily.
+
+    Every edit updates the cached cart and marks the user dirty; a background
+    timer flushes dirty carts to Order/OrderItem in batches every
+    CART_WRITE_BEHIND_INTERVAL seconds, and checkout always flushes first.
+    Cached carts expire after CART_CACHE_TIMEOUT; a cart that is missing from
+    the cache is reloaded from the database. The cache must be shared between
+    workers (not locmem) when more than one process serves requests.
+    """
+
+    def __init__(self):
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._timer = None
+        atexit.register(self.flush_all)
+
+    def _key(self, user_id):
+        return f'cart:{user_id}:lines'
+
+    @contextmanager
+    def _user_lock(self, user_id):
+        """Serialise edits to one user's cached cart across threads and processes"""
+        lock_key = f'cart:{user_id}:lock'
+        deadline = time.monotonic() + settings.CART_LOCK_TIMEOUT
+        while not cache.add(lock_key, True, timeout=settings.CART_LOCK_TIMEOUT):
+            if time.monotonic() > deadline:
+                raise TimeoutError("Cart is busy, please retry")
+            time.sleep(0.005)
+        try:
+            yield
+        finally:
+            cache.delete(lock_key)
+
+    def _load(self, user_id):
+        """Return {product_id: quantity}, reloading from the database on a miss"""
+        key = self._key(user_id)
+        lines = cache.get(key)
+        if lines is None:
+            lines = {}
+            # The cached copy becomes the cart of record, so load it from the primary
+            with primary():
+                cart = get_open_cart(user_id)
+                if cart:
+                    lines = dict(OrderItem.objects.filter(order=cart).values_list('product_id', 'quantity'))
+            # Reads don't hold the user's lock: never overwrite a cart an edit saved meanwhile
+            if not cache.add(key, lines, timeout=settings.CART_CACHE_TIMEOUT):
+                lines = cache.get(key, lines)
+        return lines
+
+    def _save(self, user_id, lines):
+        cache.set(self._key(user_id), lines, timeout=settings.CART_CACHE_TIMEOUT)
+        bump_user_versions(user_id)
+        with self._dirty_lock:
+            self._dirty.add(user_id)
+            if self._timer is None:
+                self._timer = threading.Timer(settings.CART_WRITE_BEHIND_INTERVAL, self._flush_dirty)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _priced(self, lines, product_id):
+        """Return the formatted line for ``product_id`` (or None) and the cart total"""
+        items = format_priced_lines(lines)
+        total_price = sum((item["price"] * item["quantity"] for item in items), Decimal('0.00'))
+        item = next((item for item in items if item["id"] == product_id), None)
+        return item, total_price
+
+    def get_items(self, user_id):
+        return format_priced_lines(self._load(user_id))
+
+    async def aget_items(self, user_id):
+        lines = await cache.aget(self._key(user_id))
+        if lines is None:
+            lines = await sync_to_async(self._load)(user_id)
+        return format_priced_lines(lines, await aget_price_table())
+
+    def replace(self, user_id, cart_items):
+        table = get_price_table()
+        lines = {
+            product_id: quantity
+            for product_id, quantity in parse_cart_items(cart_items).items()
+            if product_id in table
+        }
+        with self._user_lock(user_id):
+            self._save(user_id, lines)
+
+    def add(self, user_id, product_id, quantity):
+        with self._user_lock(user_id):
+            lines = self._load(user_id)
+            lines[product_id] = lines.get(product_id, 0) + quantity
+            self._save(user_id, lines)
+        return self._priced(lines, product_id)
+
+    def set_quantity(self, user_id, product_id, quantity):
+        if quantity < 1:
+            return self.remove(user_id, product_id)
+        with self._user_lock(user_id):
+            lines = self._load(user_id)
+            if product_id not in lines:
+                return None, None
+            lines[product_id] = quantity
+            self._save(user_id, lines)
+        return self._priced(lines, product_id)
+
+    def remove(self, user_id, product_id):
+        with self._user_lock(user_id):
+            lines = self._load(user_id)
+            if lines.pop(product_id, None) is None:
+                return None, None
+            self._save(user_id, lines)
+        return self._priced(lines, product_id)
+
+    def _payload(self, lines):
+        return [{"id": product_id, "quantity": quantity} for product_id, quantity in lines.items()]
+
+    def flush(self, user_id):
+        """Write one user's cached cart to the database"""
+        with self._user_lock(user_id):
+            with self._dirty_lock:
+                self._dirty.discard(user_id)
+            lines = cache.get(self._key(user_id))
+            if lines is None:
+                return
+            with transaction.atomic():
+                cart = get_open_cart(user_id, create=bool(lines), lock=True)
+                if cart:
+                    replace_cart_items(cart, self._payload(lines))
+
+    def flush_all(self):
+        with self._dirty_lock:
+            dirty = list(self._dirty)
+        for user_id in dirty:
+            try:
+                self.flush(user_id)
+            except Exception:
+                logger.exception("Failed to write back the cart of user %s", user_id)
+
+    def _flush_dirty(self):
+        """Timer callback: flush one batch of dirty carts and reschedule if more remain"""
+        try:
+            with self._dirty_lock:
+                batch = list(self._dirty)[:settings.CART_WRITE_BEHIND_BATCH_SIZE]
+            for user_id in batch:
+                try:
+                    self.flush(user_id)
+                except Exception:
+                    # Leave it dirty so the next tick retries
+                    logger.exception("Failed to write back the cart of user %s", user_id)
+                    with self._dirty_lock:
+                        self._dirty.add(user_id)
+        finally:
+            connections.close_all()
+            with self._dirty_lock:
+                self._timer = None
+                if self._dirty:
+                    self._timer = threading.Timer(settings.CART_WRITE_BEHIND_INTERVAL, self._flush_dirty)
+                    self._timer.daemon = True
+                    self._timer.start()
+
+    def checkout(self, user_id):
+        """Flush the cached cart and complete it in the same transaction"""
+        with self._user_lock(user_id):
+            with self._dirty_lock:
+                self._dirty.discard(user_id)
+            lines = cache.get(self._key(user_id))
+            try:
+                with transaction.atomic():
+                    if lines is not None:
+                        cart = get_open_cart(user_id, create=bool(lines), lock=True)
+                        if cart:
+                            replace_cart_items(cart, self._payload(lines))
+                    order = checkout_cart(user_id)
+            except Exception:
+                # Nothing was written, keep the cached cart queued for write-back
+                if lines is not None:
+                    with self._dirty_lock:
+                        self._dirty.add(user_id)
+                raise
+            cache.delete(self._key(user_id))
+            # checkout_cart bumped the versions while the old lines were still cached
+            bump_user_versions(user_id)
+        return order
+
+
+CART_STORES = {
+    'db': DatabaseCartStore,
+    'cache': CacheCartStore,
+}
+
+_store = None
+
+
+def get_cart_store():
+    """Return the cart backend selected by settings.CART_BACKEND"""
+    global _store
+    if _store is None:
+        _store = CART_STORES[settings.CART_BACKEND]()
+    return _store
@@ -0,0 +1,91 @@
+import hashlib
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.http import http_date
+from bilandog.db_routing import primary
+from bilandog.renderers import dumps
+from .images import image_urls
+from .models import Product
+
+CATALOG_VERSION_KEY = 'catalog:version'
+CATALOG_PAYLOAD_KEY = 'catalog:products:{version}'
+
+# Last payload built or fetched by this process, as (version, entry)
+_local_payload = (None, None)
+
+
+def get_catalog_version():
+    """Return the current catalog version, starting a new one if the cache lost it"""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog payload; call after any product change"""
+    # Versions are nanosecond timestamps so they double as Last-Modified
+    version = max(time.time_ns(), (cache.get(CATALOG_VERSION_KEY) or 0) + 1)
+    cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+    return version
+
+
+def build_product_list():
+    """Format every product the way the product list endpoint returns them"""
+    product_list = []
+    for product in Product.objects.all():
+        image_url, srcset = image_urls(product.image_file, product.image_variants)
+        product_list.append({
+            "id": product.id,
+            "name": product.name,
+            "price": product.price,
+            "image_file": product.image_file,
+            "image_url": image_url,
+            "srcset": srcset,
+            "description": product.description
+        })
+    return product_list
+
+
+def get_product_list_payload():
+    """
+    Return the rendered product list as a dict with ``body``, ``etag`` and
+    ``last_modified``.
+
+    Entries are keyed on the catalog version, so a warm process answers from
+    memory with no database queries and one cache lookup for the version.
+    """
+    global _local_payload
+
+    version = get_catalog_version()
+    local_version, entry = _local_payload
+    if local_version == version:
+        return entry
+
+    key = CATALOG_PAYLOAD_KEY.format(version=version)
+    entry = cache.get(key)
+    if entry is None:
+        # Shared by every reader of this version, so never built from a lagging replica
+        with primary():
+            body = dumps(build_product_list())
+        entry = {
+            "body": body,
+            "etag": '"%s"' % hashlib.sha256(body).hexdigest()[:32],
+            "last_modified": http_date(version // 1_000_000_000),
+        }
+        cache.set(key, entry, timeout=settings.CATALOG_CACHE_TIMEOUT)
+
+    _local_payload = (version, entry)
+    return entry
+
+
+async def aget_product_list_payload():
+    """Async ``get_product_list_payload``; only a stale process leaves the event loop"""
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    local_version, entry = _local_payload
+    if version is not None and local_version == version:
+        return entry
+    return await sync_to_async(get_product_list_payload)()
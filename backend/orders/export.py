@@ -0,0 +1,92 @@
+import csv
+import heapq
+from itertools import groupby
+from django.conf import settings
+from bilandog.renderers import dumps
+from .models import ArchivedOrderItem, OrderItem
+
+EXPORT_FIELDS = [
+    'order_id', 'created_at', 'completed_at', 'total_price',
+    'product_id', 'product_name', 'quantity', 'price_at_purchase',
+]
+
+
+# Spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+class Echo:
+    """File-like object that hands back whatever csv.writer writes to it"""
+
+    def write(self, value):
+        return value
+
+
+def _tier_rows(items, since, until):
+    if since:
+        items = items.filter(order__completed_at__gte=since)
+    if until:
+        items = items.filter(order__completed_at__lt=until)
+    return items.order_by('order__completed_at', 'order_id', 'id').values_list(
+        'order_id', 'order__created_at', 'order__completed_at', 'order__total_price',
+        'product_id', 'product__name', 'quantity', 'price_at_purchase',
+    ).iterator(chunk_size=settings.ORDER_EXPORT_CHUNK_SIZE)
+
+
+def history_rows(user, since=None, until=None):
+    """
+    Yield one tuple per completed order line, oldest order first.
+
+    Rows are read through ``iterator()`` in chunks, which uses a server-side
+    cursor on PostgreSQL, so memory stays flat however long the history is.
+    Archived and recent orders are read side by side and merged in order.
+    """
+    archived = _tier_rows(ArchivedOrderItem.objects.filter(order__user=user), since, until)
+    recent = _tier_rows(OrderItem.objects.filter(order__user=user, order__is_completed=True), since, until)
+    # An order lives in exactly one tier, so its lines stay together
+    return heapq.merge(archived, recent, key=lambda row: (row[2], row[0]))
+
+
+def csv_safe(value):
+    """Quote text a spreadsheet would evaluate, such as a product named ``=HYPERLINK(...)``"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def stream_csv(rows):
+    """Render rows as CSV, one line per order item"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(EXPORT_FIELDS)
+    for order_id, created_at, completed_at, total_price, product_id, product_name, *item in rows:
+        yield writer.writerow([
+            order_id, created_at.isoformat(), completed_at.isoformat(), total_price,
+            product_id, csv_safe(product_name), *item
+        ])
+
+
+def stream_ndjson(rows):
+    """Render rows as newline-delimited JSON, one object per order"""
+    for (order_id, created_at, completed_at, total_price), lines in groupby(rows, key=lambda row: row[:4]):
+        order = {
+            "id": order_id,
+            "created_at": created_at,
+            "completed_at": completed_at,
+            "total_price": total_price,
+            "order_items": [
+                {
+                    "product_id": product_id,
+                    "product_name": product_name,
+                    "quantity": quantity,
+                    "price_at_purchase": price_at_purchase,
+                }
+                for *_, product_id, product_name, quantity, price_at_purchase in lines
+            ],
+        }
+        yield dumps(order) + b'\n'
+
+
+EXPORT_FORMATS = {
+    'csv': (stream_csv, 'text/csv'),
+    'ndjson': (stream_ndjson, 'application/x-ndjson'),
+}
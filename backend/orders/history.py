@@ -0,0 +1,111 @@
+from django.db.models import Prefetch, Q
+from django.utils.dateparse import parse_datetime
+from .archive import archive_horizon
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from .pagination import InvalidCursor, encode_cursor, decode_cursor
+
+
+def _after_cursor(orders, cursor):
+    """Continue strictly after the last (completed_at, id) of the previous page"""
+    try:
+        completed_at, order_id = decode_cursor(cursor, 2)
+        completed_at, order_id = parse_datetime(completed_at), int(order_id)
+    except ValueError as e:
+        raise InvalidCursor(str(e))
+    if completed_at is None:
+        raise InvalidCursor("Invalid cursor")
+    return orders.filter(
+        Q(completed_at__lt=completed_at) |
+        Q(completed_at=completed_at, id__lt=order_id)
+    )
+
+
+def history_orders(user_id, cursor=None):
+    """
+    Completed orders of a user, newest first, with their items prefetched.
+
+    Returns a ``(recent, archived)`` pair of querysets over Order and
+    ArchivedOrder, both in (completed_at, id) keyset order: with a ``cursor``
+    they continue strictly after the last order of the previous page. Use
+    ``merge_history`` to combine them into a page. Raises InvalidCursor.
+    """
+    recent = Order.objects.filter(
+        user_id=user_id,
+        is_completed=True
+    ).order_by('-completed_at', '-id').prefetch_related(
+        Prefetch('order_items', queryset=OrderItem.objects.select_related('product'))
+    )
+    archived = ArchivedOrder.objects.filter(user_id=user_id).order_by('-completed_at', '-id').prefetch_related(
+        Prefetch('order_items', queryset=ArchivedOrderItem.objects.order_by('id').select_related('product'))
+    )
+
+    if cursor:
+        recent, archived = _after_cursor(recent, cursor), _after_cursor(archived, cursor)
+    return recent, archived
+
+
+def needs_archive(recent, limit):
+    """Whether archived orders can belong among the first ``limit`` orders, given ``limit`` recent ones"""
+    # The archive only holds orders older than the horizon
+    return len(recent) < limit or recent[-1].completed_at < archive_horizon()
+
+
+def merge_history(recent, archived, limit):
+    """The first ``limit`` orders of both tiers, newest first"""
+    orders = sorted(recent + archived, key=lambda order: (order.completed_at, order.id), reverse=True)
+    return orders[:limit]
+
+
+def history_page(user_id, cursor, page_size):
+    """One formatted page of a user's history across both tiers. Raises InvalidCursor"""
+    recent, archived = history_orders(user_id, cursor)
+    # Fetch one extra order to learn whether another page exists
+    limit = page_size + 1
+    orders = list(recent[:limit])
+    if needs_archive(orders, limit):
+        orders = merge_history(orders, list(archived[:limit]), limit)
+    return format_history_page(orders, page_size)
+
+
+async def ahistory_page(user_id, cursor, page_size):
+    """Async ``history_page``"""
+    recent, archived = history_orders(user_id, cursor)
+    limit = page_size + 1
+    orders = [order async for order in recent[:limit]]
+    if needs_archive(orders, limit):
+        orders = merge_history(orders, [order async for order in archived[:limit]], limit)
+    return format_history_page(orders, page_size)
+
+
+def format_history_page(orders, page_size):
+    """Format up to ``page_size`` orders; fetch one extra to learn whether another page exists"""
+    next_cursor = None
+    if len(orders) > page_size:
+        orders = orders[:page_size]
+        next_cursor = encode_cursor(orders[-1].completed_at.isoformat(), orders[-1].id)
+
+    # Format orders for response
+    order_history = []
+    for order in orders:
+        order_items = []
+
+        for item in order.order_items.all():
+            order_items.append({
+                "id": item.id,
+                "product_name": item.product.name,
+                "quantity": item.quantity,
+                "price_at_purchase": item.price_at_purchase
+            })
+
+        order_history.append({
+            "id": order.id,
+            "created_at": order.created_at,
+            "completed_at": order.completed_at,
+            "total_price": order.total_price,
+            "order_items": order_items
+        })
+
+    return {
+        "results": order_history,
+        "next_cursor": next_cursor
+    }
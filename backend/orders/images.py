@@ -0,0 +1,125 @@
+"""
+Responsive WebP variants of product images.
+
+Originals live in ``PRODUCT_IMAGE_SOURCE_DIR`` under the product's
+``image_file`` name. Each is resized to every ``PRODUCT_IMAGE_WIDTHS`` width it
+is at least as wide as (never upscaled), encoded as WebP and written to
+``PRODUCT_IMAGE_ROOT`` as ``<stem>-<hash>-<width>w.webp``, where the hash is
+taken over the original's bytes. Replacing an original gives its variants new
+names, so a URL always means the same bytes and can be cached forever.
+
+Products record the hash and widths in ``image_variants``, so the APIs build
+``srcset`` strings without touching the filesystem.
+"""
+import hashlib
+import os
+from io import BytesIO
+from pathlib import Path
+from django.conf import settings
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - only needed to generate variants
+    Image = ImageOps = None
+
+HASH_LENGTH = 16
+
+
+class ImageVariantError(Exception):
+    """The variants of an image could not be generated"""
+
+
+class MissingImageError(ImageVariantError):
+    """The original has not been uploaded to PRODUCT_IMAGE_SOURCE_DIR"""
+
+
+def content_hash(data):
+    """Hash of an original's bytes and the encoding settings, used in variant names"""
+    digest = hashlib.sha256(data)
+    digest.update(b'webp:q%d' % settings.PRODUCT_IMAGE_QUALITY)
+    return digest.hexdigest()[:HASH_LENGTH]
+
+
+def variant_name(image_file, digest, width):
+    return f'{Path(image_file).stem}-{digest}-{width}w.webp'
+
+
+def target_widths(original_width):
+    """Configured widths that don't upscale, or the original width if it is narrower than all of them"""
+    widths = sorted(width for width in set(settings.PRODUCT_IMAGE_WIDTHS) if width <= original_width)
+    return widths or [original_width]
+
+
+def _variants_exist(image_file, variants):
+    root = Path(settings.PRODUCT_IMAGE_ROOT)
+    return all(
+        (root / variant_name(image_file, variants['hash'], width)).exists()
+        for width in variants['widths']
+    )
+
+
+def generate_variants(image_file, current=None, force=False):
+    """
+    Write the variants of one original and return them as ``{"hash", "widths"}``.
+
+    ``current`` is the product's stored ``image_variants``: when the original
+    still hashes the same and its files exist, it is returned without decoding
+    the image. Raises ImageVariantError, MissingImageError if there is no original.
+    """
+    # image_file is a bare name inside the source directory
+    if not image_file or Path(image_file).name != image_file:
+        raise ImageVariantError(f"Invalid image file name: {image_file!r}")
+
+    source = Path(settings.PRODUCT_IMAGE_SOURCE_DIR) / image_file
+    try:
+        data = source.read_bytes()
+    except FileNotFoundError:
+        raise MissingImageError(f"No original at {source}")
+    except OSError as e:
+        raise ImageVariantError(f"Cannot read {source}: {e}")
+
+    digest = content_hash(data)
+    if not force and current and current.get('hash') == digest and _variants_exist(image_file, current):
+        return current
+
+    if Image is None:
+        raise ImageVariantError("Pillow is required to generate image variants")
+
+    root = Path(settings.PRODUCT_IMAGE_ROOT)
+    root.mkdir(parents=True, exist_ok=True)
+    try:
+        with Image.open(BytesIO(data)) as opened:
+            original = ImageOps.exif_transpose(opened)
+            if original.mode not in ('RGB', 'RGBA'):
+                has_alpha = 'A' in original.getbands() or 'transparency' in original.info
+                original = original.convert('RGBA' if has_alpha else 'RGB')
+
+            widths = target_widths(original.width)
+            for width in widths:
+                path = root / variant_name(image_file, digest, width)
+                if path.exists() and not force:
+                    continue  # Same name, same bytes
+                height = max(1, round(original.height * width / original.width))
+                resized = original if width == original.width else original.resize(
+                    (width, height), Image.LANCZOS
+                )
+                # Rename into place so a half-written file is never served
+                partial = path.with_name(path.name + '.partial')
+                resized.save(partial, 'WEBP', quality=settings.PRODUCT_IMAGE_QUALITY, method=6)
+                os.replace(partial, path)
+    except OSError as e:
+        raise ImageVariantError(f"Cannot convert {source}: {e}")
+
+    return {"hash": digest, "widths": widths}
+
+
+def image_urls(image_file, variants):
+    """Return ``(src, srcset)`` for a product's variants, or ``(None, None)`` before they exist"""
+    if not variants:
+        return None, None
+    base = settings.PRODUCT_IMAGE_URL
+    candidates = [
+        (f'{base}{variant_name(image_file, variants["hash"], width)}', width)
+        for width in variants['widths']
+    ]
+    return candidates[-1][0], ', '.join(f'{url} {width}w' for url, width in candidates)
@@ -0,0 +1,81 @@
+"""
+Background jobs for completed orders, queued by checkout once it commits,
+image variants of saved products, and periodic cart and order maintenance
+(see JOBS_SCHEDULE).
+"""
+import logging
+from django.conf import settings
+from django.core.mail import send_mail
+from jobs.runner import enqueue_all_on_commit, job
+from .analytics import roll_up_orders
+from .archive import archive_orders
+from .catalog import bump_catalog_version
+from .images import ImageVariantError, MissingImageError, generate_variants
+from .models import Order, OrderItem, Product
+from .reaper import reap_abandoned_carts
+
+logger = logging.getLogger(__name__)
+
+
+def order_completed(order_id):
+    """Queue the follow-up work of a checkout; call inside its transaction"""
+    enqueue_all_on_commit([
+        ('orders.send_receipt', {'order_id': order_id}),
+        ('orders.roll_up_sales', {'order_id': order_id}),
+    ])
+
+
+@job('orders.send_receipt')
+def send_receipt(order_id):
+    """Mail the order's lines and total to the customer"""
+    order = Order.objects.select_related('user').get(pk=order_id)
+    if not order.user.email:
+        return
+
+    lines = OrderItem.objects.filter(order_id=order_id).order_by('id').values_list(
+        'product__name', 'quantity', 'price_at_purchase'
+    )
+    body = '\n'.join(
+        [f"Thank you for your order, {order.user.username}!", ""]
+        + [f"{quantity} x {name} @ ₱{price}" for name, quantity, price in lines]
+        + ["", f"Total: ₱{order.total_price}"]
+    )
+    send_mail(f"Your Bilandog order #{order.id}", body, None, [order.user.email])
+
+
+@job('orders.roll_up_sales')
+def roll_up_sales(order_id):
+    """Add the order to the daily sales rollups; a repeat run counts nothing twice"""
+    roll_up_orders([order_id])
+
+
+@job('orders.reap_abandoned_carts')
+def reap_carts():
+    """Delete a bounded number of abandoned carts; the next scheduled run picks up the rest"""
+    reap_abandoned_carts(max_batches=settings.CART_REAPER_MAX_BATCHES)
+
+
+@job('orders.archive_orders')
+def archive_old_orders():
+    """Move a bounded number of old orders to the archive; the next scheduled run moves the rest"""
+    archive_orders(max_batches=settings.ORDER_ARCHIVE_MAX_BATCHES)
+
+
+@job('orders.refresh_image_variants')
+def refresh_image_variants(product_id):
+    """Generate a product's image variants, queued when its original is new or changed"""
+    product = Product.objects.filter(pk=product_id).values('image_file', 'image_variants').first()
+    if product is None:
+        return
+    try:
+        variants = generate_variants(product['image_file'], product['image_variants'])
+    except MissingImageError:
+        return  # Not uploaded yet; generate_image_variants picks it up later
+    except ImageVariantError as e:
+        # Retrying won't fix a broken original
+        logger.warning("No image variants for product %s: %s", product_id, e)
+        return
+    if variants != product['image_variants']:
+        # Unless the original was replaced again meanwhile, which queued another run
+        if Product.objects.filter(pk=product_id, image_file=product['image_file']).update(image_variants=variants):
+            bump_catalog_version()
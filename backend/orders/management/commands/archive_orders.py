@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from orders.archive import archivable_orders, archive_orders
+
+
+class Command(BaseCommand):
+    help = (
+        "Move completed orders older than ORDER_ARCHIVE_AFTER_DAYS into the archive "
+        "tables, in small batches with a pause between them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=settings.ORDER_ARCHIVE_BATCH_SIZE,
+                            help="Orders moved per transaction")
+        parser.add_argument('--pause', type=float, default=settings.ORDER_ARCHIVE_PAUSE,
+                            help="Seconds to sleep between batches")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the orders to archive")
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        if options['dry_run']:
+            self.stdout.write(f"{archivable_orders().count()} orders to archive")
+            return
+
+        archived = archive_orders(
+            options['batch_size'], options['pause'],
+            progress=lambda count: self.stdout.write(f"{count} orders archived so far")
+        )
+        self.stdout.write(f"{archived} orders archived")
@@ -0,0 +1,48 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from orders.analytics import roll_up_archived_orders, roll_up_orders
+from orders.models import ArchivedOrder, DailyProductSales, Order
+
+
+class Command(BaseCommand):
+    help = (
+        "Add completed orders that aren't in the daily sales rollups yet, in batches. "
+        "With --rebuild the rollups are cleared and rebuilt from every completed order."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true',
+                            help="Clear the rollups and count every completed order again")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Orders per transaction")
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        if options['rebuild']:
+            # Together, so no order is ever both counted and marked pending
+            with transaction.atomic():
+                DailyProductSales.objects.all().delete()
+                Order.objects.filter(rolled_up=True).update(rolled_up=False)
+
+            # Before the recent orders: nothing is archived until it is counted again
+            archived = ArchivedOrder.objects.order_by('id')
+            last_id = 0
+            total = 0
+            while ids := list(archived.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size]):
+                total += roll_up_archived_orders(ids)
+                last_id = ids[-1]
+            self.stdout.write(f"{total} archived orders rolled up")
+
+        # Walks order_rollup_pending_idx; each batch commits on its own
+        pending = Order.objects.filter(is_completed=True, rolled_up=False).order_by('id')
+        last_id = 0
+        total = 0
+        while ids := list(pending.filter(id__gt=last_id).values_list('id', flat=True)[:batch_size]):
+            total += roll_up_orders(ids)
+            last_id = ids[-1]
+            if options['verbosity'] > 1:
+                self.stdout.write(f"{total} orders rolled up (through order {last_id})")
+
+        self.stdout.write(f"{total} orders rolled up")
@@ -0,0 +1,389 @@
+import asyncio
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient, Client
+from django.test.utils import (
+    CaptureQueriesContext, setup_test_environment, teardown_test_environment
+)
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework_simplejwt.tokens import RefreshToken
+from bilandog.renderers import EXACT_DECIMALS, HAS_ORJSON, FastJSONRenderer
+from users.models import CustomUser
+from orders.catalog import build_product_list
+from orders.models import Product, Order, OrderItem
+
+BENCHMARK_PASSWORD = 'benchmark-password'
+
+# Maximum SQL queries a single request to each endpoint may issue
+DEFAULT_QUERY_BUDGETS = {
+    'products': 0,
+    'cart_get': 3,
+    'cart_post': 8,
+    'checkout': 4,
+    'history': 3,
+    'login': 1,
+}
+
+# Transaction control statements differ between backends, so they are not counted
+TRANSACTION_STATEMENTS = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE SAVEPOINT')
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(latencies, wall):
+    """Latency percentiles (milliseconds) and throughput of one measured run"""
+    return {
+        'requests': len(latencies),
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None,
+        'latency_ms': {
+            'p50': round(percentile(latencies, 50), 3),
+            'p95': round(percentile(latencies, 95), 3),
+            'p99': round(percentile(latencies, 99), 3),
+            'mean': round(statistics.mean(latencies), 3),
+        },
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway database with synthetic data, drive the orders and users "
+        "APIs through the test client and report latency, throughput and queries "
+        "per request as JSON."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help="Number of synthetic users")
+        parser.add_argument('--products', type=int, default=100, help="Number of products in the catalog")
+        parser.add_argument('--history', type=int, default=50, help="Completed orders per user")
+        parser.add_argument('--lines', type=int, default=5, help="Lines per cart and per order")
+        parser.add_argument('--requests', type=int, default=200, help="Measured requests per endpoint")
+        parser.add_argument('--login-requests', type=int, default=20,
+                            help="Measured login requests (password hashing is slow by design)")
+        parser.add_argument('--concurrency', type=int, default=4, help="Concurrent clients per endpoint")
+        parser.add_argument('--endpoint', action='append', dest='endpoints',
+                            help="Only run this endpoint (repeatable)")
+        parser.add_argument('--budget', action='append', default=[], metavar='ENDPOINT=QUERIES',
+                            help="Override the query budget of an endpoint")
+        parser.add_argument('--no-budgets', action='store_true', help="Report only, never fail")
+        parser.add_argument('--output', help="Write the JSON report to this file instead of stdout")
+        parser.add_argument('--seed', type=int, default=0, help="Random seed for the synthetic data")
+        parser.add_argument('--renderers', type=int, default=0, metavar='ROUNDS',
+                            help="Instead of the endpoints, time DRF's JSONRenderer against the "
+                                 "project renderer on real endpoint payloads for ROUNDS renders each")
+        parser.add_argument('--compare-async', type=int, default=0, metavar='CONNECTIONS',
+                            help="Instead of the endpoints, drive the sync and async read views through "
+                                 "Django's ASGI handler with CONNECTIONS concurrent connections")
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.random = random.Random(options['seed'])
+
+        budgets = dict(DEFAULT_QUERY_BUDGETS)
+        for override in options['budget']:
+            endpoint, _, queries = override.partition('=')
+            if endpoint not in budgets or not queries.isdigit():
+                raise CommandError(f"Invalid budget '{override}', expected ENDPOINT=QUERIES")
+            budgets[endpoint] = int(queries)
+
+        if options['users'] < options['concurrency']:
+            raise CommandError("--users must be at least --concurrency")
+        if options['lines'] > options['products']:
+            raise CommandError("--lines cannot exceed --products")
+
+        scenarios = self.get_scenarios()
+        selected = options['endpoints'] or list(scenarios)
+        unknown = set(selected) - set(scenarios)
+        if unknown:
+            raise CommandError(f"Unknown endpoint(s): {', '.join(sorted(unknown))}")
+
+        setup_test_environment()
+        old_name = self.setup_database()
+        try:
+            self.seed()
+            if options['renderers']:
+                report = json.dumps(self.compare_renderers(options['renderers']), indent=2)
+                self.stdout.write(report)
+                return
+            if options['compare_async']:
+                report = json.dumps(self.compare_async(options['compare_async']), indent=2)
+                self.stdout.write(report)
+                return
+            results = {}
+            for name in selected:
+                count = options['login_requests'] if name == 'login' else options['requests']
+                results[name] = self.run_scenario(name, scenarios[name], count)
+        finally:
+            connections.close_all()
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        violations = []
+        for name, result in results.items():
+            result['query_budget'] = budgets[name]
+            if result['queries']['max'] > budgets[name]:
+                violations.append(
+                    f"{name}: {result['queries']['max']} queries per request, budget is {budgets[name]}"
+                )
+
+        report = json.dumps({
+            'database': connection.vendor,
+            'dataset': {
+                key: options[key] for key in ('users', 'products', 'history', 'lines', 'concurrency')
+            },
+            'endpoints': results,
+            'budget_violations': violations,
+        }, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as report_file:
+                report_file.write(report + '\n')
+        else:
+            self.stdout.write(report)
+
+        if violations and not options['no_budgets']:
+            raise CommandError("Query budget exceeded:\n" + '\n'.join(violations))
+
+    def setup_database(self):
+        """Create a fresh test database so benchmarks never touch real data"""
+        settings_dict = connection.settings_dict
+        if connection.vendor == 'sqlite':
+            # A file database (not the shared in-memory one) so worker threads can
+            # all connect, with immediate transactions so writers queue instead of failing
+            settings_dict.setdefault('TEST', {})['NAME'] = str(settings.BASE_DIR / 'benchmark.sqlite3')
+            settings_dict.setdefault('OPTIONS', {}).update({'timeout': 30, 'transaction_mode': 'IMMEDIATE'})
+        old_name = settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        # Replicas read the same test database, as the test runner does with TEST['MIRROR']
+        for alias in settings.DATABASE_REPLICAS:
+            connections[alias].creation.set_as_test_mirror(connection.settings_dict)
+        return old_name
+
+    def seed(self):
+        """Bulk-load users, products, open carts and completed order histories"""
+        options = self.options
+        password = make_password(BENCHMARK_PASSWORD)
+
+        CustomUser.objects.bulk_create(
+            CustomUser(username=f'bench{i}', email=f'bench{i}@example.com', password=password)
+            for i in range(options['users'])
+        )
+        Product.objects.bulk_create(
+            Product(
+                name=f'Hotdog {i}',
+                description=f'Synthetic benchmark product number {i}',
+                price=Decimal(self.random.randint(50, 5000)) / 100,
+                image_file=f'product{i}.png',
+            )
+            for i in range(options['products'])
+        )
+        self.users = list(CustomUser.objects.order_by('id'))
+        self.products = list(Product.objects.values_list('id', 'price'))
+        self.tokens = {user.id: str(RefreshToken.for_user(user).access_token) for user in self.users}
+
+        now = timezone.now()
+        orders, lines = [], []
+        for user in self.users:
+            for i in range(options['history'] + 1):
+                # The first order of every user stays open as their cart
+                order_lines = self.random_lines()
+                orders.append(Order(
+                    user=user,
+                    total_price=sum(price * quantity for _, price, quantity in order_lines),
+                    is_completed=i > 0,
+                    completed_at=now - timedelta(hours=i) if i else None,
+                ))
+                lines.append(order_lines)
+        orders = Order.objects.bulk_create(orders, batch_size=1000)
+
+        OrderItem.objects.bulk_create(
+            (
+                OrderItem(order_id=order.id, product_id=product_id, quantity=quantity, price_at_purchase=price)
+                for order, order_lines in zip(orders, lines)
+                for product_id, price, quantity in order_lines
+            ),
+            batch_size=5000
+        )
+
+    def random_lines(self):
+        return [
+            (product_id, price, self.random.randint(1, 5))
+            for product_id, price in self.random.sample(self.products, self.options['lines'])
+        ]
+
+    def random_cart(self):
+        return [
+            {'id': product_id, 'quantity': quantity, 'price': str(price)}
+            for product_id, price, quantity in self.random_lines()
+        ]
+
+    def get_scenarios(self):
+        """Map endpoint names to callables issuing one measured request"""
+
+        def products(client, user):
+            return lambda: Client().get('/orders/products/')
+
+        def cart_get(client, user):
+            return lambda: client.get('/orders/cart/')
+
+        def cart_post(client, user):
+            payload = {'cart_items': self.random_cart()}
+            return lambda: client.post('/orders/cart/', payload, content_type='application/json')
+
+        def checkout(client, user):
+            # Refill the cart first so every checkout has something to complete
+            client.post('/orders/cart/', {'cart_items': self.random_cart()}, content_type='application/json')
+            return lambda: client.post('/orders/checkout/')
+
+        def history(client, user):
+            return lambda: client.get('/orders/history/')
+
+        def login(client, user):
+            payload = {'username': user.username, 'password': BENCHMARK_PASSWORD}
+            return lambda: Client().post('/users/login/', payload, content_type='application/json')
+
+        return {
+            'products': products,
+            'cart_get': cart_get,
+            'cart_post': cart_post,
+            'checkout': checkout,
+            'history': history,
+            'login': login,
+        }
+
+    def compare_renderers(self, rounds):
+        """Render the payloads the endpoints actually produce with each renderer"""
+        user = self.users[0]
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {self.tokens[user.id]}')
+        payloads = {
+            'products': build_product_list(),
+            'cart_get': client.get('/orders/cart/').data,
+            'history': client.get('/orders/history/', {'page_size': 100}).data,
+        }
+        candidates = {
+            'drf_json': JSONRenderer(),
+            'fast_json': FastJSONRenderer(),
+        }
+
+        results = {}
+        for payload_name, payload in payloads.items():
+            timings = {}
+            for renderer_name, renderer in candidates.items():
+                body = renderer.render(payload)
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    renderer.render(payload)
+                elapsed = time.perf_counter() - start
+                timings[renderer_name] = {
+                    'bytes': len(body),
+                    'mean_us': round(elapsed / rounds * 1_000_000, 2),
+                }
+            timings['speedup'] = round(timings['drf_json']['mean_us'] / timings['fast_json']['mean_us'], 2)
+            results[payload_name] = timings
+        return {'orjson': HAS_ORJSON, 'exact_decimals': EXACT_DECIMALS, 'rounds': rounds, 'payloads': results}
+
+    def compare_async(self, concurrency):
+        """
+        Run the read endpoints through the ASGI handler, sync views against their
+        async variants, with ``concurrency`` requests in flight at once.
+
+        Sync views run in Django's thread-sensitive executor as they would under
+        an ASGI server; async views stay on the event loop between queries.
+        """
+        endpoints = {
+            'products': ('/orders/products/', '/orders/async/products/'),
+            'cart_get': ('/orders/cart/', '/orders/async/cart/'),
+            'history': ('/orders/history/', '/orders/async/history/'),
+        }
+        results = {}
+        for name, (sync_path, async_path) in endpoints.items():
+            results[name] = {
+                'sync': async_to_sync(self.drive_asgi)(sync_path, concurrency),
+                'async': async_to_sync(self.drive_asgi)(async_path, concurrency),
+            }
+            results[name]['speedup'] = round(
+                results[name]['async']['throughput_rps'] / results[name]['sync']['throughput_rps'], 2
+            )
+        return {'connections': concurrency, 'requests': self.options['requests'], 'endpoints': results}
+
+    async def drive_asgi(self, path, concurrency):
+        client = AsyncClient()
+        count = self.options['requests']
+        pending = iter(range(count))
+        latencies = []
+
+        async def connection():
+            # Connections share one request counter, like clients of one server
+            for n in pending:
+                user = self.users[n % len(self.users)]
+                headers = {'Authorization': f'Bearer {self.tokens[user.id]}'}
+                start = time.perf_counter()
+                response = await client.get(path, headers=headers)
+                elapsed = time.perf_counter() - start
+                if response.status_code >= 400:
+                    raise CommandError(f"{path} returned {response.status_code}: {response.content[:200]!r}")
+                latencies.append(elapsed * 1000)
+
+        # One unmeasured request so caches are warm, as they would be in production
+        await client.get(path, headers={'Authorization': f'Bearer {self.tokens[self.users[0].id]}'})
+
+        start = time.perf_counter()
+        await asyncio.gather(*(connection() for _ in range(concurrency)))
+        return summarize(latencies, time.perf_counter() - start)
+
+    def run_scenario(self, name, prepare, count):
+        concurrency = max(1, self.options['concurrency'])
+
+        def worker(index):
+            # Each worker owns a disjoint set of users so checkouts never race
+            users = self.users[index::concurrency]
+            samples = []
+            try:
+                for n in range(index, count, concurrency):
+                    user = users[n // concurrency % len(users)]
+                    client = Client(HTTP_AUTHORIZATION=f'Bearer {self.tokens[user.id]}')
+                    request = prepare(client, user)
+                    with CaptureQueriesContext(connections['default']) as queries:
+                        start = time.perf_counter()
+                        response = request()
+                        elapsed = time.perf_counter() - start
+                    if response.status_code >= 400:
+                        raise CommandError(f"{name} returned {response.status_code}: {response.content[:200]!r}")
+                    counted = [
+                        query for query in queries.captured_queries
+                        if not query['sql'].upper().startswith(TRANSACTION_STATEMENTS)
+                    ]
+                    samples.append((elapsed, len(counted)))
+            finally:
+                connections.close_all()
+            return samples
+
+        # One unmeasured request so caches are warm, as they would be in production
+        worker_user = self.users[0]
+        prepare(Client(HTTP_AUTHORIZATION=f'Bearer {self.tokens[worker_user.id]}'), worker_user)()
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            samples = [sample for batch in executor.map(worker, range(concurrency)) for sample in batch]
+        wall = time.perf_counter() - start
+
+        result = summarize([elapsed * 1000 for elapsed, _ in samples], wall)
+        queries = [count for _, count in samples]
+        result['queries'] = {
+            'mean': round(statistics.mean(queries), 2),
+            'max': max(queries),
+        }
+        return result
@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from bilandog.caching import process_local_cache_warning
+from orders.catalog import bump_catalog_version
+from orders.images import Image, ImageVariantError, generate_variants
+from orders.models import Product
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate the resized WebP variants of every product image and record them "
+        "on the products. Originals that haven't changed are skipped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--product', type=int, action='append', dest='products', metavar='ID',
+                            help="Only this product (repeatable)")
+        parser.add_argument('--force', action='store_true',
+                            help="Re-encode variants even when their files already exist")
+
+    def handle(self, *args, **options):
+        if Image is None:
+            raise CommandError("Pillow is required to generate image variants")
+
+        products = Product.objects.order_by('id')
+        if options['products']:
+            products = products.filter(id__in=options['products'])
+
+        # Products sharing an original share its variants
+        generated = {}
+        changed = []
+        failed = 0
+        for product in products:
+            name = product.image_file
+            try:
+                if name not in generated:
+                    generated[name] = generate_variants(name, product.image_variants, options['force'])
+            except ImageVariantError as e:
+                generated[name] = None
+                self.stderr.write(f"Product {product.id}: {e}")
+            variants = generated[name]
+            if variants is None:
+                failed += 1
+            elif variants != product.image_variants:
+                product.image_variants = variants
+                changed.append(product)
+
+        # One write and one catalog invalidation for the whole run, bypassing the save hook
+        Product.objects.bulk_update(changed, ['image_variants'], batch_size=500)
+        if changed:
+            bump_catalog_version()
+            warning = process_local_cache_warning("the new image variants")
+            if warning:
+                self.stderr.write(self.style.WARNING(warning))
+
+        self.stdout.write(
+            f"{len(generated)} image(s), {len(changed)} product(s) updated, {failed} failed"
+        )
@@ -0,0 +1,157 @@
+import csv
+import json
+import sys
+from itertools import islice
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from bilandog.caching import process_local_cache_warning
+from jobs.runner import enqueue_all_on_commit
+from orders.catalog import bump_catalog_version
+from orders.models import Product
+
+# Feed columns, besides the sku every row is keyed on
+FEED_FIELDS = ('name', 'description', 'price', 'image_file')
+FORMATS = ('csv', 'jsonl')
+
+
+def read_csv(stream):
+    # Line numbers count the header, so they match what an editor shows
+    for line, row in enumerate(csv.DictReader(stream), start=2):
+        yield line, row
+
+
+def read_jsonl(stream):
+    for line, text in enumerate(stream, start=1):
+        if not text.strip():
+            continue
+        try:
+            row = json.loads(text)
+        except ValueError as e:
+            yield line, e
+            continue
+        yield line, row if isinstance(row, dict) else ValueError("Expected a JSON object")
+
+
+READERS = {'csv': read_csv, 'jsonl': read_jsonl}
+
+
+def describe(error):
+    """A ValidationError as ``field: message`` parts, so a bad row says which column is wrong"""
+    if not hasattr(error, 'error_dict'):
+        return '; '.join(error.messages)
+    return '; '.join(
+        message if field == NON_FIELD_ERRORS else f"{field}: {message}"
+        for field, messages in error.message_dict.items()
+        for message in messages
+    )
+
+
+class Command(BaseCommand):
+    help = (
+        "Insert or update products from a CSV or JSON Lines supplier feed, keyed on sku. "
+        "The feed is streamed in batches, each written with one bulk upsert. New or "
+        "replaced images get their variants from background jobs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Feed file, or - to read standard input")
+        parser.add_argument('--format', choices=FORMATS,
+                            help="Feed format (default: from the file extension)")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per upsert")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        feed_format = options['format'] or path.rsplit('.', 1)[-1].lower()
+        if feed_format not in FORMATS:
+            raise CommandError(f"Unknown feed format {feed_format!r}, pass --format {' or '.join(FORMATS)}")
+        if options['batch_size'] < 1:
+            raise CommandError("--batch-size must be at least 1")
+
+        self.counts = dict.fromkeys(['inserted', 'updated', 'unchanged', 'skipped'], 0)
+        self.images = 0
+        try:
+            if path == '-':
+                self.load(sys.stdin, feed_format, options['batch_size'])
+            else:
+                try:
+                    with open(path, newline='', encoding='utf-8-sig') as stream:
+                        self.load(stream, feed_format, options['batch_size'])
+                except OSError as e:
+                    raise CommandError(f"Cannot read {path}: {e}")
+        finally:
+            # Once per import, also when it stopped part way through
+            if self.counts['inserted'] or self.counts['updated']:
+                bump_catalog_version()
+                warning = process_local_cache_warning("the imported products and prices")
+                if warning:
+                    self.stderr.write(self.style.WARNING(warning))
+
+        self.stdout.write(', '.join(f"{count} {name}" for name, count in self.counts.items()))
+        if self.images:
+            self.stdout.write(f"{self.images} image variant job(s) queued")
+
+    def load(self, stream, feed_format, batch_size):
+        rows = self.parse(READERS[feed_format](stream))
+        while batch := list(islice(rows, batch_size)):
+            self.upsert(batch)
+
+    def parse(self, rows):
+        """Yield a validated, unsaved Product for each good row, reporting the others"""
+        for line, row in rows:
+            try:
+                if isinstance(row, Exception):
+                    raise ValidationError(str(row))
+                sku = '' if row.get('sku') is None else str(row['sku']).strip()
+                if not sku:
+                    raise ValidationError({'sku': "This field cannot be blank."})
+                product = Product(sku=sku, **{
+                    field: '' if row.get(field) is None else str(row[field]).strip()
+                    for field in FEED_FIELDS
+                })
+                product.clean_fields(exclude=['image_variants'])
+            except ValidationError as e:
+                self.counts['skipped'] += 1
+                self.stderr.write(f"Line {line}: {describe(e)}")
+                continue
+            yield product
+
+    @transaction.atomic
+    def upsert(self, batch):
+        # A sku repeated within a batch would hit the same row twice in one statement; the last one wins
+        batch = {product.sku: product for product in batch}
+        existing = {
+            row['sku']: row for row in
+            Product.objects.filter(sku__in=batch).values('sku', 'image_variants', *FEED_FIELDS)
+        }
+
+        changed = []
+        new_images = []
+        for sku, product in batch.items():
+            current = existing.get(sku)
+            if current is None:
+                self.counts['inserted'] += 1
+            elif any(getattr(product, field) != current[field] for field in FEED_FIELDS):
+                self.counts['updated'] += 1
+                # Variants of the old image would otherwise be served for the new one
+                if product.image_file == current['image_file']:
+                    product.image_variants = current['image_variants']
+            else:
+                self.counts['unchanged'] += 1
+                continue
+            changed.append(product)
+            if not product.image_variants and product.image_file:
+                new_images.append(sku)
+
+        # INSERT ... ON CONFLICT (sku) DO UPDATE; unchanged rows aren't written at all
+        Product.objects.bulk_create(
+            changed, update_conflicts=True, unique_fields=['sku'],
+            update_fields=[*FEED_FIELDS, 'image_variants']
+        )
+        # Bulk writes skip the save hook that queues these
+        if new_images:
+            enqueue_all_on_commit([
+                ('orders.refresh_image_variants', {'product_id': product_id})
+                for product_id in Product.objects.filter(sku__in=new_images).values_list('id', flat=True)
+            ])
+            self.images += len(new_images)
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from bilandog.caching import process_local_cache_warning
+from orders.reaper import reap_abandoned_carts, stale_carts
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete open carts that haven't been edited for CART_ABANDONED_AFTER_DAYS, "
+        "in small batches with a pause between them."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=settings.CART_ABANDONED_AFTER_DAYS,
+                            help="Delete carts untouched for this many days")
+        parser.add_argument('--batch-size', type=int, default=settings.CART_REAPER_BATCH_SIZE,
+                            help="Carts deleted per transaction")
+        parser.add_argument('--pause', type=float, default=settings.CART_REAPER_PAUSE,
+                            help="Seconds to sleep between batches")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the stale carts")
+
+    def handle(self, *args, **options):
+        if options['days'] < 1 or options['batch_size'] < 1:
+            raise CommandError("--days and --batch-size must be at least 1")
+
+        if options['dry_run']:
+            self.stdout.write(f"{stale_carts(options['days']).count()} abandoned carts")
+            return
+
+        deleted = reap_abandoned_carts(
+            options['days'], options['batch_size'], options['pause'],
+            progress=lambda count: self.stdout.write(f"{count} carts deleted so far")
+        )
+        self.stdout.write(f"{deleted} abandoned carts deleted")
+        warning = process_local_cache_warning("the emptied carts") if deleted else None
+        if warning:
+            self.stderr.write(self.style.WARNING(warning))
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:16
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_lines(apps, schema_editor):
+    """Fold repeated (order, product) lines into one so the constraint can be added"""
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    duplicates = (
+        OrderItem.objects.values('order_id', 'product_id')
+        .annotate(lines=Count('id'))
+        .filter(lines__gt=1)
+    )
+    for duplicate in duplicates.iterator():
+        items = list(
+            OrderItem.objects.filter(
+                order_id=duplicate['order_id'],
+                product_id=duplicate['product_id'],
+            ).order_by('id')
+        )
+        keep = items[0]
+        keep.quantity = sum(item.quantity for item in items)
+        keep.save(update_fields=['quantity'])
+        OrderItem.objects.filter(id__in=[item.id for item in items[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0003_order_completed_at_order_is_completed'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_lines, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='orderitem',
+            constraint=models.UniqueConstraint(fields=('order', 'product'), name='unique_product_per_order'),
+        ),
+    ]
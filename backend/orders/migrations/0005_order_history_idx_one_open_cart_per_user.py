@@ -0,0 +1,62 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:18
+
+from decimal import Decimal
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def merge_duplicate_carts(apps, schema_editor):
+    """Fold every user's extra open orders into their newest one"""
+    Order = apps.get_model('orders', 'Order')
+    OrderItem = apps.get_model('orders', 'OrderItem')
+
+    duplicated_users = (
+        Order.objects.filter(is_completed=False)
+        .values('user_id')
+        .annotate(carts=Count('id'))
+        .filter(carts__gt=1)
+        .values_list('user_id', flat=True)
+    )
+    for user_id in list(duplicated_users):
+        carts = list(Order.objects.filter(user_id=user_id, is_completed=False).order_by('-created_at', '-id'))
+        keep, extras = carts[0], carts[1:]
+
+        lines = {item.product_id: item for item in OrderItem.objects.filter(order=keep)}
+        for item in OrderItem.objects.filter(order__in=extras).order_by('-order__created_at', 'id'):
+            if item.product_id in lines:
+                kept = lines[item.product_id]
+                kept.quantity += item.quantity
+                kept.save(update_fields=['quantity'])
+                item.delete()
+            else:
+                item.order = keep
+                item.save(update_fields=['order'])
+                lines[item.product_id] = item
+
+        keep.total_price = sum(
+            (item.price_at_purchase * item.quantity for item in lines.values()),
+            Decimal('0.00')
+        )
+        keep.save(update_fields=['total_price'])
+        Order.objects.filter(id__in=[cart.id for cart in extras]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0004_orderitem_unique_product_per_order'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_completed', True)), fields=['user', '-completed_at', '-id'], name='order_user_history_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_carts, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('is_completed', False)), fields=('user',), name='one_open_cart_per_user'),
+        ),
+    ]
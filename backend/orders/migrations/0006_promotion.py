@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0005_order_history_idx_one_open_cart_per_user'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Promotion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('kind', models.CharField(choices=[('percent', 'Percentage off'), ('quantity', 'Quantity break'), ('bundle', 'Bundle')], max_length=10)),
+                ('percent_off', models.DecimalField(decimal_places=2, max_digits=5)),
+                ('min_quantity', models.PositiveIntegerField(default=1)),
+                ('is_active', models.BooleanField(default=True)),
+                ('products', models.ManyToManyField(blank=True, related_name='promotions', to='orders.product')),
+            ],
+        ),
+    ]
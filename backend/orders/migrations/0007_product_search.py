@@ -0,0 +1,71 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:35
+
+from django.db import migrations, models
+
+# Must match orders.search: the query only uses the index if the expression is identical
+SEARCH_CONFIG = 'english'
+SEARCH_INDEX = 'product_search_idx'
+FTS_TABLE = 'orders_product_fts'
+
+SQLITE_FTS = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"name, description, content='orders_product', content_rowid='id')",
+    # Keep the external-content index in step with orders_product
+    f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON orders_product BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON orders_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF name, description ON orders_product BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description) VALUES (new.id, new.name, new.description);
+    END""",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        from django.contrib.postgres.indexes import GinIndex
+        from django.contrib.postgres.search import SearchVector
+        Product = apps.get_model('orders', 'Product')
+        schema_editor.add_index(Product, GinIndex(
+            SearchVector('name', 'description', config=SEARCH_CONFIG), name=SEARCH_INDEX
+        ))
+    elif vendor == 'sqlite':
+        for statement in SQLITE_FTS:
+            schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'postgresql':
+        schema_editor.execute(f'DROP INDEX IF EXISTS {SEARCH_INDEX}')
+    elif vendor == 'sqlite':
+        for suffix in ('ai', 'ad', 'au'):
+            schema_editor.execute(f'DROP TRIGGER IF EXISTS {FTS_TABLE}_{suffix}')
+        schema_editor.execute(f'DROP TABLE IF EXISTS {FTS_TABLE}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0006_promotion'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['price', 'id'], name='product_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['name', 'id'], name='product_name_idx'),
+        ),
+        # Full-text search: a GIN expression index on PostgreSQL, an FTS5 table on SQLite
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:38
+
+from importlib import import_module
+from django.db import migrations, models
+
+search_migration = import_module('orders.migrations.0007_product_search')
+
+
+def restore_search_triggers(apps, schema_editor):
+    # Adding or removing a column rebuilds orders_product on SQLite, which drops
+    # the triggers keeping the full-text index in step with it
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    fts_table = search_migration.FTS_TABLE
+    for suffix in ('ai', 'ad', 'au'):
+        schema_editor.execute(f'DROP TRIGGER IF EXISTS {fts_table}_{suffix}')
+    # Every statement after CREATE VIRTUAL TABLE: the triggers, then a rebuild
+    for statement in search_migration.SQLITE_FTS[1:]:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0007_product_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='image_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
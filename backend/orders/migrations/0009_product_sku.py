@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:40
+
+from importlib import import_module
+from django.db import migrations, models
+
+# Adding the column rebuilds orders_product on SQLite, dropping its full-text triggers
+restore_search_triggers = import_module(
+    'orders.migrations.0008_product_image_variants'
+).restore_search_triggers
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0008_product_image_variants'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop, restore_search_triggers),
+        migrations.AddField(
+            model_name='product',
+            name='sku',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True),
+        ),
+        migrations.RunPython(restore_search_triggers, migrations.RunPython.noop),
+    ]
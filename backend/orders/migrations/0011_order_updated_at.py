@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0010_sales_rollups'),
+    ]
+
+    operations = [
+        # Existing carts count as edited now, so none is reaped before it has had a full grace period
+        migrations.AddField(
+            model_name='order',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_completed', False)), fields=['updated_at', 'id'], name='order_stale_cart_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-18 08:58
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('orders', '0012_order_archive'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='promotion',
+            name='percent_off',
+            field=models.DecimalField(decimal_places=2, max_digits=5, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(100)]),
+        ),
+        migrations.AddConstraint(
+            model_name='promotion',
+            constraint=models.CheckConstraint(condition=models.Q(('percent_off__gte', 0), ('percent_off__lte', 100)), name='promotion_percent_off_range'),
+        ),
+        migrations.AddConstraint(
+            model_name='promotion',
+            constraint=models.CheckConstraint(condition=models.Q(models.Q(('kind', 'quantity'), _negated=True), ('min_quantity__gte', 1), _connector='OR'), name='promotion_quantity_break_min'),
+        ),
+    ]
@@ -1,11 +1,73 @@
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from users.models import CustomUser
 
 class Product(models.Model):
+    # Stable key of products loaded from supplier feeds (import_products); blank for hand-made ones
+    sku = models.CharField(max_length=64, unique=True, null=True, blank=True)
     name = models.CharField(max_length=100)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
     image_file = models.CharField(max_length=30)
+    # {"hash", "widths"} of the generated WebP variants, see orders/images.py
+    image_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the catalog by price or name, id breaking ties.
+            # Full-text search indexes are vendor specific (see migration 0007)
+            models.Index(fields=['price', 'id'], name='product_price_idx'),
+            models.Index(fields=['name', 'id'], name='product_name_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        product = super().from_db(db, field_names, values)
+        # Lets the save hooks tell whether image_file changed (see orders/signals.py)
+        product._loaded_image_file = product.__dict__.get('image_file')
+        return product
+    
+class Promotion(models.Model):
+    PERCENT_OFF = 'percent'
+    QUANTITY_BREAK = 'quantity'
+    BUNDLE = 'bundle'
+    KIND_CHOICES = [
+        (PERCENT_OFF, 'Percentage off'),  # products, or the whole catalog when none are picked
+        (QUANTITY_BREAK, 'Quantity break'),  # a line of at least min_quantity units
+        (BUNDLE, 'Bundle'),  # every picked product is in the cart
+    ]
+
+    name = models.CharField(max_length=100)
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    percent_off = models.DecimalField(
+        max_digits=5, decimal_places=2,
+        validators=[MinValueValidator(0), MaxValueValidator(100)]
+    )
+    min_quantity = models.PositiveIntegerField(default=1)
+    products = models.ManyToManyField(Product, blank=True, related_name='promotions')
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        constraints = [
+            # Anything else prices lines below zero or above list price
+            models.CheckConstraint(
+                condition=models.Q(percent_off__gte=0, percent_off__lte=100),
+                name='promotion_percent_off_range',
+            ),
+            models.CheckConstraint(
+                condition=~models.Q(kind='quantity') | models.Q(min_quantity__gte=1),
+                name='promotion_quantity_break_min',
+            ),
+        ]
+
+    def clean(self):
+        # Bundles need products too, but those are only known to the form (see PromotionAdmin)
+        if self.kind == self.QUANTITY_BREAK and self.min_quantity < 1:
+            raise ValidationError({'min_quantity': "A quantity break needs a minimum of at least 1."})
 
     def __str__(self):
         return self.name
@@ -16,6 +78,44 @@ class Order(models.Model):
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     is_completed = models.BooleanField(default=False)  # Use this instead of status
     completed_at = models.DateTimeField(null=True, blank=True)  # Optional: track completion time
+    rolled_up = models.BooleanField(default=False)  # Counted in DailyProductSales
+    updated_at = models.DateTimeField(auto_now=True)  # Last cart edit, for the abandoned cart reaper
+
+    class Meta:
+        indexes = [
+            # History pages: completed orders keyed on (completed_at, id)
+            models.Index(
+                fields=['user', '-completed_at', '-id'],
+                name='order_user_history_idx',
+                condition=models.Q(is_completed=True),
+            ),
+            # Open carts by last edit, for the abandoned cart reaper
+            models.Index(
+                fields=['updated_at', 'id'],
+                name='order_stale_cart_idx',
+                condition=models.Q(is_completed=False),
+            ),
+            # Completed orders by age, for archiving (orders.archive)
+            models.Index(
+                fields=['completed_at', 'id'],
+                name='order_archive_idx',
+                condition=models.Q(is_completed=True),
+            ),
+            # Completed orders not yet in the sales rollups, for the backfill
+            models.Index(
+                fields=['id'],
+                name='order_rollup_pending_idx',
+                condition=models.Q(is_completed=True, rolled_up=False),
+            ),
+        ]
+        constraints = [
+            # A user has at most one cart; this partial index also serves cart lookups
+            models.UniqueConstraint(
+                fields=['user'],
+                condition=models.Q(is_completed=False),
+                name='one_open_cart_per_user',
+            ),
+        ]
 
     def __str__(self):
         return f"Order {self.id} by {self.user.username}"
@@ -26,5 +126,58 @@ class OrderItem(models.Model):
     quantity = models.PositiveIntegerField()
     price_at_purchase = models.DecimalField(max_digits=10, decimal_places=2)
 
+    class Meta:
+        constraints = [
+            # One line per product so cart edits can upsert in place
+            models.UniqueConstraint(fields=['order', 'product'], name='unique_product_per_order'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} of {self.product.name} in Order {self.order.id}"
+
+class ArchivedOrder(models.Model):
+    """A completed order moved out of Order by the archiver, keeping its id"""
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='archived_orders')
+    created_at = models.DateTimeField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    completed_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            # History pages, as order_user_history_idx on Order
+            models.Index(fields=['user', '-completed_at', '-id'], name='archived_order_history_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived order {self.id} by {self.user_id}"
+
+
+class ArchivedOrderItem(models.Model):
+    """A line of an ArchivedOrder, keeping its OrderItem id"""
+    id = models.BigIntegerField(primary_key=True)
+    # Same related name as OrderItem.order, so history formatting works on either tier
+    order = models.ForeignKey(ArchivedOrder, on_delete=models.CASCADE, related_name='order_items')
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='+')
+    quantity = models.PositiveIntegerField()
+    price_at_purchase = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.quantity} of {self.product_id} in archived order {self.order_id}"
+
+
+class DailyProductSales(models.Model):
+    """Units and revenue of one product on one day, added to as orders complete"""
+    day = models.DateField()
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='daily_sales')
+    quantity = models.PositiveBigIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            # Also the index sales reports scan by day range
+            models.UniqueConstraint(fields=['day', 'product'], name='unique_product_per_day'),
+        ]
+
     def __str__(self):
-        return f"{self.quantity} of {self.product.name} in Order {self.order.id}"
\ No newline at end of file
+        return f"{self.quantity} of {self.product_id} on {self.day}"
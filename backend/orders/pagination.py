@@ -0,0 +1,33 @@
+import base64
+import json
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(*values):
+    """Pack the sort key of the last row on a page into an opaque token"""
+    raw = json.dumps([str(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, size):
+    """Unpack a cursor token into its ``size`` string values"""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor("Invalid cursor") from e
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor("Invalid cursor")
+    return values
+
+
+def get_page_size(request, default, maximum, param='page_size'):
+    """Read ``page_size`` (or ``param``) from the query string, clamped to ``maximum``"""
+    try:
+        page_size = int(request.GET.get(param, default))
+    except (TypeError, ValueError):
+        page_size = default
+    return max(1, min(page_size, maximum))
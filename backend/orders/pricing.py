@@ -0,0 +1,122 @@
+import threading
+from collections import defaultdict
+from decimal import Decimal, ROUND_HALF_UP
+from asgiref.sync import sync_to_async
+from django.core.cache import cache
+from bilandog.db_routing import primary
+from .catalog import CATALOG_VERSION_KEY, get_catalog_version
+from .models import Product, Promotion
+
+CENT = Decimal('0.01')
+HUNDRED = Decimal('100')
+
+# Price table built by this process, as (catalog version, table)
+_price_table = (None, None)
+_build_lock = threading.Lock()
+
+
+class PriceTable:
+    """
+    In-process snapshot of list prices and active promotions.
+
+    Pricing a cart is a single pass over its lines with no queries: each line
+    gets the best (largest) discount among the promotions that apply to it.
+    Discounts do not stack.
+    """
+
+    def __init__(self, products, promotions):
+        self.prices = {}
+        self.names = {}
+        for product_id, name, price in products:
+            self.prices[product_id] = price
+            self.names[product_id] = name
+
+        self.sitewide = Decimal('0')
+        self.percent = defaultdict(lambda: Decimal('0'))
+        self.quantity_breaks = defaultdict(list)
+        self.bundles = []
+        self.bundled = set()
+        for promotion in promotions:
+            product_ids = frozenset(product.id for product in promotion.products.all())
+            if promotion.kind == Promotion.PERCENT_OFF:
+                if not product_ids:
+                    self.sitewide = max(self.sitewide, promotion.percent_off)
+                for product_id in product_ids:
+                    self.percent[product_id] = max(self.percent[product_id], promotion.percent_off)
+            elif promotion.kind == Promotion.QUANTITY_BREAK:
+                for product_id in product_ids or self.prices:
+                    self.quantity_breaks[product_id].append((promotion.min_quantity, promotion.percent_off))
+            elif promotion.kind == Promotion.BUNDLE and product_ids:
+                self.bundles.append((product_ids, promotion.percent_off))
+                self.bundled |= product_ids
+
+    def __contains__(self, product_id):
+        return product_id in self.prices
+
+    def in_bundle(self, product_id):
+        """Whether this product's price depends on the rest of the cart"""
+        return product_id in self.bundled
+
+    def _discount(self, product_id, quantity, bundle_discounts):
+        discount = max(self.sitewide, self.percent.get(product_id, 0), bundle_discounts.get(product_id, 0))
+        for min_quantity, percent_off in self.quantity_breaks.get(product_id, ()):
+            if quantity >= min_quantity:
+                discount = max(discount, percent_off)
+        return discount
+
+    def _unit_price(self, product_id, discount):
+        price = self.prices[product_id]
+        if not discount:
+            return price
+        return (price * (HUNDRED - discount) / HUNDRED).quantize(CENT, rounding=ROUND_HALF_UP)
+
+    def unit_price(self, product_id, quantity):
+        """Price one line on its own; only valid when ``in_bundle`` is False"""
+        return self._unit_price(product_id, self._discount(product_id, quantity, {}))
+
+    def price_cart(self, quantities):
+        """Return {product_id: unit_price} for every known product in {product_id: quantity}"""
+        in_cart = {product_id for product_id, quantity in quantities.items() if quantity > 0}
+
+        bundle_discounts = {}
+        for product_ids, percent_off in self.bundles:
+            if product_ids <= in_cart:
+                for product_id in product_ids:
+                    bundle_discounts[product_id] = max(bundle_discounts.get(product_id, 0), percent_off)
+
+        return {
+            product_id: self._unit_price(product_id, self._discount(product_id, quantity, bundle_discounts))
+            for product_id, quantity in quantities.items()
+            if product_id in self.prices
+        }
+
+
+def get_price_table():
+    """Return the price table for the current catalog version, rebuilding it if stale"""
+    global _price_table
+
+    version = get_catalog_version()
+    table_version, table = _price_table
+    if table_version == version:
+        return table
+
+    with _build_lock:
+        table_version, table = _price_table
+        if table_version != version:
+            # Shared by every request of this process, so never built from a lagging replica
+            with primary():
+                table = PriceTable(
+                    Product.objects.values_list('id', 'name', 'price'),
+                    Promotion.objects.filter(is_active=True).prefetch_related('products')
+                )
+            _price_table = (version, table)
+    return table
+
+
+async def aget_price_table():
+    """Async ``get_price_table``; only a stale table is rebuilt off the event loop"""
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    table_version, table = _price_table
+    if version is not None and table_version == version:
+        return table
+    return await sync_to_async(get_price_table)()
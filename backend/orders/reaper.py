@@ -0,0 +1,63 @@
+"""
+Deletion of abandoned carts.
+
+Open carts that haven't been edited for CART_ABANDONED_AFTER_DAYS are
+deleted with their lines, oldest first, a bounded batch per short
+transaction. Each batch walks order_stale_cart_idx from the oldest edit, so
+finding it costs the same however many carts are open, and carts that are
+being edited at that moment (row locked) are skipped rather than waited for.
+"""
+import time
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Order, OrderItem
+from .versions import bump_user_versions
+
+
+def stale_carts(days=None):
+    """Open carts last edited more than ``days`` (default CART_ABANDONED_AFTER_DAYS) ago"""
+    if days is None:
+        days = settings.CART_ABANDONED_AFTER_DAYS
+    return Order.objects.filter(is_completed=False, updated_at__lt=timezone.now() - timedelta(days=days))
+
+
+def reap_abandoned_carts(days=None, batch_size=None, pause=None, max_batches=None, progress=None):
+    """
+    Delete stale carts in batches and return how many were deleted.
+
+    Sleeps ``pause`` seconds between batches to leave the database to live
+    traffic, stops after ``max_batches`` when given, and calls
+    ``progress(deleted)`` after every batch.
+    """
+    batch_size = batch_size or settings.CART_REAPER_BATCH_SIZE
+    pause = settings.CART_REAPER_PAUSE if pause is None else pause
+    # One cutoff for the whole run, so carts going stale meanwhile wait for the next one
+    stale = stale_carts(days)
+
+    deleted = batches = 0
+    while max_batches is None or batches < max_batches:
+        with transaction.atomic():
+            carts = list(
+                stale.select_for_update(skip_locked=True)
+                .order_by('updated_at', 'id')
+                .values_list('id', 'user_id')[:batch_size]
+            )
+            if not carts:
+                break
+            ids = [cart_id for cart_id, _ in carts]
+            OrderItem.objects.filter(order_id__in=ids).delete()
+            Order.objects.filter(id__in=ids).delete()
+            for _, user_id in carts:
+                bump_user_versions(user_id)
+
+        deleted += len(ids)
+        batches += 1
+        if progress:
+            progress(deleted)
+        if len(ids) < batch_size:
+            break
+        if pause:
+            time.sleep(pause)
+    return deleted
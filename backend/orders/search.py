@@ -0,0 +1,135 @@
+"""
+Catalog queries: full-text search, price filters, sorting, sparse fields and
+keyset pagination.
+
+Full-text search uses the index created by migration 0007: a GIN index over
+the ``name``/``description`` search vector on PostgreSQL and an FTS5 table
+kept up to date by triggers on SQLite. Other databases fall back to
+``icontains`` matching. Sorting by price or name walks the (price, id) and
+(name, id) indexes, so every page costs the same however deep it is.
+"""
+import re
+from decimal import Decimal
+from django.db import connections
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+from .images import image_urls
+from .models import Product
+from .pagination import InvalidCursor, encode_cursor, decode_cursor
+
+SEARCH_CONFIG = 'english'
+FTS_TABLE = 'orders_product_fts'
+
+PRODUCT_FIELDS = ('id', 'name', 'price', 'image_file', 'image_url', 'srcset', 'description')
+# Fields computed from image_file and image_variants rather than read from a column
+IMAGE_FIELDS = ('image_url', 'srcset')
+
+# sort parameter -> (sort key, descending)
+SORTS = {
+    'relevance': ('rank', True),
+    'name': ('name', False),
+    '-name': ('name', True),
+    'price': ('price', False),
+    '-price': ('price', True),
+}
+CURSOR_TYPES = {'rank': float, 'name': str, 'price': Decimal}
+
+
+def _postgres_search(products, q):
+    from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+
+    # Same expression as the GIN index, so the planner can use it
+    vector = SearchVector('name', 'description', config=SEARCH_CONFIG)
+    query = SearchQuery(q, search_type='websearch', config=SEARCH_CONFIG)
+    # Double precision so ranks survive the round trip through a cursor
+    return products.annotate(search=vector).filter(search=query).annotate(
+        rank=Cast(SearchRank(vector, query), FloatField())
+    )
+
+
+def _sqlite_search(products, q):
+    # Every word must match, as a prefix so partial words find products too
+    terms = re.findall(r'\w+', q)
+    if not terms:
+        return products.none().annotate(rank=Value(0.0, output_field=FloatField()))
+    match = ' '.join('"%s"*' % term for term in terms)
+
+    return products.filter(
+        id__in=RawSQL(f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s', [match])
+    ).annotate(rank=RawSQL(
+        f'SELECT -bm25({FTS_TABLE}) FROM {FTS_TABLE} '
+        f'WHERE {FTS_TABLE} MATCH %s AND {FTS_TABLE}.rowid = "orders_product"."id"',
+        [match], output_field=FloatField()
+    ))
+
+
+def _fallback_search(products, q):
+    for term in q.split():
+        products = products.filter(Q(name__icontains=term) | Q(description__icontains=term))
+    return products.annotate(rank=Value(0.0, output_field=FloatField()))
+
+
+SEARCH_BACKENDS = {
+    'postgresql': _postgres_search,
+    'sqlite': _sqlite_search,
+}
+
+
+def search_products(q=None, min_price=None, max_price=None):
+    """Products matching the text query and price range, annotated with ``rank`` when searching"""
+    products = Product.objects.all()
+    if min_price is not None:
+        products = products.filter(price__gte=min_price)
+    if max_price is not None:
+        products = products.filter(price__lte=max_price)
+    if q:
+        search = SEARCH_BACKENDS.get(connections[products.db].vendor, _fallback_search)
+        products = search(products, q)
+    return products
+
+
+def catalog_page(products, sort, fields, page_size, cursor=None):
+    """
+    Return one page of ``products`` as ``{"results", "next_cursor"}``.
+
+    Keyset pagination on (sort key, id): a cursor resumes strictly after the
+    last row of the previous page. Raises InvalidCursor.
+    """
+    key, descending = SORTS[sort]
+    if descending:
+        order, op = [f'-{key}', '-id'], 'lt'
+    else:
+        order, op = [key, 'id'], 'gt'
+
+    if cursor:
+        value, last_id = decode_cursor(cursor, 2)
+        try:
+            value, last_id = CURSOR_TYPES[key](value), int(last_id)
+        except (ValueError, ArithmeticError):
+            raise InvalidCursor("Invalid cursor")
+        products = products.filter(
+            Q(**{f'{key}__{op}': value}) |
+            Q(**{key: value, f'id__{op}': last_id})
+        )
+
+    columns = ['id', key, *(field for field in fields if field not in IMAGE_FIELDS)]
+    with_images = any(field in IMAGE_FIELDS for field in fields)
+    if with_images:
+        columns += ['image_file', 'image_variants']
+
+    # Fetch one extra row to learn whether another page exists
+    rows = list(products.order_by(*order).values(*dict.fromkeys(columns))[:page_size + 1])
+    next_cursor = None
+    if len(rows) > page_size:
+        rows = rows[:page_size]
+        next_cursor = encode_cursor(rows[-1][key], rows[-1]['id'])
+
+    if with_images:
+        for row in rows:
+            row['image_url'], row['srcset'] = image_urls(row['image_file'], row['image_variants'])
+
+    return {
+        "results": [{field: row[field] for field in fields} for row in rows],
+        "next_cursor": next_cursor
+    }
@@ -22,6 +22,6 @@ class OrderSerializer(serializers.ModelSerializer):
 class CartItemSerializer(serializers.Serializer):
     id = serializers.IntegerField()
     name = serializers.CharField(read_only=True)
-    price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)  # Priced by the server
     quantity = serializers.IntegerField(min_value=1)
     emoji = serializers.CharField(required=False, default="🌭")
\ No newline at end of file
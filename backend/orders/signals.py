@@ -0,0 +1,45 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, pre_save, m2m_changed
+from django.dispatch import receiver
+from jobs.runner import enqueue_on_commit
+from .models import Product, Promotion
+from .catalog import bump_catalog_version
+
+
+@receiver(pre_save, sender=Product)
+def reset_image_variants(sender, instance, raw=False, update_fields=None, **kwargs):
+    """Drop the variants of a replaced original; their names belong to the old image"""
+    if update_fields is not None and 'image_file' not in update_fields:
+        instance._image_changed = False
+        return
+    instance._image_changed = instance.image_file != getattr(instance, '_loaded_image_file', None)
+    if instance._image_changed and not raw:
+        instance.image_variants = {}
+
+
+@receiver(post_save, sender=Product)
+def refresh_image_variants(sender, instance, raw=False, **kwargs):
+    """Queue the generation of the product's image variants when its original is new or changed"""
+    changed = getattr(instance, '_image_changed', False)
+    instance._loaded_image_file = instance.image_file
+    # Loading fixtures: run the generate_image_variants command afterwards
+    if changed and instance.image_file and not raw:
+        enqueue_on_commit('orders.refresh_image_variants', product_id=instance.pk)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_catalog(sender, **kwargs):
+    """Any product change invalidates the cached catalog"""
+    # Once committed: a reader between the bump and the commit would cache the old rows
+    # under the new version, which nothing invalidates again
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+@receiver(m2m_changed, sender=Promotion.products.through)
+def invalidate_prices(sender, **kwargs):
+    """Promotion changes invalidate the price table built from the catalog"""
+    # Otherwise a process could rebuild its price table from the old promotions under the new version
+    transaction.on_commit(bump_catalog_version)
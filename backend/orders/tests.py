@@ -1,3 +1,1076 @@
-from django.test import TestCase
+import csv
+import hashlib
+import json
+import os
+import tempfile
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.core.cache import caches
+from django.core.management import call_command
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connections, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+from jobs.models import Job
+from users.models import CustomUser
+from .cart import (
+    CheckoutError, add_cart_item, get_open_cart, parse_cart_items, remove_cart_item, set_cart_item_quantity
+)
+from .analytics import roll_up_orders, sales_report
+from .archive import archive_horizon, archive_orders
+from . import cart_store, jobs as order_jobs
+from .cart_store import CacheCartStore, DatabaseCartStore
+from .export import EXPORT_FIELDS, history_rows
+from .history import ahistory_page, history_page
+from .images import ImageVariantError
+from .jobs import roll_up_sales
+from .catalog import bump_catalog_version
+from .models import ArchivedOrder, ArchivedOrderItem, DailyProductSales, Order, OrderItem, Product, Promotion
+from .pagination import encode_cursor
+from .pricing import PriceTable
+from .reaper import reap_abandoned_carts
+from .versions import CART_VERSION_KEY
+from .search import FTS_TABLE, SEARCH_BACKENDS, search_products
 
-# Create your tests here.
+
+def make_products(*prices):
+    return [
+        Product.objects.create(name=f"Product {i}", description="", price=Decimal(price), image_file=f"p{i}.png")
+        for i, price in enumerate(prices)
+    ]
+
+
+def make_promotion(kind, percent_off, products=(), **fields):
+    promotion = Promotion.objects.create(name=f"{percent_off}% {kind}", kind=kind, percent_off=percent_off, **fields)
+    promotion.products.set(products)
+    return promotion
+
+
+def make_order(user, lines, completed_at=None, **fields):
+    """An order with ``lines`` of {product: quantity} at list price, completed at ``completed_at`` if given"""
+    order = Order.objects.create(
+        user=user,
+        is_completed=completed_at is not None,
+        completed_at=completed_at,
+        total_price=sum((product.price * quantity for product, quantity in lines.items()), Decimal('0.00')),
+        **fields
+    )
+    OrderItem.objects.bulk_create(
+        OrderItem(order=order, product=product, quantity=quantity, price_at_purchase=product.price)
+        for product, quantity in lines.items()
+    )
+    return order
+
+
+def walk_history(user_id, page_size, page=history_page):
+    """Every order id of a user's history, following next_cursor page by page"""
+    ids, cursor = [], None
+    while True:
+        result = page(user_id, cursor, page_size)
+        ids += [order["id"] for order in result["results"]]
+        cursor = result["next_cursor"]
+        if not cursor:
+            return ids
+
+
+class PriceTableTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.a, self.b, self.c = make_products('10.00', '20.00', '5.00')
+
+    def price(self, quantities):
+        table = PriceTable(
+            Product.objects.values_list('id', 'name', 'price'),
+            Promotion.objects.filter(is_active=True).prefetch_related('products')
+        )
+        return table.price_cart({product.id: quantity for product, quantity in quantities.items()})
+
+    def test_list_prices_without_promotions(self):
+        prices = self.price({self.a: 1, self.b: 2})
+        self.assertEqual(prices, {self.a.id: Decimal('10.00'), self.b.id: Decimal('20.00')})
+
+    def test_unknown_products_are_skipped(self):
+        table = PriceTable(Product.objects.values_list('id', 'name', 'price'), [])
+        self.assertEqual(table.price_cart({self.a.id: 1, 999: 1}), {self.a.id: Decimal('10.00')})
+
+    def test_sitewide_percent_off(self):
+        make_promotion(Promotion.PERCENT_OFF, Decimal('10'))
+        prices = self.price({self.a: 1, self.b: 1})
+        self.assertEqual(prices, {self.a.id: Decimal('9.00'), self.b.id: Decimal('18.00')})
+
+    def test_discounts_round_to_cents(self):
+        make_promotion(Promotion.PERCENT_OFF, Decimal('33.33'), [self.a])
+        self.assertEqual(self.price({self.a: 1})[self.a.id], Decimal('6.67'))
+
+    def test_quantity_break_applies_from_its_minimum(self):
+        make_promotion(Promotion.QUANTITY_BREAK, Decimal('20'), [self.b], min_quantity=3)
+        self.assertEqual(self.price({self.b: 2})[self.b.id], Decimal('20.00'))
+        self.assertEqual(self.price({self.b: 3})[self.b.id], Decimal('16.00'))
+
+    def test_bundle_needs_every_product_in_the_cart(self):
+        make_promotion(Promotion.BUNDLE, Decimal('50'), [self.a, self.c])
+        self.assertEqual(self.price({self.a: 1, self.b: 1}), {self.a.id: Decimal('10.00'), self.b.id: Decimal('20.00')})
+        self.assertEqual(
+            self.price({self.a: 1, self.c: 2}),
+            {self.a.id: Decimal('5.00'), self.c.id: Decimal('2.50')}
+        )
+
+    def test_overlapping_promotions_take_the_best_discount_without_stacking(self):
+        make_promotion(Promotion.PERCENT_OFF, Decimal('10'))
+        make_promotion(Promotion.PERCENT_OFF, Decimal('25'), [self.a])
+        make_promotion(Promotion.QUANTITY_BREAK, Decimal('30'), [self.a], min_quantity=5)
+        make_promotion(Promotion.BUNDLE, Decimal('15'), [self.b, self.c])
+
+        prices = self.price({self.a: 1, self.b: 1, self.c: 1})
+        self.assertEqual(prices, {self.a.id: Decimal('7.50'), self.b.id: Decimal('17.00'), self.c.id: Decimal('4.25')})
+        self.assertEqual(self.price({self.a: 5})[self.a.id], Decimal('7.00'))
+
+    def test_inactive_promotions_are_ignored(self):
+        make_promotion(Promotion.PERCENT_OFF, Decimal('50'), is_active=False)
+        self.assertEqual(self.price({self.a: 1})[self.a.id], Decimal('10.00'))
+
+
+class PromotionValidationTests(TestCase):
+    def test_percent_off_must_be_between_0_and_100(self):
+        for percent_off in (Decimal('-20'), Decimal('150')):
+            promotion = Promotion(name="Bad", kind=Promotion.PERCENT_OFF, percent_off=percent_off)
+            with self.assertRaises(ValidationError):
+                promotion.full_clean()
+            with self.assertRaises(IntegrityError), transaction.atomic():
+                promotion.save()
+
+    def test_quantity_break_needs_a_minimum(self):
+        promotion = Promotion(name="Bad", kind=Promotion.QUANTITY_BREAK, percent_off=10, min_quantity=0)
+        with self.assertRaises(ValidationError):
+            promotion.full_clean()
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            promotion.save()
+        # Only quantity breaks look at the minimum
+        Promotion.objects.create(name="Fine", kind=Promotion.PERCENT_OFF, percent_off=10, min_quantity=0)
+
+
+class CartLineTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = CustomUser.objects.create_user('cart-user', password='secret-password')
+        self.a, self.b, self.c = make_products('10.00', '20.00', '5.00')
+        make_promotion(Promotion.QUANTITY_BREAK, Decimal('20'), [self.b], min_quantity=3)
+        make_promotion(Promotion.BUNDLE, Decimal('50'), [self.a, self.c])
+        # Signal bumps wait for a commit, which never comes inside a TestCase
+        bump_catalog_version()
+
+    def edit(self, change, *args):
+        with transaction.atomic():
+            cart = get_open_cart(self.user.id, create=True, lock=True)
+            result = change(cart, *args)
+        return result
+
+    def assertTotal(self, total_price, expected):
+        """The returned total, the stored total and the stored lines all agree"""
+        cart = get_open_cart(self.user.id)
+        lines = sum(
+            (item.quantity * item.price_at_purchase for item in OrderItem.objects.filter(order=cart)),
+            Decimal('0.00')
+        )
+        self.assertEqual(total_price, Decimal(expected))
+        self.assertEqual(cart.total_price, Decimal(expected))
+        self.assertEqual(lines, Decimal(expected))
+
+    def test_add_creates_then_increments_a_line(self):
+        line, total_price = self.edit(add_cart_item, self.b.id, 1)
+        self.assertEqual(line, (1, Decimal('20.00')))
+        self.assertTotal(total_price, '20.00')
+
+        line, total_price = self.edit(add_cart_item, self.b.id, 1)
+        self.assertEqual(line, (2, Decimal('20.00')))
+        self.assertTotal(total_price, '40.00')
+        self.assertEqual(OrderItem.objects.filter(product=self.b).count(), 1)
+
+    def test_quantity_break_reprices_the_line_both_ways(self):
+        self.edit(add_cart_item, self.b.id, 2)
+        line, total_price = self.edit(add_cart_item, self.b.id, 1)
+        self.assertEqual(line, (3, Decimal('16.00')))
+        self.assertTotal(total_price, '48.00')
+
+        line, total_price = self.edit(set_cart_item_quantity, self.b.id, 2)
+        self.assertEqual(line, (2, Decimal('20.00')))
+        self.assertTotal(total_price, '40.00')
+
+    def test_set_quantity_zero_removes_the_line(self):
+        self.edit(add_cart_item, self.b.id, 1)
+        self.edit(add_cart_item, self.c.id, 2)
+        line, total_price = self.edit(set_cart_item_quantity, self.b.id, 0)
+        self.assertIsNone(line)
+        self.assertTotal(total_price, '10.00')
+        self.assertFalse(OrderItem.objects.filter(product=self.b).exists())
+
+    def test_bundle_lines_are_repriced_together(self):
+        self.edit(add_cart_item, self.a.id, 1)
+        line, total_price = self.edit(add_cart_item, self.c.id, 2)
+        self.assertEqual(line, (2, Decimal('2.50')))
+        self.assertTotal(total_price, '10.00')
+
+        line, total_price = self.edit(remove_cart_item, self.c.id)
+        self.assertIsNone(line)
+        self.assertTotal(total_price, '10.00')
+        self.assertEqual(OrderItem.objects.get(product=self.a).price_at_purchase, Decimal('10.00'))
+
+    def test_setting_the_same_quantity_writes_nothing(self):
+        self.edit(add_cart_item, self.a.id, 1)
+        self.edit(add_cart_item, self.b.id, 2)
+        self.edit(add_cart_item, self.c.id, 2)
+        before = get_open_cart(self.user.id)
+        store = DatabaseCartStore()
+        with mock.patch.object(cart_store, 'bump_user_versions') as bump:
+            # A plain line, and a bundle line that goes through a full reprice
+            for product in (self.b, self.c):
+                item, total_price = store.set_quantity(self.user.id, product.id, 2)
+                self.assertEqual(item["quantity"], 2)
+                self.assertEqual(total_price, before.total_price)
+        bump.assert_not_called()
+        self.assertEqual(get_open_cart(self.user.id).updated_at, before.updated_at)
+
+        with mock.patch.object(cart_store, 'bump_user_versions') as bump:
+            store.set_quantity(self.user.id, self.b.id, 3)
+        bump.assert_called_once_with(self.user.id)
+        self.assertGreater(get_open_cart(self.user.id).updated_at, before.updated_at)
+
+    def test_a_line_priced_before_a_catalog_change_keeps_its_name(self):
+        self.edit(add_cart_item, self.b.id, 1)
+        stale = PriceTable([], [])
+        with mock.patch.object(cart_store, 'get_price_table', return_value=stale):
+            item, _ = DatabaseCartStore().set_quantity(self.user.id, self.b.id, 2)
+        self.assertEqual((item["name"], item["quantity"]), (self.b.name, 2))
+
+    def test_malformed_posted_items_are_logged_and_skipped(self):
+        with self.assertLogs('orders.cart', level='WARNING') as logs:
+            lines = parse_cart_items([{"id": self.a.id, "quantity": 2}, {"id": "x"}, "junk", {"id": self.b.id}])
+        self.assertEqual(lines, {self.a.id: 2, self.b.id: 1})
+        self.assertEqual(len(logs.records), 2)
+
+    def test_editing_a_product_not_in_the_cart(self):
+        self.edit(add_cart_item, self.a.id, 1)
+        self.assertEqual(self.edit(set_cart_item_quantity, self.b.id, 3), (None, None))
+        self.assertEqual(self.edit(remove_cart_item, self.b.id), (None, None))
+        self.assertTotal(get_open_cart(self.user.id).total_price, '10.00')
+
+
+class CacheCartStoreTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = CustomUser.objects.create_user('cached-cart-user', password='secret-password')
+        self.a, self.b = make_products('10.00', '20.00')
+        bump_catalog_version()
+        self.store = CacheCartStore()
+
+    def tearDown(self):
+        # Write-behind is driven by hand here, and must not run at exit either
+        if self.store._timer:
+            self.store._timer.cancel()
+        self.store._dirty.clear()
+
+    def stored_lines(self):
+        return dict(OrderItem.objects.filter(
+            order__user=self.user, order__is_completed=False
+        ).values_list('product_id', 'quantity'))
+
+    def test_edits_stay_in_the_cache_until_flushed(self):
+        self.store.add(self.user.id, self.a.id, 1)
+        item, total_price = self.store.add(self.user.id, self.a.id, 2)
+        self.store.add(self.user.id, self.b.id, 1)
+        self.assertEqual(item["quantity"], 3)
+        self.assertEqual(total_price, Decimal('30.00'))
+        self.assertEqual(self.stored_lines(), {})
+        self.assertIn(self.user.id, self.store._dirty)
+
+        self.store.flush(self.user.id)
+        self.assertEqual(self.stored_lines(), {self.a.id: 3, self.b.id: 1})
+        self.assertEqual(get_open_cart(self.user.id).total_price, Decimal('50.00'))
+        self.assertNotIn(self.user.id, self.store._dirty)
+
+    def test_flush_writes_removals(self):
+        self.store.replace(self.user.id, [{"id": self.a.id, "quantity": 2}, {"id": self.b.id, "quantity": 1}])
+        self.store.flush(self.user.id)
+        self.store.remove(self.user.id, self.a.id)
+        self.store.set_quantity(self.user.id, self.b.id, 4)
+        self.store.flush(self.user.id)
+        self.assertEqual(self.stored_lines(), {self.b.id: 4})
+        self.assertEqual(get_open_cart(self.user.id).total_price, Decimal('80.00'))
+
+    def test_a_cart_lost_from_the_cache_is_reloaded_from_the_database(self):
+        self.store.add(self.user.id, self.b.id, 2)
+        self.store.flush(self.user.id)
+        caches['default'].delete(self.store._key(self.user.id))
+        items = self.store.get_items(self.user.id)
+        self.assertEqual([(item["id"], item["quantity"]) for item in items], [(self.b.id, 2)])
+
+    def test_a_reload_never_overwrites_a_newer_cached_cart(self):
+        self.store.add(self.user.id, self.b.id, 2)
+        self.store.flush(self.user.id)
+        caches['default'].delete(self.store._key(self.user.id))
+        real_get_open_cart = cart_store.get_open_cart
+
+        def edit_during_reload(user_id):
+            # An edit, holding the lock, saves while an unlocked read is loading the old cart
+            cart = real_get_open_cart(user_id)
+            with self.store._user_lock(user_id):
+                self.store._save(user_id, {self.a.id: 1})
+            return cart
+
+        with mock.patch.object(cart_store, 'get_open_cart', edit_during_reload):
+            items = self.store.get_items(self.user.id)
+        self.assertEqual([(item["id"], item["quantity"]) for item in items], [(self.a.id, 1)])
+        self.assertEqual(caches['default'].get(self.store._key(self.user.id)), {self.a.id: 1})
+
+    def test_checkout_writes_the_cached_cart_and_completes_it(self):
+        self.store.add(self.user.id, self.a.id, 1)
+        self.store.add(self.user.id, self.b.id, 2)
+        order = self.store.checkout(self.user.id)
+
+        order = Order.objects.get(pk=order.pk)
+        self.assertTrue(order.is_completed)
+        self.assertEqual(order.total_price, Decimal('50.00'))
+        self.assertEqual(
+            dict(OrderItem.objects.filter(order=order).values_list('product_id', 'quantity')),
+            {self.a.id: 1, self.b.id: 2}
+        )
+        self.assertNotIn(self.user.id, self.store._dirty)
+        self.assertEqual(self.store.get_items(self.user.id), [])
+
+    def test_failed_checkout_keeps_the_cart_queued(self):
+        self.store.replace(self.user.id, [])
+        with self.assertRaises(CheckoutError):
+            self.store.checkout(self.user.id)
+        self.assertIn(self.user.id, self.store._dirty)
+        self.assertFalse(Order.objects.filter(user=self.user, is_completed=True).exists())
+
+
+# Checkout's jobs stay in the table instead of starting threads outside the test transaction
+@override_settings(JOBS_BACKEND='db')
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = CustomUser.objects.create_user('polling-user', password='secret-password')
+        self.a, self.b = make_products('10.00', '20.00')
+        bump_catalog_version()
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def get(self, path, etag=None):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(path, **self.auth, **headers)
+
+    def add_to_cart(self, product):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/orders/cart/items/', {'id': product.id, 'quantity': 1},
+                                        content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_unchanged_cart_is_not_modified_without_queries(self):
+        for path in ('/orders/cart/', '/orders/async/cart/'):
+            response = self.get(path)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response['Cache-Control'], 'private, no-cache')
+            with self.assertNumQueries(0):
+                response = self.get(path, response['ETag'])
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+    def test_cart_edit_changes_the_cart_etag_only(self):
+        cart_etag = self.get('/orders/cart/')['ETag']
+        history_etag = self.get('/orders/history/')['ETag']
+        self.add_to_cart(self.a)
+
+        response = self.get('/orders/cart/', cart_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([item["id"] for item in response.json()["cart_items"]], [self.a.id])
+        self.assertNotEqual(response['ETag'], cart_etag)
+        self.assertEqual(self.get('/orders/cart/', response['ETag']).status_code, 304)
+        self.assertEqual(self.get('/orders/history/', history_etag).status_code, 304)
+
+    def test_checkout_changes_cart_and_history_etags(self):
+        self.add_to_cart(self.b)
+        cart_etag = self.get('/orders/cart/')['ETag']
+        history_etag = self.get('/orders/async/history/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/orders/checkout/', **self.auth).status_code, 200)
+
+        self.assertEqual(self.get('/orders/cart/', cart_etag).json(), {"cart_items": []})
+        response = self.get('/orders/async/history/', history_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["results"]), 1)
+
+    def test_price_changes_change_the_cart_etag(self):
+        self.add_to_cart(self.a)
+        etag = self.get('/orders/cart/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.a.price = Decimal('12.00')
+            self.a.save()
+        response = self.get('/orders/cart/', etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["cart_items"][0]["price"], 12.0)
+
+    def test_uncommitted_edits_keep_the_old_etag(self):
+        etag = self.get('/orders/cart/')['ETag']
+        with self.captureOnCommitCallbacks(execute=False) as callbacks:
+            self.client.post('/orders/cart/items/', {'id': self.a.id, 'quantity': 1},
+                             content_type='application/json', **self.auth)
+        self.assertTrue(callbacks)
+        self.assertEqual(self.get('/orders/cart/', etag).status_code, 304)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('archive-user', password='secret-password')
+        self.a, self.b = make_products('10.00', '20.00')
+        self.old = archive_horizon() - timedelta(days=1)
+        self.recent = timezone.now() - timedelta(days=1)
+
+    def test_only_rolled_up_orders_past_the_horizon_move(self):
+        moved = make_order(self.user, {self.a: 2, self.b: 1}, self.old, rolled_up=True)
+        not_counted = make_order(self.user, {self.a: 1}, self.old)
+        too_recent = make_order(self.user, {self.a: 1}, self.recent, rolled_up=True)
+        cart = make_order(self.user, {self.b: 1})
+        Order.objects.filter(pk=cart.pk).update(updated_at=self.old)
+
+        self.assertEqual(archive_orders(pause=0), 1)
+
+        archived = ArchivedOrder.objects.get()
+        self.assertEqual(
+            (archived.id, archived.user_id, archived.created_at, archived.completed_at, archived.total_price),
+            (moved.id, self.user.id, moved.created_at, moved.completed_at, Decimal('40.00'))
+        )
+        self.assertEqual(
+            sorted(ArchivedOrderItem.objects.values_list('order_id', 'product_id', 'quantity', 'price_at_purchase')),
+            sorted([(moved.id, self.a.id, 2, Decimal('10.00')), (moved.id, self.b.id, 1, Decimal('20.00'))])
+        )
+        self.assertFalse(Order.objects.filter(pk=moved.pk).exists())
+        self.assertFalse(OrderItem.objects.filter(order_id=moved.pk).exists())
+        self.assertEqual(
+            set(Order.objects.values_list('id', flat=True)), {not_counted.id, too_recent.id, cart.id}
+        )
+
+    def test_each_batch_moves_and_deletes_together(self):
+        orders = [
+            make_order(self.user, {self.a: 1}, self.old - timedelta(hours=i), rolled_up=True) for i in range(5)
+        ]
+        seen = []
+
+        def progress(archived):
+            archived_ids = set(ArchivedOrder.objects.values_list('id', flat=True))
+            seen.append(archived)
+            self.assertEqual(len(archived_ids), archived)
+            self.assertFalse(Order.objects.filter(id__in=archived_ids).exists())
+            self.assertFalse(OrderItem.objects.filter(order_id__in=archived_ids).exists())
+
+        self.assertEqual(archive_orders(batch_size=2, pause=0, progress=progress), 5)
+        self.assertEqual(seen, [2, 4, 5])
+        self.assertEqual(ArchivedOrderItem.objects.count(), len(orders))
+
+    def test_max_batches_bounds_a_run(self):
+        for i in range(5):
+            make_order(self.user, {self.a: 1}, self.old - timedelta(hours=i), rolled_up=True)
+        self.assertEqual(archive_orders(batch_size=2, pause=0, max_batches=1), 2)
+        self.assertEqual(Order.objects.count(), 3)
+
+    def test_command(self):
+        make_order(self.user, {self.a: 1}, self.old, rolled_up=True)
+        out = StringIO()
+        call_command('archive_orders', dry_run=True, stdout=out)
+        self.assertIn("1 orders to archive", out.getvalue())
+        self.assertEqual(ArchivedOrder.objects.count(), 0)
+        call_command('archive_orders', pause=0, stdout=out)
+        self.assertIn("1 orders archived", out.getvalue())
+        self.assertEqual(ArchivedOrder.objects.count(), 1)
+
+
+class SalesRollupTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('rollup-user', password='secret-password')
+        self.a, self.b = make_products('8.80', '0.10')
+        self.day = timezone.now() - timedelta(days=1)
+
+    def report(self):
+        day = timezone.localdate(self.day)
+        return sales_report(day, day, 10)
+
+    def test_each_order_is_counted_once(self):
+        order = make_order(self.user, {self.a: 3, self.b: 1}, self.day)
+        roll_up_sales(order.id)
+        # A retried job, and a backfill racing it
+        roll_up_sales(order.id)
+        call_command('backfill_sales_rollups', stdout=StringIO())
+        # Carts aren't counted
+        self.assertEqual(roll_up_orders([make_order(self.user, {self.a: 1}).id]), 0)
+
+        self.assertTrue(Order.objects.get(pk=order.pk).rolled_up)
+        self.assertEqual(
+            sorted(DailyProductSales.objects.values_list('product_id', 'quantity', 'revenue')),
+            sorted([(self.a.id, 3, Decimal('26.40')), (self.b.id, 1, Decimal('0.10'))])
+        )
+        report = self.report()
+        self.assertEqual((report["units"], str(report["revenue"])), (4, "26.50"))
+        self.assertEqual([str(product["revenue"]) for product in report["top_products"]], ["26.40", "0.10"])
+        self.assertEqual([str(day["revenue"]) for day in report["days"]], ["26.50"])
+
+    def test_rebuild_reproduces_the_totals(self):
+        orders = [
+            make_order(self.user, {self.a: quantity, self.b: 2}, self.day - timedelta(minutes=quantity))
+            for quantity in (1, 2, 3)
+        ]
+        roll_up_orders([orders[0].id, orders[1].id])
+        call_command('backfill_sales_rollups', batch_size=1, stdout=StringIO())
+        rollups = sorted(DailyProductSales.objects.values_list('day', 'product_id', 'quantity', 'revenue'))
+        report = self.report()
+        self.assertEqual(str(report["revenue"]), "53.40")
+
+        # Archived orders are recounted as well
+        ArchivedOrder.objects.create(
+            id=orders[0].id, user=self.user, created_at=orders[0].created_at,
+            completed_at=orders[0].completed_at, total_price=orders[0].total_price
+        )
+        ArchivedOrderItem.objects.bulk_create(
+            ArchivedOrderItem(id=item.id, order_id=item.order_id, product_id=item.product_id, quantity=item.quantity,
+                              price_at_purchase=item.price_at_purchase)
+            for item in OrderItem.objects.filter(order=orders[0])
+        )
+        orders[0].delete()
+
+        out = StringIO()
+        call_command('backfill_sales_rollups', rebuild=True, batch_size=1, stdout=out)
+        self.assertIn("1 archived orders rolled up", out.getvalue())
+        self.assertIn("2 orders rolled up", out.getvalue())
+        self.assertEqual(sorted(DailyProductSales.objects.values_list('day', 'product_id', 'quantity', 'revenue')),
+                         rollups)
+        self.assertEqual(self.report(), report)
+
+
+@override_settings(JOBS_BACKEND='db')
+class ImageVariantTests(TestCase):
+    def setUp(self):
+        self.product, = make_products('10.00')
+        Product.objects.filter(pk=self.product.pk).update(image_variants={"hash": "old", "widths": [320]})
+        self.product = Product.objects.get(pk=self.product.pk)
+
+    def queued(self):
+        return list(Job.objects.filter(name='orders.refresh_image_variants').values_list('payload', flat=True))
+
+    def test_only_a_new_or_replaced_original_is_queued(self):
+        self.assertEqual(self.queued(), [{"product_id": self.product.id}])
+        Job.objects.all().delete()
+
+        self.product.price = Decimal('12.00')
+        self.product.save()
+        self.assertEqual(self.queued(), [])
+        self.assertEqual(Product.objects.get(pk=self.product.pk).image_variants, {"hash": "old", "widths": [320]})
+
+        self.product.image_file = 'replaced.png'
+        self.product.save()
+        self.assertEqual(self.queued(), [{"product_id": self.product.id}])
+        # The old variants are named after the old original
+        self.assertEqual(Product.objects.get(pk=self.product.pk).image_variants, {})
+
+    def test_a_rolled_back_save_queues_nothing(self):
+        Job.objects.all().delete()
+        with transaction.atomic():
+            self.product.image_file = 'replaced.png'
+            self.product.save()
+            transaction.set_rollback(True)
+        self.assertEqual(self.queued(), [])
+
+    def test_the_job_records_the_variants(self):
+        variants = {"hash": "new", "widths": [320, 640]}
+        with mock.patch.object(order_jobs, 'generate_variants', return_value=variants) as generate:
+            with mock.patch.object(order_jobs, 'bump_catalog_version') as bump:
+                order_jobs.refresh_image_variants(self.product.id)
+        generate.assert_called_once_with('p0.png', {"hash": "old", "widths": [320]})
+        bump.assert_called_once_with()
+        self.assertEqual(Product.objects.get(pk=self.product.pk).image_variants, variants)
+
+    def test_a_missing_original_is_skipped_quietly(self):
+        with self.assertNoLogs('orders', level='WARNING'):
+            order_jobs.refresh_image_variants(self.product.id)
+        self.assertEqual(Product.objects.get(pk=self.product.pk).image_variants, {"hash": "old", "widths": [320]})
+
+    def test_a_broken_original_is_logged_once(self):
+        error = ImageVariantError("Cannot convert p0.png")
+        with mock.patch.object(order_jobs, 'generate_variants', side_effect=error):
+            with self.assertLogs('orders.jobs', level='WARNING'):
+                order_jobs.refresh_image_variants(self.product.id)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.kettle, self.teapot, self.cup, self.mug = [
+            Product.objects.create(name=name, description=description, price=Decimal(price), image_file='p.png')
+            for name, description, price in [
+                ("Blue kettle", "Boils water", '30.00'),
+                ("Clay teapot", "Brews tea", '20.00'),
+                ("Tea cup", "Holds tea", '20.00'),
+                ("Coffee mug", "Holds coffee", '10.00'),
+            ]
+        ]
+
+    def search(self, **params):
+        response = self.client.get('/orders/products/search/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def ids(self, **params):
+        return [product["id"] for product in self.search(fields='id', **params)["results"]]
+
+    def walk(self, **params):
+        ids, cursor = [], None
+        while True:
+            page = self.search(fields='id', page_size=1, **params, **({'cursor': cursor} if cursor else {}))
+            ids += [product["id"] for product in page["results"]]
+            cursor = page["next_cursor"]
+            if not cursor:
+                return ids
+
+    def test_full_text_search_matches_prefixes_of_every_word(self):
+        self.assertEqual(set(self.ids(q='tea')), {self.teapot.id, self.cup.id})
+        self.assertEqual(self.ids(q='hold cof'), [self.mug.id])
+        self.assertEqual(self.ids(q='!!!'), [])
+
+    def test_renamed_and_deleted_products_are_searched_as_they_are_now(self):
+        self.assertEqual(self.ids(q='kettle'), [self.kettle.id])
+        self.kettle.name = "Steel percolator"
+        self.kettle.save()
+        self.assertEqual(self.ids(q='kettle'), [])
+        self.assertEqual(self.ids(q='percolator'), [self.kettle.id])
+
+        Product.objects.filter(pk=self.mug.pk).update(description="Holds cocoa")
+        self.assertEqual(self.ids(q='cocoa'), [self.mug.id])
+        self.mug.delete()
+        self.assertEqual(self.ids(q='cocoa'), [])
+
+    def test_keyset_pages_cover_every_product_once(self):
+        everything = {product.id for product in (self.kettle, self.teapot, self.cup, self.mug)}
+        for sort in ('name', '-name', 'price', '-price'):
+            with self.subTest(sort=sort):
+                ids = self.walk(sort=sort)
+                self.assertEqual(ids, self.ids(sort=sort))
+                self.assertEqual(set(ids), everything)
+        # Price ties are broken by id
+        self.assertEqual(self.ids(sort='price')[1:3], sorted([self.teapot.id, self.cup.id]))
+        self.assertEqual(self.walk(q='tea', sort='relevance'), self.ids(q='tea', sort='relevance'))
+
+    def test_a_product_added_before_the_cursor_does_not_shift_the_next_page(self):
+        first = self.search(fields='id', sort='price', page_size=2)
+        Product.objects.create(name="Cheap spoon", description="", price=Decimal('1.00'), image_file='p.png')
+        second = self.search(fields='id', sort='price', page_size=2, cursor=first["next_cursor"])
+        self.assertEqual([product["id"] for product in second["results"]], [
+            max(self.teapot.id, self.cup.id), self.kettle.id
+        ])
+
+    def test_price_filters(self):
+        self.assertEqual(set(self.ids(min_price='15', max_price='20.00')), {self.teapot.id, self.cup.id})
+
+    def test_bad_parameters_are_rejected(self):
+        for params in [
+            {'min_price': 'cheap'},
+            {'max_price': 'NaN'},
+            {'min_price': 'Infinity'},
+            {'cursor': 'not a cursor'},
+            {'cursor': encode_cursor('x', 1), 'sort': 'price'},
+            {'cursor': encode_cursor('1.00'), 'sort': 'price'},
+            {'cursor': encode_cursor('Tea cup', 'last'), 'sort': 'name'},
+            {'sort': 'relevance'},
+            {'fields': 'id,secret'},
+        ]:
+            with self.subTest(params=params):
+                response = self.client.get('/orders/products/search/', params)
+                self.assertEqual(response.status_code, 400)
+
+    def test_search_backend_follows_the_database_vendor(self):
+        def vendor(name):
+            return mock.patch('orders.search.connections', {'default': mock.Mock(vendor=name)})
+
+        postgres = mock.Mock(return_value=Product.objects.none())
+        sqlite = mock.Mock(return_value=Product.objects.none())
+        with mock.patch.dict(SEARCH_BACKENDS, {'postgresql': postgres, 'sqlite': sqlite}):
+            with vendor('postgresql'):
+                search_products('tea')
+            self.assertEqual((postgres.call_args.args[1], sqlite.called), ('tea', False))
+            with vendor('sqlite'):
+                search_products('tea')
+            self.assertEqual((sqlite.call_args.args[1], postgres.call_count), ('tea', 1))
+
+            # Other databases fall back to icontains matching
+            with vendor('oracle'):
+                products = search_products('holds')
+            self.assertEqual(set(products.values_list('id', flat=True)), {self.cup.id, self.mug.id})
+            self.assertEqual((postgres.call_count, sqlite.call_count), (1, 1))
+
+    def test_the_search_index_exists_after_migrating(self):
+        connection = connections['default']
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite':
+                cursor.execute("SELECT type, name FROM sqlite_master WHERE name LIKE %s", [f'{FTS_TABLE}%'])
+                found = set(cursor.fetchall())
+                self.assertLessEqual({
+                    ('table', FTS_TABLE),
+                    ('trigger', f'{FTS_TABLE}_ai'),
+                    ('trigger', f'{FTS_TABLE}_ad'),
+                    ('trigger', f'{FTS_TABLE}_au'),
+                }, found)
+            elif connection.vendor == 'postgresql':
+                constraints = connection.introspection.get_constraints(cursor, Product._meta.db_table)
+                self.assertIn('product_search_idx', constraints)
+
+
+@override_settings(JOBS_BACKEND='db')
+class ImportProductsTests(TestCase):
+    def setUp(self):
+        self.kept, self.repriced = [
+            Product.objects.create(sku=sku, name=name, description="Feed", price=Decimal('5.00'), image_file='p.png')
+            for sku, name in (('SKU-1', "Kept"), ('SKU-2', "Repriced"))
+        ]
+        Product.objects.update(image_variants={"hash": "old", "widths": [320]})
+        Job.objects.all().delete()
+
+    def import_csv(self, text):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as feed:
+            feed.write(text)
+        self.addCleanup(os.unlink, feed.name)
+        out, err = StringIO(), StringIO()
+        call_command('import_products', feed.name, batch_size=2, stdout=out, stderr=err)
+        return out.getvalue(), err.getvalue()
+
+    def test_upsert_and_counts(self):
+        out, err = self.import_csv(
+            "sku,name,description,price,image_file\n"
+            "SKU-1,Kept,Feed,5.00,p.png\n"
+            "SKU-2,Repriced,Feed,6.50,p.png\n"
+            "SKU-3,New,Fresh,7.25,new.png\n"
+            "SKU-4,Bad price,Feed,cheap,p.png\n"
+            ",No sku,Feed,1.00,p.png\n"
+            "SKU-5,,Feed,1.00,p.png\n"
+        )
+        self.assertIn("1 inserted, 1 updated, 1 unchanged, 3 skipped", out)
+        self.assertIn("Line 5: price: ", err)
+        self.assertIn("Line 6: sku: ", err)
+        self.assertIn("Line 7: name: ", err)
+
+        self.assertEqual(
+            dict(Product.objects.values_list('sku', 'price')),
+            {'SKU-1': Decimal('5.00'), 'SKU-2': Decimal('6.50'), 'SKU-3': Decimal('7.25')}
+        )
+        # Unchanged images keep their variants, new ones are generated in the background
+        self.assertEqual(Product.objects.get(sku='SKU-2').image_variants, {"hash": "old", "widths": [320]})
+        new = Product.objects.get(sku='SKU-3')
+        self.assertEqual(new.image_variants, {})
+        self.assertEqual(
+            list(Job.objects.values_list('name', 'payload')),
+            [('orders.refresh_image_variants', {'product_id': new.id})]
+        )
+        self.assertIn("1 image variant job(s) queued", out)
+
+    def test_a_replaced_image_drops_its_old_variants(self):
+        out, _ = self.import_csv("sku,name,description,price,image_file\nSKU-1,Kept,Feed,5.00,other.png\n")
+        self.assertIn("0 inserted, 1 updated", out)
+        self.assertEqual(Product.objects.get(sku='SKU-1').image_variants, {})
+        self.assertEqual(list(Job.objects.values_list('payload', flat=True)), [{'product_id': self.kept.id}])
+
+
+class CartReaperTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.users = [CustomUser.objects.create_user(f'reaper-user-{i}', password='secret-password') for i in range(4)]
+        self.a, = make_products('10.00')
+        self.stale = timezone.now() - timedelta(days=31)
+
+    def cart(self, user, updated_at):
+        cart = make_order(user, {self.a: 1})
+        Order.objects.filter(pk=cart.pk).update(updated_at=updated_at)
+        return cart
+
+    def test_only_stale_open_carts_are_deleted(self):
+        stale = [self.cart(user, self.stale - timedelta(hours=i)) for i, user in enumerate(self.users[:2])]
+        fresh = self.cart(self.users[2], timezone.now() - timedelta(days=29))
+        completed = make_order(self.users[3], {self.a: 2}, self.stale - timedelta(days=365))
+        Order.objects.filter(pk=completed.pk).update(updated_at=self.stale - timedelta(days=365))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(reap_abandoned_carts(days=30, batch_size=1, pause=0), 2)
+
+        self.assertEqual(set(Order.objects.values_list('id', flat=True)), {fresh.id, completed.id})
+        self.assertFalse(OrderItem.objects.filter(order_id__in=[cart.id for cart in stale]).exists())
+        self.assertEqual(OrderItem.objects.filter(order=completed).count(), 1)
+        # Their owners' cart ETags change
+        self.assertEqual(
+            [caches['default'].get(CART_VERSION_KEY.format(user_id=user.id)) is not None for user in self.users],
+            [True, True, False, False]
+        )
+
+    def test_max_batches_bounds_a_run(self):
+        for i, user in enumerate(self.users):
+            self.cart(user, self.stale - timedelta(hours=i))
+        self.assertEqual(reap_abandoned_carts(days=30, batch_size=3, pause=0, max_batches=1), 3)
+        # Oldest first
+        self.assertEqual(list(Order.objects.values_list('user_id', flat=True)), [self.users[0].id])
+
+    def test_command(self):
+        self.cart(self.users[0], self.stale)
+        self.cart(self.users[1], timezone.now())
+        out = StringIO()
+        call_command('reap_carts', dry_run=True, stdout=out)
+        self.assertIn("1 abandoned carts", out.getvalue())
+        self.assertEqual(Order.objects.count(), 2)
+        call_command('reap_carts', pause=0, stdout=out, stderr=StringIO())
+        self.assertIn("1 abandoned carts deleted", out.getvalue())
+        self.assertEqual(list(Order.objects.values_list('user_id', flat=True)), [self.users[1].id])
+
+
+class TieredHistoryTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('tiered-user', password='secret-password')
+        self.a, self.b = make_products('10.00', '20.00')
+        old = archive_horizon() - timedelta(days=1)
+        recent = timezone.now() - timedelta(days=1)
+        # Two pairs of completed_at ties, one in each tier
+        moments = [old - timedelta(days=2), old - timedelta(days=1), old - timedelta(days=1), old,
+                   recent - timedelta(hours=1), recent, recent]
+        self.orders = [
+            make_order(self.user, {self.a: i + 1, self.b: 1}, moment, rolled_up=True)
+            for i, moment in enumerate(moments)
+        ]
+        archive_orders(pause=0)
+        other = CustomUser.objects.create_user('other-user', password='secret-password')
+        make_order(other, {self.a: 1}, old, rolled_up=True)
+        self.assertEqual(ArchivedOrder.objects.filter(user=self.user).count(), 4)
+
+    def newest_first(self):
+        return [order.id for order in sorted(self.orders, key=lambda o: (o.completed_at, o.id), reverse=True)]
+
+    def test_pages_cross_the_archive_boundary(self):
+        for page_size in (1, 2, 3, 4, 7, 10):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(walk_history(self.user.id, page_size), self.newest_first())
+
+    def test_async_pages_match(self):
+        for page_size in (2, 3):
+            with self.subTest(page_size=page_size):
+                self.assertEqual(
+                    walk_history(self.user.id, page_size, async_to_sync(ahistory_page)), self.newest_first()
+                )
+
+    def test_archived_orders_keep_their_lines(self):
+        ids = self.newest_first()
+        page = history_page(self.user.id, None, len(ids))["results"]
+        oldest = page[-1]
+        self.assertEqual(oldest["id"], ids[-1])
+        self.assertEqual(
+            sorted((item["product_name"], item["quantity"]) for item in oldest["order_items"]),
+            [(self.a.name, 1), (self.b.name, 1)]
+        )
+
+    def test_export_merges_both_tiers_oldest_first(self):
+        rows = list(history_rows(self.user))
+        order_ids = [order_id for order_id, *_ in rows]
+        self.assertEqual(list(dict.fromkeys(order_ids)), self.newest_first()[::-1])
+        self.assertEqual(len(rows), 2 * len(self.orders))
+
+
+@override_settings(JOBS_BACKEND='db')
+class CheckoutIdempotencyTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        self.user = CustomUser.objects.create_user('buyer', password='secret-password')
+        self.a, = make_products('10.00')
+        bump_catalog_version()
+
+    def auth(self, user):
+        return {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(user)}'}
+
+    def fill_cart(self, user):
+        response = self.client.post('/orders/cart/items/', {'id': self.a.id, 'quantity': 1},
+                                    content_type='application/json', **self.auth(user))
+        self.assertEqual(response.status_code, 200)
+
+    def checkout(self, user, key):
+        return self.client.post('/orders/checkout/', HTTP_IDEMPOTENCY_KEY=key, **self.auth(user))
+
+    def test_a_retry_replays_the_first_result(self):
+        self.fill_cart(self.user)
+        first = self.checkout(self.user, 'key-1')
+        self.assertEqual(first.status_code, 200)
+
+        # A new cart must not be checked out by a retry of the old request
+        self.fill_cart(self.user)
+        retry = self.checkout(self.user, 'key-1')
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Order.objects.filter(user=self.user, is_completed=True).count(), 1)
+        self.assertTrue(get_open_cart(self.user.id))
+
+    def test_a_new_key_checks_out_again(self):
+        self.fill_cart(self.user)
+        first = self.checkout(self.user, 'key-1')
+        self.fill_cart(self.user)
+        second = self.checkout(self.user, 'key-2')
+        self.assertNotEqual(second.json()["order_id"], first.json()["order_id"])
+        self.assertEqual(Order.objects.filter(user=self.user, is_completed=True).count(), 2)
+
+    def test_a_retry_while_the_first_attempt_runs_is_refused(self):
+        self.fill_cart(self.user)
+        digest = hashlib.sha256(b'key-1').hexdigest()
+        caches['default'].add(f'checkout:idempotency:{self.user.id}:{digest}:lock', True)
+
+        response = self.checkout(self.user, 'key-1')
+        self.assertEqual(response.status_code, 409)
+        self.assertFalse(Order.objects.filter(is_completed=True).exists())
+
+    def test_keys_are_scoped_to_their_user(self):
+        other = CustomUser.objects.create_user('other-buyer', password='secret-password')
+        self.fill_cart(self.user)
+        self.fill_cart(other)
+        first = self.checkout(self.user, 'shared-key')
+        second = self.checkout(other, 'shared-key')
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(second.json()["order_id"], first.json()["order_id"])
+        self.assertEqual(Order.objects.get(pk=second.json()["order_id"]).user, other)
+
+    def test_without_a_key_an_empty_cart_is_refused(self):
+        self.fill_cart(self.user)
+        self.assertEqual(self.client.post('/orders/checkout/', **self.auth(self.user)).status_code, 200)
+        response = self.client.post('/orders/checkout/', **self.auth(self.user))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Order.objects.filter(is_completed=True).count(), 1)
+
+
+class HistoryExportTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user('exporter', password='secret-password')
+        self.a, self.b = make_products('10.00', '2.50')
+        self.b.name = "=HYPERLINK(\"http://example.com\")"
+        self.b.save()
+        day = timezone.make_aware(datetime(2026, 3, 1, 12))
+        self.orders = [make_order(self.user, {self.a: 1, self.b: 2}, day + timedelta(days=i)) for i in range(3)]
+        # Neither the open cart nor another user's orders are exported
+        make_order(self.user, {self.a: 5})
+        other = CustomUser.objects.create_user('someone-else', password='secret-password')
+        make_order(other, {self.a: 1}, day)
+
+    def export(self, **params):
+        response = self.client.get('/orders/history/export/', params,
+                                   HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content.decode()
+
+    def test_csv(self):
+        response, content = self.export()
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(StringIO(content)))
+        self.assertEqual(rows[0], EXPORT_FIELDS)
+        self.assertEqual(len(rows), 1 + 2 * len(self.orders))
+        first = dict(zip(rows[0], rows[1]))
+        self.assertEqual(first['order_id'], str(self.orders[0].id))
+        self.assertEqual(first['completed_at'], self.orders[0].completed_at.isoformat())
+        self.assertEqual(first['total_price'], '15.00')
+        names = {row[5] for row in rows[1:]}
+        # Formulas are quoted so spreadsheets show them as text
+        self.assertEqual(names, {self.a.name, "'" + self.b.name})
+
+    def test_ndjson_has_one_object_per_order(self):
+        response, content = self.export(type='ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        orders = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([order["id"] for order in orders], [order.id for order in self.orders])
+        self.assertEqual(
+            sorted((item["product_name"], item["quantity"]) for item in orders[0]["order_items"]),
+            sorted([(self.a.name, 1), (self.b.name, 2)])
+        )
+
+    def test_since_is_inclusive_and_until_exclusive(self):
+        second, third = self.orders[1].completed_at, self.orders[2].completed_at
+        for params, expected in [
+            ({'since': second.isoformat()}, self.orders[1:]),
+            ({'until': third.isoformat()}, self.orders[:2]),
+            ({'since': second.isoformat(), 'until': third.isoformat()}, self.orders[1:2]),
+            ({'since': '2026-03-03'}, self.orders[2:]),
+            ({'until': '2026-03-01'}, []),
+        ]:
+            with self.subTest(params=params):
+                _, content = self.export(type='ndjson', **params)
+                self.assertEqual([json.loads(line)["id"] for line in content.splitlines()],
+                                 [order.id for order in expected])
+
+    def test_bad_parameters_are_rejected(self):
+        for params in [{'type': 'xlsx'}, {'since': 'yesterday'}, {'until': '2026-13-01'}]:
+            with self.subTest(params=params):
+                response, _ = self.export(**params)
+                self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get('/orders/history/export/').status_code, 401)
+
+
+class HistoryPaginationTests(TestCase):
+    URLS = ('/orders/history/', '/orders/async/history/')
+
+    def setUp(self):
+        caches['default'].clear()
+        self.user = CustomUser.objects.create_user('historian', password='secret-password')
+        self.a, = make_products('10.00')
+        self.now = timezone.now() - timedelta(hours=1)
+
+    def make_orders(self, *minutes_ago):
+        return [make_order(self.user, {self.a: 1}, self.now - timedelta(minutes=minutes)) for minutes in minutes_ago]
+
+    def pages(self, url, page_size):
+        """Order ids page by page, following next_cursor through ``url``"""
+        pages, params = [], {'page_size': page_size}
+        while True:
+            response = self.client.get(url, params,
+                                       HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+            self.assertEqual(response.status_code, 200, response.content)
+            page = response.json()
+            pages.append([order["id"] for order in page["results"]])
+            if not page["next_cursor"]:
+                return pages
+            params['cursor'] = page["next_cursor"]
+
+    def test_page_boundaries(self):
+        orders = self.make_orders(1, 2, 3, 4, 5)
+        ids = [order.id for order in orders]
+        for url in self.URLS:
+            with self.subTest(url=url):
+                self.assertEqual(self.pages(url, 2), [ids[0:2], ids[2:4], ids[4:]])
+                # A last page that is exactly full has no cursor after it, rather than an empty page
+                self.assertEqual(self.pages(url, 5), [ids])
+                self.assertEqual(self.pages(url, 1), [[order_id] for order_id in ids])
+
+    def test_orders_completed_at_the_same_moment_are_ordered_by_id(self):
+        orders = self.make_orders(1, 2, 2, 2, 3)
+        expected = [orders[0].id, *sorted((order.id for order in orders[1:4]), reverse=True), orders[4].id]
+        for url in self.URLS:
+            for page_size in (1, 2, 3):
+                with self.subTest(url=url, page_size=page_size):
+                    pages = self.pages(url, page_size)
+                    self.assertEqual([order_id for page in pages for order_id in page], expected)
+
+    def test_new_orders_do_not_shift_later_pages(self):
+        orders = self.make_orders(1, 2, 3)
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        first = self.client.get('/orders/history/', {'page_size': 1}, **auth).json()
+        make_order(self.user, {self.a: 1}, timezone.now())
+        second = self.client.get('/orders/history/', {'page_size': 1, 'cursor': first["next_cursor"]}, **auth)
+        self.assertEqual([order["id"] for order in second.json()["results"]], [orders[1].id])
+
+    def test_bad_cursors_are_rejected(self):
+        self.make_orders(1)
+        auth = {'HTTP_AUTHORIZATION': f'Bearer {AccessToken.for_user(self.user)}'}
+        for cursor in [
+            'not a cursor',
+            encode_cursor(self.now.isoformat()),
+            encode_cursor('yesterday', 1),
+            encode_cursor(self.now.isoformat(), 'first'),
+        ]:
+            for url in self.URLS:
+                with self.subTest(url=url, cursor=cursor):
+                    response = self.client.get(url, {'cursor': cursor}, **auth)
+                    self.assertEqual(response.status_code, 400)
+                    self.assertIn("cursor", response.json())
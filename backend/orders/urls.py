@@ -1,9 +1,23 @@
 from django.urls import path
-from .views import CartView, ProductListView, OrderHistoryView, CheckoutView
+from .views import (
+    CartView, CartItemView, CartItemDetailView, ProductListView, ProductSearchView, ProductImageView,
+    OrderHistoryView, OrderHistoryExportView, CheckoutView, SalesReportView
+)
+from .async_views import AsyncProductListView, AsyncCartView, AsyncOrderHistoryView
 
 urlpatterns = [
     path('cart/', CartView.as_view(), name='cart'),
+    path('cart/items/', CartItemView.as_view(), name='cart_items'),
+    path('cart/items/<int:product_id>/', CartItemDetailView.as_view(), name='cart_item_detail'),
     path('products/', ProductListView.as_view(), name='products'),
+    path('products/search/', ProductSearchView.as_view(), name='product_search'),
+    path('images/<str:name>', ProductImageView.as_view(), name='product_image'),
     path('history/', OrderHistoryView.as_view(), name='order_history'),
+    path('history/export/', OrderHistoryExportView.as_view(), name='order_history_export'),
     path('checkout/', CheckoutView.as_view(), name='checkout'), 
+    path('reports/sales/', SalesReportView.as_view(), name='sales_report'),
+    # Native async variants of the read endpoints, for ASGI deployments
+    path('async/products/', AsyncProductListView.as_view(), name='async_products'),
+    path('async/cart/', AsyncCartView.as_view(), name='async_cart'),
+    path('async/history/', AsyncOrderHistoryView.as_view(), name='async_order_history'),
 ]
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Per-user cart and history versions for conditional GETs.
+
+Each user has a cart version and a history version in the cache, bumped
+once a change to their cart or completed orders is committed. Together with
+the catalog version, which covers prices and product names, they make the
+ETag of the cart and history endpoints, so a poll whose copy is current is
+answered with a 304 after one cache round trip and no queries. Readers must
+take the ETag before reading the data it describes: a write landing in
+between then only costs the client a needless 200, never a stale 304.
+
+A version lost from the cache is started again with a new value, which only
+turns the next conditional poll into a full response.
+"""
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from .catalog import CATALOG_VERSION_KEY, get_catalog_version
+
+CART_VERSION_KEY = 'cart:{user_id}:version'
+HISTORY_VERSION_KEY = 'history:{user_id}:version'
+
+
+def _bump(key):
+    # Nanosecond timestamps, like the catalog version, so a restarted counter never repeats
+    cache.set(key, max(time.time_ns(), (cache.get(key) or 0) + 1), timeout=settings.USER_VERSION_TIMEOUT)
+
+
+def bump_user_versions(user_id, cart=True, history=False):
+    """Invalidate the user's cart and/or history ETags once the current transaction commits"""
+    def bump():
+        if cart:
+            _bump(CART_VERSION_KEY.format(user_id=user_id))
+        if history:
+            _bump(HISTORY_VERSION_KEY.format(user_id=user_id))
+    # Runs at once outside a transaction
+    transaction.on_commit(bump)
+
+
+def _etag(key, values):
+    """Build the ETag from one get_many result, starting a lost version if needed"""
+    version = values.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=settings.USER_VERSION_TIMEOUT)
+        version = cache.get(key)
+    catalog_version = values.get(CATALOG_VERSION_KEY)
+    if catalog_version is None:
+        catalog_version = get_catalog_version()
+    return f'"{version}-{catalog_version}"'
+
+
+def user_etag(key_format, user_id):
+    """ETag of a user's cart (CART_VERSION_KEY) or history (HISTORY_VERSION_KEY)"""
+    key = key_format.format(user_id=user_id)
+    return _etag(key, cache.get_many([key, CATALOG_VERSION_KEY]))
+
+
+async def auser_etag(key_format, user_id):
+    """Async ``user_etag``; only a lost version costs more than one cache round trip"""
+    key = key_format.format(user_id=user_id)
+    values = await cache.aget_many([key, CATALOG_VERSION_KEY])
+    if key in values and CATALOG_VERSION_KEY in values:
+        return _etag(key, values)
+    return await sync_to_async(_etag)(key, values)
@@ -1,57 +1,86 @@
+import hashlib
+from decimal import Decimal
+from datetime import datetime, time, timedelta
+from pathlib import Path
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import IsAuthenticated, AllowAny
-from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
+from users.authentication import CachedJWTAuthentication
+from django.conf import settings
+from django.core.cache import cache
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
 from django.utils import timezone
-from decimal import Decimal
-from .models import Product, Order, OrderItem
+from django.utils.cache import get_conditional_response
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils.http import parse_http_date_safe
+from django.views import View
+from .serializers import CartItemSerializer
+from .analytics import sales_report
+from .catalog import get_product_list_payload
+from .pricing import get_price_table
+from .export import EXPORT_FORMATS, history_rows
+from .history import history_page
+from .versions import CART_VERSION_KEY, HISTORY_VERSION_KEY, user_etag
+from .search import PRODUCT_FIELDS, SORTS, catalog_page, search_products
+from .pagination import InvalidCursor, get_page_size
+from .cart import CheckoutError
+from .cart_store import get_cart_store
+
+
+def parse_boundary(value):
+    """Parse an ISO date or datetime query parameter into an aware datetime"""
+    try:
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                return None
+            moment = datetime.combine(day, time.min)
+    except ValueError:
+        return None
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+def catalog_response(request, payload):
+    """Serve a rendered catalog payload, or 304 if the client's copy is still current"""
+    not_modified = get_conditional_response(
+        request,
+        etag=payload["etag"],
+        last_modified=parse_http_date_safe(payload["last_modified"])
+    )
+    response = not_modified or HttpResponse(payload["body"], content_type='application/json')
+    response['ETag'] = payload["etag"]
+    response['Last-Modified'] = payload["last_modified"]
+    response['Cache-Control'] = 'public, no-cache'
+    return response
+
+
+def private_etag(response, etag):
+    """Tag a per-user response with its version ETag; clients must revalidate before reuse"""
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 class CartView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        """Get the current cart items for the user"""
+        """Get the current cart items for the user, or 304 if the client's copy is current"""
         try:
-            # Handle multiple incomplete orders if they exist
-            incomplete_orders = Order.objects.filter(
-                user=request.user, 
-                is_completed=False
-            )
+            # Taken before the read, so a concurrent edit can't be hidden behind it
+            etag = user_etag(CART_VERSION_KEY, request.user.id)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified:
+                return private_etag(not_modified, etag)
             
-            # Handle case where multiple incomplete orders exist
-            if incomplete_orders.count() > 1:
-                # Keep only the most recent cart, mark others as completed
-                latest_order = incomplete_orders.order_by('-created_at').first()
-                incomplete_orders.exclude(id=latest_order.id).update(
-                    is_completed=True, 
-                    completed_at=timezone.now()
-                )
-                cart_order = latest_order
-            else:
-                cart_order = incomplete_orders.first()
-                
-            # If no cart exists, return empty cart
-            if not cart_order:
-                return Response({"cart_items": []}, status=status.HTTP_200_OK)
+            cart_items = get_cart_store().get_items(request.user.id)
             
-            # Get order items with their product details
-            order_items = OrderItem.objects.filter(order=cart_order).select_related('product')
-            
-            # Format cart items for response
-            cart_items = []
-            for item in order_items:
-                cart_items.append({
-                    "id": item.product.id,
-                    "name": item.product.name,
-                    "price": float(item.price_at_purchase),
-                    "quantity": item.quantity,
-                    "emoji": "🌭"  # Default emoji
-                })
-            
-            return Response({"cart_items": cart_items}, status=status.HTTP_200_OK)
+            return private_etag(Response({"cart_items": cart_items}, status=status.HTTP_200_OK), etag)
         
         except Exception as e:
             # Log the error for debugging
@@ -65,71 +94,73 @@ class CartView(APIView):
             # Get cart items from request
             cart_items = request.data.get('cart_items', [])
             
-            # Handle multiple incomplete orders if they exist
-            incomplete_orders = Order.objects.filter(
-                user=request.user, 
-                is_completed=False
-            )
+            get_cart_store().replace(request.user.id, cart_items)
             
-            # Handle case where multiple incomplete orders exist
-            if incomplete_orders.count() > 1:
-                # Keep only the most recent cart, mark others as completed
-                latest_order = incomplete_orders.order_by('-created_at').first()
-                incomplete_orders.exclude(id=latest_order.id).update(
-                    is_completed=True, 
-                    completed_at=timezone.now()
-                )
-                cart_order = latest_order
-            elif incomplete_orders.exists():
-                cart_order = incomplete_orders.first()
-            else:
-                # Create new order if none exists
-                cart_order = Order.objects.create(
-                    user=request.user,
-                    is_completed=False,
-                    total_price=Decimal('0.00')
-                )
-            
-            # Clear existing items before adding new ones
-            OrderItem.objects.filter(order=cart_order).delete()
+            return Response({"message": "Cart updated successfully"}, status=status.HTTP_200_OK)
+        
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+class CartItemView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request):
+        """Add a product to the cart or increment its quantity"""
+        serializer = CartItemSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = serializer.validated_data
+        
+        try:
+            # The price table knows every product, so this needs no query
+            if data['id'] not in get_price_table():
+                return Response({"error": "Product not found"}, status=status.HTTP_404_NOT_FOUND)
             
-            # Add new items and calculate total price
-            total_price = Decimal('0.00')
+            item, total_price = get_cart_store().add(request.user.id, data['id'], data['quantity'])
             
-            for item in cart_items:
-                try:
-                    product_id = item.get('id')
-                    quantity = item.get('quantity', 1)
-                    price = Decimal(str(item.get('price', 0)))
-                    
-                    # Validate the product exists
-                    try:
-                        product = Product.objects.get(id=product_id)
-                    except Product.DoesNotExist:
-                        continue  # Skip items with invalid product IDs
-                    
-                    # Create the order item
-                    OrderItem.objects.create(
-                        order=cart_order,
-                        product=product,
-                        quantity=quantity,
-                        price_at_purchase=price
-                    )
-                    
-                    # Add to total price
-                    item_total = price * quantity
-                    total_price += item_total
-                    
-                except Exception as item_error:
-                    # Log item-specific error but continue processing other items
-                    print(f"Error processing cart item: {item_error}")
-                    continue
+            return Response({
+                "item": item,
+                "total_price": total_price
+            }, status=status.HTTP_200_OK)
+        
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    
+class CartItemDetailView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    
+    def patch(self, request, product_id):
+        """Set the quantity of a single cart line (0 removes it)"""
+        try:
+            quantity = int(request.data.get('quantity'))
+        except (TypeError, ValueError):
+            return Response({"quantity": "A whole number is required."}, status=status.HTTP_400_BAD_REQUEST)
+        if quantity < 0:
+            return Response({"quantity": "Must not be negative."}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return self._change_line(get_cart_store().set_quantity, request, product_id, quantity)
+    
+    def delete(self, request, product_id):
+        """Remove a single product from the cart"""
+        return self._change_line(get_cart_store().remove, request, product_id)
+    
+    def _change_line(self, change, request, product_id, *args):
+        try:
+            item, total_price = change(request.user.id, product_id, *args)
             
-            # Update order total
-            cart_order.total_price = total_price
-            cart_order.save()
+            if total_price is None:
+                return Response({"error": "Product not in cart"}, status=status.HTTP_404_NOT_FOUND)
             
-            return Response({"message": "Cart updated successfully"}, status=status.HTTP_200_OK)
+            return Response({
+                "item": item,
+                "total_price": total_price
+            }, status=status.HTTP_200_OK)
         
         except Exception as e:
             import traceback
@@ -137,97 +168,212 @@ class CartView(APIView):
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
 class ProductListView(APIView):
+    authentication_classes = []  # Public endpoint - no token lookup either
     permission_classes = [AllowAny]  # Public endpoint - no authentication needed
     
     def get(self, request):
-        """Get all available products"""
+        """Get all available products, served from the versioned catalog cache"""
         try:
-            products = Product.objects.all()
-            
-            # Format products for response
-            product_list = []
-            for product in products:
-                product_list.append({
-                    "id": product.id,
-                    "name": product.name,
-                    "price": float(product.price),
-                    "image_file": product.image_file,
-                    "description": product.description
-                })
-            
-            return Response(product_list, status=status.HTTP_200_OK)
+            return catalog_response(request, get_product_list_payload())
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
+class ProductSearchView(APIView):
+    authentication_classes = []  # Public endpoint - no token lookup either
+    permission_classes = [AllowAny]  # Public endpoint - no authentication needed
+    
+    def get(self, request):
+        """
+        Query the catalog one page at a time.
+
+        ?q= full-text search over name and description, ?min_price= / ?max_price=,
+        ?sort=relevance|name|-name|price|-price, ?fields=id,name,... and
+        ?page_size= / ?cursor= keyset pagination.
+        """
+        params = request.query_params
+        q = params.get('q', '').strip()
+        
+        prices = {}
+        for name in ('min_price', 'max_price'):
+            value = params.get(name)
+            if value:
+                try:
+                    prices[name] = Decimal(value)
+                    if not prices[name].is_finite():
+                        raise ArithmeticError
+                except ArithmeticError:
+                    return Response({name: "A number is required."}, status=status.HTTP_400_BAD_REQUEST)
+        
+        sort = params.get('sort', 'relevance' if q else 'name')
+        if sort not in SORTS or (sort == 'relevance' and not q):
+            choices = [choice for choice in SORTS if q or choice != 'relevance']
+            return Response({"sort": f"Choose one of: {', '.join(choices)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        fields = [field for field in params.get('fields', '').split(',') if field] or list(PRODUCT_FIELDS)
+        unknown = [field for field in fields if field not in PRODUCT_FIELDS]
+        if unknown:
+            return Response({"fields": f"Unknown field(s): {', '.join(unknown)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        page_size = get_page_size(request, settings.CATALOG_PAGE_SIZE, settings.CATALOG_MAX_PAGE_SIZE)
+        try:
+            page = catalog_page(
+                search_products(q, **prices), sort, fields, page_size, params.get('cursor')
+            )
+        except InvalidCursor as e:
+            return Response({"cursor": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        return Response(page, status=status.HTTP_200_OK)
+        
+class ProductImageView(View):
+    # Variant names change with their content, so a cached copy never goes stale
+    CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+    def get(self, request, name):
+        """Serve a generated product image variant; a CDN or web server should normally do this"""
+        if Path(name).name != name or not name.endswith('.webp'):
+            raise Http404
+        try:
+            image = open(Path(settings.PRODUCT_IMAGE_ROOT) / name, 'rb')
+        except OSError:
+            raise Http404
+        response = FileResponse(image, content_type='image/webp')
+        response['Cache-Control'] = self.CACHE_CONTROL
+        return response
+        
 class OrderHistoryView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
-        """Get the user's order history"""
+        """Get one page of the user's order history, newest first, or 304 if the client's copy is current"""
         try:
-            # Get completed orders for the user
-            orders = Order.objects.filter(
-                user=request.user,
-                is_completed=True
-            ).order_by('-completed_at')
+            etag = user_etag(HISTORY_VERSION_KEY, request.user.id)
+            not_modified = get_conditional_response(request, etag=etag)
+            if not_modified:
+                return private_etag(not_modified, etag)
             
-            # Format orders for response
-            order_history = []
-            for order in orders:
-                order_items = []
-                
-                for item in OrderItem.objects.filter(order=order).select_related('product'):
-                    order_items.append({
-                        "id": item.id,
-                        "product_name": item.product.name,
-                        "quantity": item.quantity,
-                        "price_at_purchase": float(item.price_at_purchase)
-                    })
-                
-                order_history.append({
-                    "id": order.id,
-                    "created_at": order.created_at,
-                    "completed_at": order.completed_at,
-                    "total_price": float(order.total_price),
-                    "order_items": order_items
-                })
+            page_size = get_page_size(
+                request, settings.ORDER_HISTORY_PAGE_SIZE, settings.ORDER_HISTORY_MAX_PAGE_SIZE
+            )
             
-            return Response(order_history, status=status.HTTP_200_OK)
+            # Completed orders newest first, items fetched in one extra query; the
+            # archive is only read once the page reaches orders old enough to be there
+            try:
+                page = history_page(request.user.id, request.query_params.get('cursor'), page_size)
+            except InvalidCursor as e:
+                return Response({"cursor": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            return private_etag(Response(page, status=status.HTTP_200_OK), etag)
             
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
         
+class OrderHistoryExportView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        """Stream the user's completed orders as CSV (?type=csv) or NDJSON (?type=ndjson)"""
+        export_type = request.query_params.get('type', 'csv')
+        if export_type not in EXPORT_FORMATS:
+            return Response({"type": f"Choose one of: {', '.join(EXPORT_FORMATS)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        
+        # Optional completed_at window: since is inclusive, until exclusive
+        bounds = {}
+        for name in ('since', 'until'):
+            value = request.query_params.get(name)
+            if value:
+                bounds[name] = parse_boundary(value)
+                if bounds[name] is None:
+                    return Response({name: "Expected an ISO 8601 date or datetime."},
+                                    status=status.HTTP_400_BAD_REQUEST)
+        
+        render, content_type = EXPORT_FORMATS[export_type]
+        response = StreamingHttpResponse(
+            render(history_rows(request.user, **bounds)),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="order-history.{export_type}"'
+        return response
+        
 class CheckoutView(APIView):
-    authentication_classes = [JWTAuthentication]
+    authentication_classes = [CachedJWTAuthentication]
     permission_classes = [IsAuthenticated]
     
     def post(self, request):
         """Process checkout and convert cart to completed order"""
+        idempotency_key = request.headers.get('Idempotency-Key')
+        if not idempotency_key:
+            data, status_code = self.checkout(request)
+            return Response(data, status=status_code)
+        
+        # Retries with the same key replay the first result from the cache
+        digest = hashlib.sha256(idempotency_key.encode()).hexdigest()
+        result_key = f'checkout:idempotency:{request.user.id}:{digest}'
+        lock_key = f'{result_key}:lock'
+        
+        stored = cache.get(result_key)
+        if stored is not None:
+            return Response(stored["data"], status=stored["status"])
+        
+        if not cache.add(lock_key, True, timeout=settings.CHECKOUT_IDEMPOTENCY_LOCK_TIMEOUT):
+            return Response({"error": "A checkout with this Idempotency-Key is already in progress"},
+                            status=status.HTTP_409_CONFLICT)
         try:
-            # Find the user's current cart
-            cart = Order.objects.filter(
-                user=request.user,
-                is_completed=False
-            ).order_by('-created_at').first()
-            
-            if not cart:
-                return Response({"error": "No items in cart"}, status=status.HTTP_400_BAD_REQUEST)
-            
-            if not cart.order_items.exists():
-                return Response({"error": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
-                
-            # Mark the order as completed
-            cart.is_completed = True
-            cart.completed_at = timezone.now()
-            cart.save()
-            
-            # Return success response
-            return Response({
-                "success": True,
-                "message": "Your order has been placed successfully!",
-                "order_id": cart.id
-            }, status=status.HTTP_200_OK)
-            
+            data, status_code = self.checkout(request)
+            if status_code < 500:
+                cache.set(result_key, {"data": data, "status": status_code},
+                          timeout=settings.CHECKOUT_IDEMPOTENCY_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        return Response(data, status=status_code)
+    
+    def checkout(self, request):
+        try:
+            cart = get_cart_store().checkout(request.user.id)
+        except CheckoutError as e:
+            return {"error": str(e)}, status.HTTP_400_BAD_REQUEST
         except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
\ No newline at end of file
+            return {"error": str(e)}, status.HTTP_500_INTERNAL_SERVER_ERROR
+        
+        # Return success response
+        return {
+            "success": True,
+            "message": "Your order has been placed successfully!",
+            "order_id": cart.id
+        }, status.HTTP_200_OK
+
+class SalesReportView(APIView):
+    authentication_classes = [CachedJWTAuthentication]
+    permission_classes = [IsAdminUser]
+
+    def get(self, request):
+        """
+        Revenue and units per day plus the top sellers, read from the daily rollups.
+
+        ?start= / ?end= ISO dates, inclusive (default: the last 30 days), ?top= products.
+        """
+        params = request.query_params
+        today = timezone.localdate()
+        bounds = {}
+        for name, default in (('start', today - timedelta(days=29)), ('end', today)):
+            value = params.get(name)
+            try:
+                bounds[name] = parse_date(value) if value else default
+            except ValueError:
+                bounds[name] = None
+            if bounds[name] is None:
+                return Response({name: "Use the YYYY-MM-DD format."}, status=status.HTTP_400_BAD_REQUEST)
+        if bounds['start'] > bounds['end']:
+            return Response({"start": "Must not be after end."}, status=status.HTTP_400_BAD_REQUEST)
+
+        top = get_page_size(request, settings.SALES_REPORT_TOP, settings.SALES_REPORT_MAX_TOP, param='top')
+        try:
+            report = sales_report(bounds['start'], bounds['end'], top)
+        except Exception as e:
+            return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        return Response(report, status=status.HTTP_200_OK)
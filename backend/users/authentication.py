@@ -0,0 +1,88 @@
+import copy
+import threading
+import time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from .revocation import ais_revoked, is_revoked
+
+# user_id -> (expires_at, user), oldest entry first
+_users = {}
+_users_lock = threading.Lock()
+
+
+def forget_user(user_id):
+    """Drop a user from this process's authentication cache"""
+    with _users_lock:
+        _users.pop(user_id, None)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that keeps recently seen users in a per-process cache.
+
+    The token is still verified on every request, but the user row is read at
+    most once per AUTH_USER_CACHE_TIMEOUT seconds instead of once per request.
+    Saving or deleting a user evicts it in the process that made the change;
+    other processes pick the change up when their entry expires. Each request
+    gets its own copy, so views may modify ``request.user`` freely. Revoked
+    tokens are rejected with a single cache lookup.
+    """
+
+    def get_validated_token(self, raw_token):
+        validated_token = super().get_validated_token(raw_token)
+        if is_revoked(validated_token[api_settings.JTI_CLAIM]):
+            raise InvalidToken("Token has been revoked")
+        return validated_token
+
+    def get_user(self, validated_token):
+        user = _cached_user(validated_token)
+        if user is None:
+            # Raises for unknown or inactive users, which are never cached
+            user = _remember_user(validated_token, super().get_user(validated_token))
+        return copy.copy(user)
+
+    async def aauthenticate(self, request):
+        """
+        Async ``authenticate`` for plain Django async views.
+
+        Returns ``(user, token)`` or None like ``authenticate``. Cache hits stay
+        on the event loop; only a user cache miss goes to the database.
+        """
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+
+        validated_token = JWTAuthentication.get_validated_token(self, raw_token)
+        if await ais_revoked(validated_token[api_settings.JTI_CLAIM]):
+            raise InvalidToken("Token has been revoked")
+
+        user = _cached_user(validated_token)
+        if user is None:
+            user = _remember_user(
+                validated_token,
+                await sync_to_async(JWTAuthentication.get_user)(self, validated_token)
+            )
+        return copy.copy(user), validated_token
+
+
+def _cached_user(validated_token):
+    user_id = validated_token.get(settings.SIMPLE_JWT['USER_ID_CLAIM'])
+    with _users_lock:
+        expires_at, user = _users.get(user_id, (0, None))
+    return user if expires_at > time.monotonic() else None
+
+
+def _remember_user(validated_token, user):
+    user_id = validated_token.get(settings.SIMPLE_JWT['USER_ID_CLAIM'])
+    with _users_lock:
+        _users.pop(user_id, None)
+        while len(_users) >= settings.AUTH_USER_CACHE_SIZE:
+            del _users[next(iter(_users))]
+        _users[user_id] = (time.monotonic() + settings.AUTH_USER_CACHE_TIMEOUT, user)
+    return user
@@ -0,0 +1,105 @@
+"""
+Password hashing on a bounded worker pool.
+
+PBKDF2 is deliberately slow, so login, registration and profile edits hand it
+to a small thread pool (hashlib releases the GIL while hashing) instead of
+running it on the request thread or the event loop. At most
+PASSWORD_HASHING_WORKERS hashes run at once and at most
+PASSWORD_HASHING_MAX_PENDING more may wait; beyond that callers get
+``HashingPoolFull`` so a login burst is shed instead of starving other
+requests. Queue and hashing times are recorded in ``bilandog.metrics``.
+"""
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.contrib.auth.hashers import make_password, verify_password
+from bilandog.metrics import registry
+from .authentication import forget_user
+
+_executor = None
+_slots = None
+_setup_lock = threading.Lock()
+
+
+class HashingPoolFull(Exception):
+    pass
+
+
+def _get_pool():
+    global _executor, _slots
+    with _setup_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.PASSWORD_HASHING_WORKERS,
+                thread_name_prefix='password-hashing'
+            )
+            _slots = threading.BoundedSemaphore(
+                settings.PASSWORD_HASHING_WORKERS + settings.PASSWORD_HASHING_MAX_PENDING
+            )
+    return _executor, _slots
+
+
+def submit(operation, fn, *args):
+    """Queue ``fn(*args)`` on the pool and return its future, or raise HashingPoolFull"""
+    executor, slots = _get_pool()
+    if not slots.acquire(blocking=False):
+        raise HashingPoolFull("Too many sign-ins in progress, please retry")
+
+    labels = (('operation', operation),)
+    queued_at = time.perf_counter()
+
+    def run():
+        started_at = time.perf_counter()
+        registry.observe('password_hash_queue_seconds', labels, started_at - queued_at)
+        try:
+            return fn(*args)
+        finally:
+            registry.observe('password_hash_seconds', labels, time.perf_counter() - started_at)
+
+    future = executor.submit(run)
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def _check(password, encoded):
+    """Pool task: whether ``password`` matches, plus a re-hash if the hasher settings changed"""
+    is_correct, must_update = verify_password(password, encoded)
+    return is_correct, (make_password(password) if is_correct and must_update else None)
+
+
+def _store_upgrade(user, new_hash):
+    user.password = new_hash
+    forget_user(user.pk)
+
+
+async def acheck_password(user, password, operation):
+    """
+    Check ``password`` against ``user`` without blocking the event loop.
+
+    A matching hash made with an outdated hasher or iteration count is
+    replaced transparently, like ``AbstractBaseUser.check_password`` does.
+    """
+    is_correct, new_hash = await asyncio.wrap_future(submit(operation, _check, password, user.password))
+    if new_hash:
+        await type(user).objects.filter(pk=user.pk).aupdate(password=new_hash)
+        _store_upgrade(user, new_hash)
+    return is_correct
+
+
+def check_password(user, password, operation):
+    """Blocking variant of ``acheck_password`` for sync views"""
+    is_correct, new_hash = submit(operation, _check, password, user.password).result()
+    if new_hash:
+        type(user).objects.filter(pk=user.pk).update(password=new_hash)
+        _store_upgrade(user, new_hash)
+    return is_correct
+
+
+async def ahash_password(password, operation):
+    return await asyncio.wrap_future(submit(operation, make_password, password))
+
+
+def hash_password(password, operation):
+    return submit(operation, make_password, password).result()
@@ -6,4 +6,12 @@ class CustomUser(AbstractUser):
     contact = models.CharField(max_length=15, blank=True, null=True)
 
     def __str__(self):
-        return self.username
\ No newline at end of file
+        return self.username
+
+class RevokedToken(models.Model):
+    """Durable copy of the cache-resident revocation list, reloaded if the cache is lost"""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return self.jti
@@ -0,0 +1,74 @@
+import math
+import time
+from datetime import datetime, timezone as dt_timezone
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.utils import timezone
+from django.utils.connection import ConnectionProxy
+from rest_framework_simplejwt.settings import api_settings
+from .models import RevokedToken
+
+REVOKED_KEY = 'auth:revoked:{jti}'
+REVOCATIONS_LOADED_KEY = 'auth:revoked:loaded'
+
+# A cache of its own that never culls: the loaded marker vouches for every entry
+cache = ConnectionProxy(caches, 'revocations')
+
+
+def load_revocations():
+    """Copy every unexpired revocation from the database into the cache"""
+    now = timezone.now()
+    RevokedToken.objects.filter(expires_at__lte=now).delete()
+    for jti, expires_at in RevokedToken.objects.filter(expires_at__gt=now).values_list('jti', 'expires_at'):
+        timeout = math.ceil((expires_at - now).total_seconds())
+        cache.set(REVOKED_KEY.format(jti=jti), True, timeout=timeout)
+    cache.set(REVOCATIONS_LOADED_KEY, True, timeout=None)
+
+
+def is_revoked(jti):
+    """
+    Whether the token with this ``jti`` has been revoked.
+
+    One cache round trip; the database is only read when the cache has lost
+    the revocation list (the loaded marker is missing).
+    """
+    key = REVOKED_KEY.format(jti=jti)
+    values = cache.get_many([REVOCATIONS_LOADED_KEY, key])
+    if REVOCATIONS_LOADED_KEY not in values:
+        load_revocations()
+        return cache.get(key) is not None
+    return key in values
+
+
+async def ais_revoked(jti):
+    """Async ``is_revoked``"""
+    key = REVOKED_KEY.format(jti=jti)
+    values = await cache.aget_many([REVOCATIONS_LOADED_KEY, key])
+    if REVOCATIONS_LOADED_KEY not in values:
+        await sync_to_async(load_revocations)()
+        return await cache.aget(key) is not None
+    return key in values
+
+
+def revoke(token):
+    """
+    Revoke ``token`` until it expires.
+
+    Returns False when it was already revoked, so callers can tell a replayed
+    refresh token apart from the first use.
+    """
+    remaining = token['exp'] - time.time()
+    if remaining <= 0:
+        # Expired tokens are rejected anyway
+        return True
+
+    if not cache.get(REVOCATIONS_LOADED_KEY):
+        load_revocations()
+    jti = token[api_settings.JTI_CLAIM]
+    if not cache.add(REVOKED_KEY.format(jti=jti), True, timeout=math.ceil(remaining)):
+        return False
+
+    RevokedToken.objects.bulk_create([
+        RevokedToken(jti=jti, expires_at=datetime.fromtimestamp(token['exp'], tz=dt_timezone.utc))
+    ], ignore_conflicts=True)
+    return True
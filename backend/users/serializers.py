@@ -1,5 +1,10 @@
 from rest_framework import serializers
+from rest_framework.exceptions import AuthenticationFailed
 from django.contrib.auth import get_user_model
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from .revocation import is_revoked, revoke
 
 User = get_user_model()
 
@@ -12,4 +17,35 @@ class RegisterSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         user = User.objects.create_user(**validated_data)
-        return user
\ No newline at end of file
+        return user
+
+class RevocableTokenRefreshSerializer(TokenRefreshSerializer):
+    """
+    Refresh that rejects revoked tokens and, with ROTATE_REFRESH_TOKENS,
+    revokes the old refresh token when handing out a new one.
+
+    Rotation is done here rather than in the parent class, which records
+    outstanding tokens in the database blacklist app.
+    """
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        if is_revoked(refresh[api_settings.JTI_CLAIM]):
+            raise InvalidToken("Token has been revoked")
+
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        user = User.objects.filter(**{api_settings.USER_ID_FIELD: user_id}).first()
+        if user is None or not api_settings.USER_AUTHENTICATION_RULE(user):
+            raise AuthenticationFailed(self.error_messages['no_active_account'], 'no_active_account')
+
+        data = {'access': str(refresh.access_token)}
+
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            # Each refresh token works once; a concurrent reuse loses the race here
+            if not revoke(refresh):
+                raise InvalidToken("Token has been revoked")
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
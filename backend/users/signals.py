@@ -0,0 +1,11 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import CustomUser
+from .authentication import forget_user
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    """Profile, password or status changes must not be served from the auth cache"""
+    forget_user(instance.pk)
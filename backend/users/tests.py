@@ -1,3 +1,83 @@
-from django.test import TestCase
+from django.core.cache import caches
+from django.test import TestCase, override_settings
+from bilandog.db_routing import STICKY_KEY
+from rest_framework_simplejwt.tokens import RefreshToken
+from .models import CustomUser, RevokedToken
+from .revocation import is_revoked, revoke
 
-# Create your tests here.
+
+class RevocationTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+        caches['revocations'].clear()
+        self.user = CustomUser.objects.create_user('alice', password='secret-password')
+        self.refresh = RefreshToken.for_user(self.user)
+        self.access = self.refresh.access_token
+
+    def auth(self, access=None):
+        return {'HTTP_AUTHORIZATION': f'Bearer {access or self.access}'}
+
+    def test_logout_revokes_both_tokens(self):
+        response = self.client.post('/users/logout/', {'refresh': str(self.refresh)}, **self.auth())
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(is_revoked(self.access['jti']))
+        self.assertTrue(is_revoked(self.refresh['jti']))
+        self.assertEqual(self.client.get('/users/profile/', **self.auth()).status_code, 401)
+
+    def test_logout_rejects_another_users_refresh_token(self):
+        other = CustomUser.objects.create_user('bob', password='secret-password')
+        response = self.client.post(
+            '/users/logout/', {'refresh': str(RefreshToken.for_user(other))}, **self.auth()
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_revoke_reports_replays(self):
+        self.assertTrue(revoke(self.refresh))
+        self.assertFalse(revoke(self.refresh))
+
+    def test_revocations_survive_the_default_cache(self):
+        revoke(self.access)
+        caches['default'].clear()
+        self.assertTrue(is_revoked(self.access['jti']))
+
+    def test_lost_revocation_cache_is_reloaded_from_the_database(self):
+        revoke(self.access)
+        caches['revocations'].clear()
+        self.assertTrue(RevokedToken.objects.filter(jti=self.access['jti']).exists())
+        self.assertTrue(is_revoked(self.access['jti']))
+        self.assertFalse(is_revoked(self.refresh['jti']))
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class StickyAfterSignInTests(TestCase):
+    def setUp(self):
+        caches['default'].clear()
+
+    def test_register_and_login_keep_reads_on_the_primary(self):
+        credentials = {'username': 'carol', 'password': 'secret-password'}
+        response = self.client.post('/users/register/', {**credentials, 'email': 'carol@example.com'},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        user_id = CustomUser.objects.get(username='carol').id
+        self.assertTrue(caches['default'].get(STICKY_KEY.format(user_id=user_id)))
+
+        caches['default'].clear()
+        response = self.client.post('/users/login/', credentials, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(caches['default'].get(STICKY_KEY.format(user_id=user_id)))
+
+
+class RequestBodyTests(TestCase):
+    def test_bodies_that_are_not_json_objects_are_rejected(self):
+        for body in ('[]', '"carol"', '1', 'null', '{"username": '):
+            for url in ('/users/register/', '/users/login/'):
+                with self.subTest(url=url, body=body):
+                    response = self.client.post(url, body, content_type='application/json')
+                    self.assertEqual(response.status_code, 400)
+                    self.assertEqual(response.json(), {"error": "Expected a JSON object"})
+
+    def test_login_with_non_string_credentials_fails_cleanly(self):
+        CustomUser.objects.create_user('carol', password='secret-password')
+        response = self.client.post('/users/login/', {'username': ['carol'], 'password': 1},
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 401)
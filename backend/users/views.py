@@ -1,45 +1,119 @@
-from django.shortcuts import render
+import json
+from asgiref.sync import sync_to_async
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import status
-from .serializers import RegisterSerializer
+from bilandog.db_routing import amark_sticky
+from bilandog.renderers import json_response
+from .serializers import RegisterSerializer, User
 from rest_framework_simplejwt.tokens import RefreshToken
-from django.contrib.auth import authenticate
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from .hashing import HashingPoolFull, acheck_password, ahash_password, check_password, hash_password
+from .revocation import revoke
 
-class RegisterView(APIView):
-    permission_classes = []
+def _request_data(request):
+    """Read a JSON or form body; None when the JSON is malformed or not an object"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+    return request.POST
+
+
+def _pool_full_response(e):
+    response = json_response({"error": str(e)}, status.HTTP_503_SERVICE_UNAVAILABLE)
+    response['Retry-After'] = '1'
+    return response
+
+
+@method_decorator(csrf_exempt, name='dispatch')
+class RegisterView(View):
+    """Async registration: the password is hashed on the bounded hashing pool"""
     
-    def post(self, request):
-        serializer = RegisterSerializer(data=request.data)
-        if serializer.is_valid():
-            serializer.save()
-            return Response({"message": "User registered successfully"}, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    async def post(self, request):
+        data = _request_data(request)
+        if data is None:
+            return json_response({"error": "Expected a JSON object"}, status.HTTP_400_BAD_REQUEST)
+        
+        serializer = RegisterSerializer(data=data)
+        # Validation checks username uniqueness in the database
+        if not await sync_to_async(serializer.is_valid)():
+            return json_response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        
+        # Same normalisation as UserManager.create_user, minus the inline hashing
+        validated_data = dict(serializer.validated_data)
+        password = validated_data.pop('password')
+        user = User(**validated_data)
+        user.username = User.normalize_username(user.username)
+        user.email = User.objects.normalize_email(user.email)
+        try:
+            user.password = await ahash_password(password, 'register')
+        except HashingPoolFull as e:
+            return _pool_full_response(e)
+        await user.asave()
+        # The request had no token to make it sticky, and a lagging replica doesn't know the user yet
+        await amark_sticky(user.id)
+        return json_response({"message": "User registered successfully"}, status.HTTP_201_CREATED)
     
-class LoginView(APIView):
-    permission_classes = []
+@method_decorator(csrf_exempt, name='dispatch')
+class LoginView(View):
+    """Async login: the password check runs on the bounded hashing pool"""
     
-    def post(self, request):
-        username = request.data.get('username')
-        password = request.data.get('password')
+    async def post(self, request):
+        data = _request_data(request)
+        if data is None:
+            return json_response({"error": "Expected a JSON object"}, status.HTTP_400_BAD_REQUEST)
+        username = data.get('username')
+        password = data.get('password')
+        if not isinstance(username, str) or not isinstance(password, str):
+            username = password = None
         
-        user = authenticate(username=username, password=password)
+        try:
+            user = None
+            if username is not None and password is not None:
+                user = await User.objects.filter(**{User.USERNAME_FIELD: username}).afirst()
+            if user is None:
+                # Hash anyway so unknown usernames take as long as wrong passwords
+                await ahash_password(password or '', 'login')
+            elif not await acheck_password(user, password, 'login') or not user.is_active:
+                user = None
+        except HashingPoolFull as e:
+            return _pool_full_response(e)
         
         if user:
+            await amark_sticky(user.id)
             refresh = RefreshToken.for_user(user)
-            return Response({
+            return json_response({
                 "message": "Login successful",
                 "access": str(refresh.access_token),  # Access token
                 "refresh": str(refresh),              # Refresh token
                 "user_id": user.id
-            }, status=status.HTTP_200_OK)
-        return Response({"error": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
+            }, status.HTTP_200_OK)
+        return json_response({"error": "Invalid credentials"}, status.HTTP_401_UNAUTHORIZED)
     
 class LogoutView(APIView):
     permission_classes = [IsAuthenticated]
 
     def post(self, request):
+        """Revoke the access token of this request and, if posted, its refresh token"""
+        refresh = request.data.get('refresh')
+        if refresh:
+            try:
+                refresh = RefreshToken(refresh)
+            except TokenError as e:
+                return Response({"refresh": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+            if refresh.get(api_settings.USER_ID_CLAIM) != getattr(request.user, api_settings.USER_ID_FIELD):
+                return Response({"refresh": "Token belongs to another user"}, status=status.HTTP_400_BAD_REQUEST)
+            revoke(refresh)
+        
+        revoke(request.auth)
         return Response({"message": "User logged out successfully"}, status=status.HTTP_200_OK)
     
 class UserProfileView(APIView):
@@ -55,10 +129,14 @@ class UserProfileView(APIView):
         data = request.data
         current_password = data.get('current_password')
         
-        # Verify current password
-        if not authenticate(username=user.username, password=current_password):
-            return Response({'current_password': 'Current password is incorrect'}, 
-                           status=status.HTTP_400_BAD_REQUEST)
+        # Verify current password on the hashing pool, so bursts stay bounded
+        try:
+            if current_password is None or not check_password(user, current_password, 'profile'):
+                return Response({'current_password': 'Current password is incorrect'}, 
+                               status=status.HTTP_400_BAD_REQUEST)
+        except HashingPoolFull as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={'Retry-After': '1'})
         
         # Update basic fields
         user.username = data.get('username', user.username)
@@ -71,7 +149,11 @@ class UserProfileView(APIView):
         # Update password if provided
         new_password = data.get('new_password')
         if new_password:
-            user.set_password(new_password)
+            try:
+                user.password = hash_password(new_password, 'profile')
+            except HashingPoolFull as e:
+                return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                                headers={'Retry-After': '1'})
         
         # Save changes
         try:
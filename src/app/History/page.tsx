@@ -1,6 +1,6 @@
 "use client";
 
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useCallback } from 'react';
 import TopNav from '../../components/TopNav';
 import Footer from '../../components/Footer';
 import { useAuth } from '../../context/AuthContext';
@@ -38,6 +38,8 @@ export default function PurchaseHistory() {
   const [checkingAuth, setCheckingAuth] = useState(true);
   const [error, setError] = useState<string | null>(null);
   const [expandedOrderId, setExpandedOrderId] = useState<number | null>(null);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loadingMore, setLoadingMore] = useState(false);
   const { isLoggedIn, getToken } = useAuth();
   const router = useRouter();
 
@@ -57,31 +59,40 @@ export default function PurchaseHistory() {
     checkAuthentication();
   }, [isLoggedIn, router]);
 
+  // Fetch one page of history; the server hands back a cursor for the next page
+  const fetchHistoryPage = useCallback(async (cursor: string | null) => {
+    const token = getToken();
+    if (!token) throw new Error('No authentication token found');
+
+    const url = cursor
+      ? `http://localhost:8000/orders/history/?cursor=${encodeURIComponent(cursor)}`
+      : 'http://localhost:8000/orders/history/';
+    const response = await fetch(url, {
+      headers: {
+        'Authorization': `Bearer ${token}`,
+        'Content-Type': 'application/json'
+      }
+    });
+
+    if (!response.ok) {
+      if (response.status === 401) {
+        throw new Error('Authentication expired. Please log in again.');
+      }
+      throw new Error('Failed to fetch order history');
+    }
+
+    return response.json() as Promise<{ results: OrderType[]; next_cursor: string | null }>;
+  }, [getToken]);
+
   useEffect(() => {
     if (checkingAuth) return;
     
     const fetchOrderHistory = async () => {
       setLoading(true);
       try {
-        const token = getToken();
-        if (!token) throw new Error('No authentication token found');
-        
-        const response = await fetch('http://localhost:8000/orders/history/', {
-          headers: {
-            'Authorization': `Bearer ${token}`,
-            'Content-Type': 'application/json'
-          }
-        });
-
-        if (!response.ok) {
-          if (response.status === 401) {
-            throw new Error('Authentication expired. Please log in again.');
-          }
-          throw new Error('Failed to fetch order history');
-        }
-
-        const data = await response.json();
-        setOrders(data);
+        const data = await fetchHistoryPage(null);
+        setOrders(data.results);
+        setNextCursor(data.next_cursor);
       } catch(err) {
         setError(err instanceof Error ? err.message : 'An error occurred');
         console.error('Error fetching order history:', err);
@@ -91,7 +102,22 @@ export default function PurchaseHistory() {
     };
 
     fetchOrderHistory();
-  }, [checkingAuth, getToken]);
+  }, [checkingAuth, fetchHistoryPage]);
+
+  const loadMoreOrders = async () => {
+    if (!nextCursor) return;
+    setLoadingMore(true);
+    try {
+      const data = await fetchHistoryPage(nextCursor);
+      setOrders(prevOrders => [...prevOrders, ...data.results]);
+      setNextCursor(data.next_cursor);
+    } catch(err) {
+      setError(err instanceof Error ? err.message : 'An error occurred');
+      console.error('Error fetching order history:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  };
 
   // Show loading during auth check
   if (checkingAuth) {
@@ -219,6 +245,17 @@ export default function PurchaseHistory() {
                 ))}
               </tbody>
             </table>
+            {nextCursor && (
+              <div className="text-center mt-6">
+                <button
+                  onClick={loadMoreOrders}
+                  disabled={loadingMore}
+                  className="bg-[#6C1814] text-white px-6 py-2 rounded hover:bg-[#d04e17] transition-colors"
+                >
+                  {loadingMore ? 'Loading...' : 'Load More Orders'}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </main>
@@ -6,6 +6,8 @@ import Card from './Card';
 type Product = {
   id: number;
   image_file: string;
+  image_url: string | null;
+  srcset: string | null;
   name: string;
   price: number;
 };
@@ -44,7 +46,8 @@ const BestSellerGrid = () => {
         <Card
           key={product.id}
           id={product.id}
-          image={`/images/${product.image_file}`}
+          image={product.image_url ?? `/images/${product.image_file}`}
+          srcSet={product.srcset}
           name={product.name}
           price={product.price.toString()}
           emoji="🌭"
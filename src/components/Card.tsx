@@ -5,12 +5,16 @@ import { useCart } from '../context/CartContext';
 interface CardProps {
   id: number | string;  
   image: string;
+  srcSet?: string | null;  // Responsive WebP variants from the API, when generated
   name: string;
   price: string;
   emoji?: string;  // Optional emoji for cart display
 }
 
-const Card: React.FC<CardProps> = ({ id, image, name, price, emoji = '🌭' }) => {
+// Card width in the BestSellerGrid columns, so the browser picks the smallest variant that fits
+const IMAGE_SIZES = '(min-width: 1024px) 33vw, (min-width: 768px) 50vw, 100vw';
+
+const Card: React.FC<CardProps> = ({ id, image, srcSet, name, price, emoji = '🌭' }) => {
   const { addItem } = useCart();
   const [isAdding, setIsAdding] = useState(false);
   
@@ -35,7 +39,13 @@ const Card: React.FC<CardProps> = ({ id, image, name, price, emoji = '🌭' }) =
 
   return (
     <div className="flex flex-col items-start bg-[#481401] rounded-3xl h-fit w-full shadow-lg transition-transform transform hover:scale-105">
-      <Image src={image} alt={name} layout="responsive" width={1} height={1} />
+      {srcSet ? (
+        // eslint-disable-next-line @next/next/no-img-element
+        <img src={image} srcSet={srcSet} sizes={IMAGE_SIZES} alt={name} loading="lazy"
+          className="w-full aspect-square object-cover" />
+      ) : (
+        <Image src={image} alt={name} layout="responsive" width={1} height={1} />
+      )}
       <div className="grid grid-cols-2 grid-rows-2 gap-2 w-full items-center justify-center p-4">
         <p className="col-span-1 row-span-1 md:truncate text-white" title={name}>{name}</p>
         <button 
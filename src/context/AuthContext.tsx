@@ -65,12 +65,14 @@ export function AuthProvider({ children }: { children: ReactNode }) {
     try {
       const token = localStorage.getItem('accessToken');
       if (token) {
+        // Revoke both tokens server-side
         await fetch("http://localhost:8000/users/logout/", {
           method: "POST",
           headers: {
             "Authorization": `Bearer ${token}`,
             "Content-Type": "application/json"
           },
+          body: JSON.stringify({ refresh: localStorage.getItem('refreshToken') }),
         });
       }
     } catch (error) {